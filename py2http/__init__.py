@@ -6,20 +6,41 @@ and provides the ability to generate OpenAPI specifications for the created HTTP
 services. Additionally, it includes middleware, plugins, and decorators to enhance 
 the functionality of the HTTP services."""
 
-from .middleware import mk_jwt_middleware, mk_superadmin_middleware
-from .bottle_plugins import JWTPlugin, ApiKeyAuthPlugin
-from .service import (
-    mk_app,
-    run_app,
-)
-from .decorators import (
-    Decorator,
-    DecoParam,
-    Decora,
-    replace_with_params,
-    ch_func_to_all_pk,
-    mk_flat,
-    mk_handlers,
-    add_attrs,
-)
-from .openapi_utils import func_to_openapi_spec
+from importlib import import_module
+
+# The objects exported here are imported (with their module) when first used, so that
+# importing a module of the package (say, py2http.openapi_utils) doesn't import them
+# all, along with their dependencies.
+_module_of_attr = {
+    'mk_jwt_middleware': 'middleware',
+    'mk_rate_limit_middleware': 'middleware',
+    'mk_superadmin_middleware': 'middleware',
+    'JWTPlugin': 'bottle_plugins',
+    'ApiKeyAuthPlugin': 'bottle_plugins',
+    'AuthPlugin': 'bottle_plugins',
+    'RateLimitPlugin': 'bottle_plugins',
+    'mk_app': 'service',
+    'run_app': 'service',
+    'Decorator': 'decorators',
+    'DecoParam': 'decorators',
+    'Decora': 'decorators',
+    'replace_with_params': 'decorators',
+    'ch_func_to_all_pk': 'decorators',
+    'mk_flat': 'decorators',
+    'mk_handlers': 'decorators',
+    'add_attrs': 'decorators',
+    'func_to_openapi_spec': 'openapi_utils',
+}
+__all__ = list(_module_of_attr)
+
+
+def __getattr__(name):
+    module_name = _module_of_attr.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = globals()[name] = getattr(import_module(f'.{module_name}', __name__), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_module_of_attr))
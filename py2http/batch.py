@@ -0,0 +1,196 @@
+"""A batch endpoint, to make many function calls in one HTTP request.
+
+Clients that need many small calls pay a round trip (and an authentication check,
+etc.) for each of them. With ``mk_app(funcs, publish_batch=True)``, the app also has a
+``/batch`` route taking a list of calls:
+
+    [{"method_name": "foo", "inputs": {"x": 1}}, {"method_name": "bar", "inputs": {}}]
+
+and returning their results, in the same order:
+
+    [{"status": 200, "result": 2}, {"status": 400, "error": "..."}]
+
+Each call goes through the same pipeline (plugins, input mapper, function, output
+mapper, error handler, concurrency limit...) as a request to the route of its function
+would, with a request that has the headers of the batch request: the guards of the
+plugins of a route (authentication, rate limits...) can't be bypassed by calling it in
+a batch. (The batch request itself also goes through the plugins of its route.)"""
+
+from base64 import b64encode
+from io import BytesIO
+import json
+from os import getpid
+
+from bottle import request, response
+from i2.errors import InputError
+
+from py2http.concurrency import ManagedExecutor
+from py2http.constants import JSON_CONTENT_TYPE, NDJSON_CONTENT_TYPE
+
+BATCH_METHOD_NAME = 'batch'
+
+
+def _sub_call_environ(environ, path, inputs):
+    """The WSGI environ of a call of a batch, made from the one of the batch request"""
+    body = json.dumps(inputs).encode()
+    sub_environ = {
+        k: v
+        for k, v in environ.items()
+        # drop what bottle cached about the batch request, and the attributes plugins
+        # set on it (like request.token): the plugins of the call set its own
+        if not k.startswith('bottle.request.')
+    }
+    sub_environ.update(
+        {
+            'PATH_INFO': path,
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': JSON_CONTENT_TYPE,
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_ACCEPT': JSON_CONTENT_TYPE,
+            'wsgi.input': BytesIO(body),
+            # so that the inputs are not parsed again by request.json
+            'bottle.request.json': inputs,
+        }
+    )
+    return sub_environ
+
+
+def _call_result(status, content_type, body):
+    if isinstance(body, dict):  # error handlers return dicts
+        result = body
+    elif content_type.startswith(NDJSON_CONTENT_TYPE):
+        result = [json.loads(line) for line in body]
+    else:
+        if not isinstance(body, (str, bytes)):  # other iterables: streamed chunks
+            body = b''.join(c if isinstance(c, bytes) else c.encode() for c in body)
+        if content_type.startswith(JSON_CONTENT_TYPE) or not content_type:
+            result = json.loads(body) if body else None
+        elif isinstance(body, bytes):
+            return {
+                'status': status,
+                'content_type': content_type,
+                'result': b64encode(body).decode(),
+                'encoding': 'base64',
+            }
+        else:
+            result = body
+    if status >= 400:
+        error = result.get('error') if isinstance(result, dict) else result
+        return {'status': status, 'error': error}
+    return {'status': status, 'result': result}
+
+
+def _run_call(bottle_route, environ):
+    # request and response are thread-local: this runs in a worker thread, so binding
+    # them to the call doesn't affect the batch request
+    request.bind(environ)
+    response.bind()
+    try:
+        body = bottle_route.call()  # (the callback, with the plugins of the route)
+    except Exception as error:  # routes handle their errors: this shouldn't happen
+        return {'status': 500, 'error': str(error)}
+    return _call_result(response.status_code, response.content_type or '', body)
+
+
+def mk_batch_route(bottle_routes, error_handler, *, max_calls=100, max_workers=1):
+    """Make the (bottle) route serving batches of calls to ``bottle_routes``.
+
+    :param bottle_routes: The bottle routes (``bottle.Route``) of the functions that
+        can be called, by method name
+    :param error_handler: The error handler for invalid batches
+    :param max_calls: The maximum number of calls in a batch
+    :param max_workers: How many calls of a batch can run in parallel (in a thread pool)
+    """
+    # A pool of its own (not shared with the executors of routes, that the calls may
+    # use, so they can't wait for themselves), made on first use (in each worker)
+    executors = {}
+
+    def error(message, status=400):
+        return {'status': status, 'error': message}
+
+    def handle_batch(*args):
+        try:
+            calls = request.json
+        except ValueError:  # bottle's error for invalid JSON
+            calls = None
+        if isinstance(calls, dict):
+            calls = calls.get('calls')
+        if not isinstance(calls, list):
+            return error_handler(InputError('A batch must be a list of calls'))
+        if len(calls) > max_calls:
+            return error_handler(
+                InputError(f'A batch can have at most {max_calls} calls')
+            )
+
+        executor = executors.get(getpid())
+        if executor is None:
+            executor = executors[getpid()] = ManagedExecutor('thread', max_workers)
+        results = [None] * len(calls)
+        futures = {}
+        for i, call in enumerate(calls):
+            if not isinstance(call, dict) or 'method_name' not in call:
+                results[i] = error('A call must be a {"method_name", "inputs"} object')
+                continue
+            route = bottle_routes.get(call['method_name'])
+            if route is None:
+                results[i] = error(f'No such method: {call["method_name"]}', 404)
+                continue
+            inputs = call.get('inputs', {})
+            if not isinstance(inputs, dict):
+                results[i] = error('The inputs of a call must be an object')
+                continue
+            environ = _sub_call_environ(request.environ, route.rule, inputs)
+            futures[i] = executor.submit(_run_call, route, environ)
+        for i, future in futures.items():
+            results[i] = future.result()
+        response.content_type = JSON_CONTENT_TYPE
+        return json.dumps(results)
+
+    handle_batch.method_name = BATCH_METHOD_NAME
+    return handle_batch
+
+
+def mk_batch_openapi_path(batch_url, method_names):
+    """The OpenAPI path of the batch route"""
+    call_schema = {
+        'type': 'object',
+        'properties': {
+            'method_name': {'type': 'string', 'enum': list(method_names)},
+            'inputs': {'type': 'object'},
+        },
+        'required': ['method_name'],
+    }
+    result_schema = {
+        'type': 'object',
+        'properties': {
+            'status': {'type': 'integer'},
+            'result': {},
+            'error': {'type': 'string'},
+        },
+    }
+    return {
+        batch_url: {
+            'post': {
+                'x-method_name': BATCH_METHOD_NAME,
+                'description': 'Make several calls in one request',
+                'requestBody': {
+                    'required': True,
+                    'content': {
+                        JSON_CONTENT_TYPE: {
+                            'schema': {'type': 'array', 'items': call_schema}
+                        }
+                    },
+                },
+                'responses': {
+                    '200': {
+                        'description': 'The results of the calls, in order',
+                        'content': {
+                            JSON_CONTENT_TYPE: {
+                                'schema': {'type': 'array', 'items': result_schema}
+                            }
+                        },
+                    }
+                },
+            }
+        }
+    }
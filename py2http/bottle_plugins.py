@@ -1,13 +1,22 @@
-"""Plugins for adding middleware functionality to Bottle apps.
-"""
+"""Plugins for adding middleware functionality to Bottle apps."""
 
 from bottle import request, response, abort
 from functools import wraps
+from inspect import isawaitable, iscoroutinefunction, signature
 import json
-import jwt
+from math import ceil
 from typing import Iterable
 from warnings import warn
+from py2http.batch import BATCH_METHOD_NAME
+from py2http.concurrency import run_in_worker_loop
 from py2http.constants import JSON_CONTENT_TYPE
+from py2http.middleware import (
+    DFLT_JWT_CACHE_SIZE,
+    DFLT_JWT_CACHE_TTL,
+    mk_jwt_decoder,
+    too_many_requests_body,
+)
+from py2http.rate_limiting import RateLimiter, client_ip
 
 OPTIONS = 'OPTIONS'
 
@@ -26,6 +35,8 @@ class JWTPlugin:
         mapper: dict = None,
         ignore_methods: Iterable[str] = None,
         algorithms: Iterable[str] = None,
+        cache_size: int = DFLT_JWT_CACHE_SIZE,
+        cache_ttl: float = DFLT_JWT_CACHE_TTL,
     ):
         """Creates a new JWTPlugin instance.
 
@@ -34,36 +45,39 @@ class JWTPlugin:
         and reject unverified requests.
         :param mapper: (Optional) A dict that specifies how to map JWT claim value names in the output.
         :param ignore_methods: (Optional) A list of method names for the plugin to ignore.
+        :param cache_size: (Optional) How many verified tokens to keep the claims of, so
+        that their signatures are not verified again on each request (0 to disable).
+        :param cache_ttl: (Optional) How long (in seconds, at most) to keep the claims of
+        a verified token for. They are never kept past the expiry of the token.
         """
         self._secret = secret
         self._verify = verify
         self._mapper = mapper if mapper else {}
-        self._ignore_methods = ignore_methods if ignore_methods else []
+        self._ignore_methods = frozenset(ignore_methods or ())
         self._algorithms = algorithms if algorithms else ['HS256']
+        import jwt  # (imported here: only apps using JWTs need it)
 
-    def __call__(self, handler):
-        if self._ignore_methods and handler.method_name in self._ignore_methods:
-            return handler
+        self._decode_error = jwt.DecodeError
+        self._decode = mk_jwt_decoder(
+            secret,
+            verify,
+            self._algorithms,
+            self._mapper,
+            cache_size=cache_size,
+            cache_ttl=cache_ttl,
+        )
+
+    def mk_guard(self, method_name=None):
+        if method_name in self._ignore_methods:
+            return None
 
-        @wraps(handler)
-        def wrapped_handler(*args, **kwargs):
+        def guard():
             if request.method == OPTIONS:
-                return handler(*args, *kwargs)
-            auth_header = request.headers.get('Authorization', '')
-            token = auth_header[7:]
+                return None
+            token = request.get_header('Authorization', '')[7:]
             try:
-                decoded = jwt.decode(
-                    token,
-                    self._secret,
-                    options={'verify_signature': self._verify},
-                    algorithms=self._algorithms,
-                )
-                for k, v in self._mapper.items():
-                    if k in decoded:
-                        decoded[v] = decoded.pop(k)
-                request.token = decoded
-                return handler(*args, **kwargs)
-            except jwt.DecodeError as error:
+                request.token = self._decode(token)
+            except self._decode_error as error:
                 if self._verify:
                     response.status = 401
                     response.content_type = JSON_CONTENT_TYPE
@@ -73,43 +87,310 @@ class JWTPlugin:
                         }
                     )
                 warn(f'Invalid JWT: {token}')
-                return handler(*args, **kwargs)
+            return None
 
-        return wrapped_handler
+        return guard
+
+    def __call__(self, handler):
+        return guarded(handler, self.mk_guard(getattr(handler, 'method_name', None)))
 
 
 class ApiKeyAuthPlugin:
     def __init__(self, api_key: str):
         self._api_key = api_key
 
-    def __call__(self, handler):
-        def wrapped_handler(*args, **kwargs):
-            auth_header = request.headers.get('Authorization', '')
-            if auth_header == self._api_key:
-                return handler(*args, **kwargs)
+    def mk_guard(self, method_name=None):
+        def guard():
+            if request.get_header('Authorization', '') == self._api_key:
+                return None
             response.status = 401
             response.content_type = JSON_CONTENT_TYPE
             return json.dumps({'error': 'invalid API key'})
 
-        return wrapped_handler
+        return guard
+
+    def __call__(self, handler):
+        return guarded(handler, self.mk_guard(getattr(handler, 'method_name', None)))
+
+
+class AuthPlugin:
+    """A plugin authorizing requests with a ``check(request)`` function, returning what
+    to set as ``request.identity`` (the user, the claims of the token...), or None to
+    reject the request with a ``401 Unauthorized`` response.
+
+    The check can be async (say, looking a token up in a store, or introspecting it,
+    with an async client), in which case it's run in the event loop of the worker (see
+    `py2http.concurrency.run_in_worker_loop`), like the async mappers and functions of
+    the app, so that it can share their clients.
+
+    >>> async def check(request):
+    ...     return {'user': 'bob'} if request.get_header('Authorization') else None
+    >>> plugin = AuthPlugin(check, ignore_methods=['ping'])
+    """
+
+    def __init__(self, check, *, ignore_methods: Iterable[str] = ()):
+        self._check = check
+        self._ignore_methods = frozenset(ignore_methods)
+
+    def _reject(self):
+        response.status = 401
+        response.content_type = JSON_CONTENT_TYPE
+        return json.dumps({'error': 'Unauthorized'})
+
+    def mk_guard(self, method_name=None):
+        if method_name in self._ignore_methods:
+            return None
+        check = self._check
+        if iscoroutinefunction(check):
+
+            async def guard():
+                if request.method == OPTIONS:
+                    return None
+                request.identity = await check(request)
+                return self._reject() if request.identity is None else None
+
+        else:
+
+            def guard():
+                if request.method == OPTIONS:
+                    return None
+                request.identity = check(request)
+                return self._reject() if request.identity is None else None
+
+        return guard
+
+    def __call__(self, handler):
+        return guarded(handler, self.mk_guard(getattr(handler, 'method_name', None)))
+
+
+class RateLimitPlugin:
+    """A plugin rejecting the requests of clients exceeding their rate limit, with a
+    ``429 Too Many Requests`` response. See `py2http.rate_limiting.RateLimiter` for
+    the arguments.
+
+    If the client key is a JWT claim (``key=jwt_claim('sub')``), the plugin must come
+    after the JWTPlugin in the list of plugins.
+
+    The calls of a batch (see ``publish_batch``) are charged one by one, like requests
+    to their routes, and the batch request itself isn't (unless ``route_rates`` has a
+    ``'batch'`` rate): a batch of n calls costs n requests.
+    """
+
+    def __init__(
+        self,
+        rate,
+        burst: float = None,
+        *,
+        key=client_ip,
+        store=None,
+        per_route: bool = True,
+        route_rates: dict = None,
+        ignore_methods: Iterable[str] = (),
+    ):
+        # (the calls of a batch go through the guards of their routes: charging the
+        # batch request too would charge them twice)
+        if BATCH_METHOD_NAME not in (route_rates or {}):
+            ignore_methods = (*ignore_methods, BATCH_METHOD_NAME)
+        self.limiter = RateLimiter(
+            rate,
+            burst,
+            key=key,
+            store=store,
+            per_route=per_route,
+            route_rates=route_rates,
+            ignore_methods=ignore_methods,
+        )
+
+    def mk_guard(self, method_name=None, rule=None):
+        check = self.limiter.mk_check(method_name, rule)
+        if check is None:
+            return None
+
+        def guard():
+            wait = check(request)
+            if not wait:
+                return None
+            response.status = 429
+            response.set_header('Retry-After', str(ceil(wait)))
+            response.content_type = JSON_CONTENT_TYPE
+            return too_many_requests_body
+
+        return guard
+
+    def __call__(self, handler):
+        return guarded(handler, self.mk_guard(getattr(handler, 'method_name', None)))
+
+
+DFLT_CORS_ALLOWED_METHODS = ('GET', 'POST', 'PUT', 'DELETE', 'OPTIONS')
+DFLT_CORS_ALLOWED_HEADERS = (
+    'Origin',
+    'Accept',
+    'Content-Type',
+    'X-Requested-With',
+    'Authorization',
+    'X-api-key',
+)
 
 
 # from https://stackoverflow.com/questions/17262170/bottle-py-enabling-cors-for-jquery-ajax-requests
-# TODO: accept lists of headers and methods as init args
 class CorsPlugin:
-    def __init__(self, origins: str = '*'):
+    def __init__(
+        self,
+        origins: str = '*',
+        allowed_methods: Iterable[str] = DFLT_CORS_ALLOWED_METHODS,
+        allowed_headers: Iterable[str] = DFLT_CORS_ALLOWED_HEADERS,
+    ):
         self._origins = origins
+        # the headers are the same for all responses: made once
+        self._headers = (
+            ('Access-Control-Allow-Origin', origins),
+            ('Access-Control-Allow-Methods', ', '.join(allowed_methods)),
+            ('Access-Control-Allow-Headers', ', '.join(allowed_headers)),
+        )
+
+    def mk_guard(self, method_name=None):
+        headers = self._headers
+
+        def guard():
+            for name, value in headers:
+                response.set_header(name, value)
+            if request.method == OPTIONS:
+                return ''  # preflight requests: the headers are the response
+            return None
+
+        return guard
 
     def __call__(self, handler):
-        def wrapped_handler(*args, **kwargs):
-            response.headers['Access-Control-Allow-Origin'] = self._origins
-            response.headers[
-                'Access-Control-Allow-Methods'
-            ] = 'GET, POST, PUT, DELETE, OPTIONS'
-            response.headers[
-                'Access-Control-Allow-Headers'
-            ] = 'Origin, Accept, Content-Type, X-Requested-With, Authorization, X-api-key'
-            if request.method != OPTIONS:
-                return handler(*args, **kwargs)
-
-        return wrapped_handler
+        return guarded(handler, self.mk_guard(getattr(handler, 'method_name', None)))
+
+
+def guarded(handler, *guards):
+    """Wrap ``handler`` so that ``guards`` are called (in order, without arguments)
+    before it. A guard returning something other than None ends the request, with
+    what it returned as the response body (without calling the next guards and the
+    handler). Guards that are None are ignored.
+
+    >>> def handler():
+    ...     return 'handled'
+    >>> guarded(handler, None) is handler
+    True
+    >>> guarded(handler, lambda: None)()
+    'handled'
+    >>> guarded(handler, lambda: 'denied', lambda: 1 / 0)()
+    'denied'
+    """
+    guards = tuple(g for g in guards if g is not None)
+    if not guards:
+        return handler
+    if any(map(iscoroutinefunction, guards)):
+        return _async_guarded(handler, guards)
+
+    @wraps(handler)
+    def guarded_handler(*args, **kwargs):
+        for guard in guards:
+            body = guard()
+            if body is not None:
+                return body
+        return handler(*args, **kwargs)
+
+    return guarded_handler
+
+
+def _async_guarded(handler, guards):
+    """``guarded``, for guards some of which are async: all of them are then called in
+    the event loop of the worker, and the handler after them.
+
+    >>> import asyncio
+    >>> async def slow_guard():
+    ...     await asyncio.sleep(0)
+    >>> _async_guarded(lambda: 'handled', [slow_guard, lambda: None])()
+    'handled'
+    >>> _async_guarded(lambda: 'handled', [slow_guard, lambda: 'denied'])()
+    'denied'
+    """
+
+    async def run_guards():
+        for guard in guards:
+            body = guard()
+            if isawaitable(body):
+                body = await body
+            if body is not None:
+                return body
+        return None
+
+    @wraps(handler)
+    def guarded_handler(*args, **kwargs):
+        body = run_in_worker_loop(run_guards())
+        if body is not None:
+            return body
+        return handler(*args, **kwargs)
+
+    return guarded_handler
+
+
+def _skips(route, plugin):
+    skiplist = route.skiplist
+    name = getattr(plugin, 'name', None)
+    return (
+        True in skiplist
+        or plugin in skiplist
+        or type(plugin) in skiplist
+        or (name is not None and name in skiplist)
+    )
+
+
+def _mk_guard(plugin, method_name, rule):
+    if 'rule' in signature(plugin.mk_guard).parameters:
+        return plugin.mk_guard(method_name, rule=rule)
+    return plugin.mk_guard(method_name)
+
+
+class PluginChain:
+    """A bottle plugin applying several plugins with a single wrapper per route.
+
+    Each plugin installed in a bottle app wraps every route in a layer of its own, so
+    each request goes through as many closures, which, for the small requests of
+    services, is significant overhead. Plugins that have a ``mk_guard(method_name)``
+    method (like those of this module), returning what to do before calling the
+    handler of a route (see ``guarded``), or None if they don't apply to it, are fused
+    here into a single wrapper per route (their ``mk_guard`` is also given the ``rule``
+    of the route, if it takes a ``rule`` argument). Which plugins apply to which route (the
+    ``skip`` lists of routes, the methods plugins ignore...) is decided once, when the
+    route is made. Other plugins (plain decorators or bottle plugins) are applied
+    normally, in their place of the chain.
+
+        app.install(PluginChain([CorsPlugin(), JWTPlugin(public_key), my_plugin]))
+    """
+
+    name = 'py2http_plugin_chain'
+    api = 2
+
+    def __init__(self, plugins: Iterable = ()):
+        self.plugins = list(plugins)
+
+    def setup(self, app):
+        for plugin in self.plugins:
+            if hasattr(plugin, 'setup'):
+                plugin.setup(app)
+
+    def apply(self, callback, route):
+        method_name = route.name or getattr(route.callback, 'method_name', None)
+        guards = []  # the guards of the plugins not applied yet, in order
+        for plugin in reversed(self.plugins):  # the first plugin is the outermost
+            if _skips(route, plugin):
+                continue
+            if hasattr(plugin, 'mk_guard'):
+                guards.insert(0, _mk_guard(plugin, method_name, route.rule))
+                continue
+            callback = guarded(callback, *guards)
+            guards = []
+            if hasattr(plugin, 'apply'):
+                callback = plugin.apply(callback, route)
+            else:
+                callback = plugin(callback)
+        return guarded(callback, *guards)
+
+    def close(self):
+        for plugin in self.plugins:
+            if hasattr(plugin, 'close'):
+                plugin.close()
@@ -0,0 +1,180 @@
+"""A cache of what building an app computes from its functions (their schemas, and the
+OpenAPI spec), so that (re)starting workers of an unchanged app doesn't recompute it.
+
+With ``mk_app(funcs, build_cache_dir='some/dir')``, the OpenAPI spec of the app is
+saved in ``some/dir``, under a key that is a hash of everything it depends on: the
+code, defaults, annotations and signatures of the functions (and of the mappers,
+and other callables of the configuration), the configuration values, the version of
+py2http's own code, and the types it was given the schemas of. Types (like the models
+of the annotations) are hashed by structure: the types of their fields (recursively),
+their defaults, and the members of enums. Apps built with the same key load the spec
+instead of introspecting the functions and making their schemas.
+
+The routes themselves (closures over the functions) are always made: they can't be
+serialized, and making them is cheap.
+"""
+
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from functools import partial
+import hashlib
+from inspect import signature
+import json
+import marshal
+import os
+from types import BuiltinFunctionType, FunctionType, MethodType
+from typing import Iterable, Optional, get_args, get_origin, get_type_hints
+
+from py2http.schema_tools import COMPLEX_TYPE_MAPPING, COMPLEX_TYPE_MAPPING_BY_NAME
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+_primitive_types = (str, bytes, int, float, bool, complex, type(None))
+
+
+def _package_version() -> str:
+    """The modification times of the modules of py2http (whose code makes the specs)"""
+    return repr(
+        sorted(
+            (entry.name, entry.stat().st_mtime_ns)
+            for entry in os.scandir(_package_dir)
+            if entry.name.endswith('.py')
+        )
+    )
+
+
+def _feed_type_structure(h, cls, seen):
+    """Update the hash ``h`` with what the schema of ``cls`` is made of: its members
+    (enums), the types of its fields (recursively), and their defaults"""
+    if issubclass(cls, Enum):
+        _feed(h, [(member.name, member.value) for member in cls], seen)
+        return
+    try:
+        hints = get_type_hints(cls)
+    except Exception:  # (say, unresolvable forward references)
+        hints = dict(getattr(cls, '__annotations__', None) or {})
+    _feed(h, hints, seen)
+    if is_dataclass(cls):
+        defaults = [(f.name, f.default, f.default_factory) for f in fields(cls)]
+    else:
+        defaults = {name: cls.__dict__[name] for name in hints if name in cls.__dict__}
+    _feed(h, defaults, seen)
+    for attr in ('_field_defaults', '__required_keys__', 'model_fields'):
+        # (of NamedTuples, TypedDicts, and pydantic models)
+        _feed(h, getattr(cls, attr, None), seen)
+
+
+def _feed(h, obj, seen):
+    """Update the hash ``h`` with what ``obj`` is made of (in a way that doesn't depend
+    on the process: no ids, addresses...)"""
+    if isinstance(obj, _primitive_types):
+        h.update(f'{type(obj).__name__}:{obj!r};'.encode())
+        return
+    if id(obj) in seen:  # (recursive structures, objects used in several places)
+        h.update(f'<seen {seen[id(obj)][0]}>;'.encode())
+        return
+    # (keeping a reference to obj, so that its id isn't reused by another object)
+    seen[id(obj)] = (len(seen), obj)
+    if isinstance(obj, dict):
+        h.update(b'dict{')
+        for k, v in sorted(obj.items(), key=lambda kv: repr(kv[0])):
+            _feed(h, k, seen)
+            _feed(h, v, seen)
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(f'{type(obj).__name__}['.encode())
+        for item in obj:
+            _feed(h, item, seen)
+        h.update(b']')
+    elif isinstance(obj, (set, frozenset)):
+        h.update(b'set[')
+        for item in sorted(obj, key=repr):
+            _feed(h, item, seen)
+        h.update(b']')
+    elif get_origin(obj) is not None:  # (List[Order], Optional[int], dict[str, X]...)
+        _feed(h, ('generic', get_origin(obj), get_args(obj)), seen)
+    elif isinstance(obj, type):
+        h.update(f'type:{obj.__module__}.{obj.__qualname__};'.encode())
+        if obj.__module__ != 'builtins':
+            _feed_type_structure(h, obj, seen)
+    elif isinstance(obj, FunctionType):
+        h.update(f'func:{obj.__module__}.{obj.__qualname__};'.encode())
+        h.update(marshal.dumps(obj.__code__))
+        for attr in (obj.__defaults__, obj.__kwdefaults__, obj.__annotations__):
+            _feed(h, attr, seen)
+        for cell in obj.__closure__ or ():
+            try:
+                _feed(h, cell.cell_contents, seen)
+            except ValueError:  # empty cell
+                pass
+        _feed(h, obj.__dict__, seen)  # (response_schema, __signature__...)
+    elif isinstance(obj, MethodType):
+        _feed(h, obj.__func__, seen)
+        _feed(h, type(obj.__self__), seen)
+    elif isinstance(obj, partial):
+        _feed(h, (obj.func, obj.args, obj.keywords), seen)
+    elif isinstance(obj, BuiltinFunctionType):
+        h.update(
+            f'builtin:{getattr(obj, "__module__", "")}.{obj.__qualname__};'.encode()
+        )
+    else:
+        cls = type(obj)
+        h.update(f'obj:{cls.__module__}.{cls.__qualname__};'.encode())
+        obj_repr = repr(obj)
+        if ' at 0x' not in obj_repr:  # (default reprs aren't the same across processes)
+            h.update(obj_repr.encode())
+        if callable(obj):
+            try:
+                h.update(str(signature(obj)).encode())
+            except (TypeError, ValueError):
+                pass
+            _feed(h, getattr(obj, '__dict__', None), seen)
+
+
+def build_key(funcs: Iterable, configs: dict) -> str:
+    """The key, in the build cache, of an app made of ``funcs`` with ``configs``.
+
+    >>> def foo(x: int = 1): ...
+    >>> key = build_key([foo], {'publish_openapi': True})
+    >>> key == build_key([foo], {'publish_openapi': True})
+    True
+    >>> def foo(x: int = 2): ...
+    >>> key == build_key([foo], {'publish_openapi': True})
+    False
+    """
+    h = hashlib.sha256(_package_version().encode())
+    seen = {}
+    _feed(h, (COMPLEX_TYPE_MAPPING, COMPLEX_TYPE_MAPPING_BY_NAME), seen)
+    for func in funcs:
+        _feed(h, func, seen)
+        h.update(b'|')
+    _feed(h, configs, seen)
+    return h.hexdigest()
+
+
+class BuildCache:
+    """The OpenAPI specs of built apps, saved as JSON files in ``dirpath``"""
+
+    def __init__(self, dirpath: str):
+        self.dirpath = dirpath
+
+    def _filepath(self, key):
+        return os.path.join(self.dirpath, f'{key}.openapi.json')
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._filepath(key)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):  # missing (or, say, truncated) file
+            return None
+
+    def set(self, key: str, openapi_spec: dict):
+        try:
+            data = json.dumps(openapi_spec)
+        except TypeError:  # a spec with non-JSON values (it can't be cached)
+            return
+        os.makedirs(self.dirpath, exist_ok=True)
+        filepath = self._filepath(key)
+        tmp_filepath = f'{filepath}.{os.getpid()}.tmp'
+        with open(tmp_filepath, 'w') as fp:
+            fp.write(data)
+        os.replace(tmp_filepath, filepath)  # atomic: workers never read partial files
@@ -0,0 +1,215 @@
+"""Coalescing identical requests: sharing one execution of a function among the
+concurrent requests that would compute the same thing.
+
+With ``mk_app(funcs, coalesce={'report': True})`` (or a ``coalesce = True`` attribute on
+the function), the requests to ``report`` that arrive while a request with the same
+inputs is being computed don't run the function again: they wait for that execution,
+and all get its result (or its error). Those results are also kept a few seconds
+(``coalesce_ttl``) for the requests (like retries) that come right after. This shields
+backends from the thundering herds of identical requests (a dashboard refreshed by
+many clients at once, a cache that expires...), without the semantics (and staleness)
+of a cache: errors are never kept, and results only briefly.
+
+Requests are the same if they have the same inputs (compared through a hash of their
+canonical JSON, or pickle, serialization). Requests whose inputs can't be serialized
+are never coalesced. The ``Idempotency-Key`` header of requests is ignored: retries of
+a request (with its key) have its inputs, so are coalesced anyway, a same key can't
+make requests with other inputs share a result (it wouldn't be theirs), and clients
+giving each request its own key would otherwise never be coalesced.
+
+Results are shared by all the clients making the same request: functions whose result
+depends on who the client is (and not only on their inputs) must not be coalesced.
+
+Executions are only shared by the requests of a same worker process.
+"""
+
+import asyncio
+from concurrent.futures import CancelledError, Future
+from functools import partial
+from hashlib import sha256
+from inspect import isawaitable
+import json
+import pickle
+from threading import Lock
+from typing import Optional
+
+from py2http.util import TTLCache
+
+DFLT_COALESCE_TTL = 5
+DFLT_MAX_COALESCED_RESULTS = 1024
+
+_MISSING = object()
+
+
+def inputs_key(args, kwargs) -> Optional[str]:
+    """A key of the inputs of a call, the same for equal inputs (if they can be
+    serialized, else ``None``)
+
+    >>> inputs_key((), {'x': 1, 'y': [2]}) == inputs_key((), {'y': [2], 'x': 1})
+    True
+    >>> inputs_key((), {'x': 1}) == inputs_key((), {'x': 2})
+    False
+    >>> print(inputs_key((), {'x': lambda: 1}))
+    None
+    """
+    try:
+        data = json.dumps([args, kwargs], sort_keys=True, separators=(',', ':'))
+        data = data.encode()
+    except (TypeError, ValueError):
+        try:
+            data = pickle.dumps((args, sorted(kwargs.items())))
+        except Exception:
+            return None
+    return sha256(data).hexdigest()
+
+
+class Coalescer:
+    """Shares the execution of calls with the same key: the calls made while one is in
+    flight get its outcome, and those made within ``ttl`` seconds after it succeeded
+    get its result (of which at most ``max_results`` are kept).
+
+    >>> coalescer = Coalescer()
+    >>> coalescer.call('key', lambda: print('computing') or 42)
+    computing
+    42
+    >>> coalescer.call('key', lambda: print('computing') or 42)  # (a recent result)
+    42
+    """
+
+    def __init__(
+        self,
+        ttl: float = DFLT_COALESCE_TTL,
+        max_results: int = DFLT_MAX_COALESCED_RESULTS,
+    ):
+        # key -> the futures of the calls waiting for the execution in flight (only
+        # those get a future, so that executions that aren't shared cost little)
+        self._in_flight = {}
+        self._results = TTLCache(max_results, ttl)
+        self._lock = Lock()
+
+    def _join(self, key):
+        """Return ``(True, result)`` if there's a recent result, ``(False, future)`` if
+        there's an execution in flight, else ``(False, None)``, the execution being
+        the caller's to lead (and `_finish`). To be called with the lock."""
+        result = self._results.get(key, _MISSING)
+        if result is not _MISSING:
+            return True, result
+        waiters = self._in_flight.get(key)
+        if waiters is None:
+            self._in_flight[key] = []
+            return False, None
+        future = Future()
+        future.set_running_or_notify_cancel()
+        waiters.append(future)
+        return False, future
+
+    def _finish(self, key, result=None, error=None):
+        with self._lock:
+            waiters = self._in_flight.pop(key)
+            if error is None:
+                self._results.set(key, result)
+        for future in waiters:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def call(self, key, compute, *, wait=Future.result):
+        """Return ``compute()``, or the outcome of the execution shared with the call of
+        the same ``key`` in flight (waited for with ``wait(future)``).
+
+        If ``compute()`` returns an awaitable, so does ``call``."""
+        with self._lock:
+            done, shared = self._join(key)
+        if done:
+            return shared
+        if shared is not None:
+            return wait(shared)
+        try:
+            result = compute()
+        except BaseException as error:
+            self._finish(key, error=error)
+            raise
+        if isawaitable(result):
+            return self._lead_async(key, result)
+        self._finish(key, result)
+        return result
+
+    async def _lead_async(self, key, awaitable):
+        try:
+            result = await awaitable
+        except BaseException as error:
+            self._finish(key, error=error)
+            raise
+        self._finish(key, result)
+        return result
+
+    def submit(self, key, submit) -> Future:
+        """Return a future of the outcome of the execution of ``key`` in flight, or, if
+        there's none, that which ``submit()`` returns."""
+        with self._lock:
+            done, shared = self._join(key)
+        if done:
+            shared, result = Future(), shared
+            shared.set_result(result)
+        if shared is not None:
+            return shared
+        try:
+            future = submit()
+        except BaseException as error:
+            self._finish(key, error=error)
+            raise
+        future.add_done_callback(partial(self._finish_with, key))
+        return future
+
+    def _finish_with(self, key, future: Future):
+        if future.cancelled():
+            self._finish(key, error=CancelledError())
+        elif future.exception() is not None:
+            self._finish(key, error=future.exception())
+        else:
+            self._finish(key, future.result())
+
+
+def _await_future(future: Future):
+    return asyncio.wrap_future(future)
+
+
+def mk_coalescing_caller(
+    call_func,
+    *,
+    is_async: bool = False,
+    ttl: float = DFLT_COALESCE_TTL,
+    max_results: int = DFLT_MAX_COALESCED_RESULTS,
+    key_of=inputs_key,
+):
+    """Make a ``call(args, kwargs)`` function (with the ``submit`` method of
+    ``call_func``, if it has one) sharing the executions of ``call_func(args, kwargs)``
+    among the calls with the same key (see `Coalescer`).
+
+    :param is_async: Whether ``call_func`` returns awaitables (then so does ``call``,
+        without blocking the event loop waiting for a shared execution)
+    :param key_of: The function giving the key of a call, from its ``args`` and
+        ``kwargs`` (calls with a ``None`` key are not coalesced)
+    """
+    coalescer = Coalescer(ttl, max_results)
+    wait = _await_future if is_async else Future.result
+
+    def call(args, kwargs):
+        key = key_of(args, kwargs)
+        if key is None:
+            return call_func(args, kwargs)
+        return coalescer.call(key, lambda: call_func(args, kwargs), wait=wait)
+
+    if hasattr(call_func, 'submit'):
+
+        def submit(args, kwargs):
+            key = key_of(args, kwargs)
+            if key is None:
+                return call_func.submit(args, kwargs)
+            return coalescer.submit(key, lambda: call_func.submit(args, kwargs))
+
+        call.submit = submit
+
+    call.coalescer = coalescer
+    return call
@@ -0,0 +1,443 @@
+"""Conversion of JSON values to (and from) the types of the annotations of functions.
+
+Request payloads are JSON, so datetimes, UUIDs, Decimals, enums, arrays... arrive as
+strings, numbers and lists. Instead of having each function convert its inputs itself,
+`mk_input_decoder` compiles, once per function, a decoder that converts the
+(JSON-decoded) inputs of a request to the types of the function's annotations, and
+`encode_value` converts the outputs back to JSON values (it's used by the default JSON
+encoder of responses).
+
+The conversions of types are registered in `type_codecs`, which mirrors the schemas of
+`py2http.schema_tools.COMPLEX_TYPE_MAPPING` (use `register_type` to add both)."""
+
+from collections import abc
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from enum import Enum
+from functools import lru_cache
+from inspect import Parameter, signature
+import sys
+from typing import (
+    Any,
+    Callable,
+    Literal,
+    NamedTuple,
+    Union,
+    _TypedDictMeta,
+    get_args,
+    get_origin,
+)
+from uuid import UUID
+
+from i2.errors import InputError
+
+from py2http.schema_tools import (
+    COMPLEX_TYPE_MAPPING,
+    clear_schema_caches,
+    is_model,
+    model_fields,
+    type_hints,
+)
+
+
+class TypeCodec(NamedTuple):
+    """How to convert a type from (``decode(json_value, type_)``) and to
+    (``encode(obj)``) JSON values"""
+
+    decode: Callable
+    encode: Callable
+
+
+def _from_isoformat(value, type_):
+    return type_.fromisoformat(value)
+
+
+def _isoformat(obj):
+    return obj.isoformat()
+
+
+def _decode_decimal(value, type_):
+    # str, so that floats are converted to their (short) repr, not their binary value
+    return type_(str(value))
+
+
+def _decode_ndarray(value, type_):
+    return sys.modules['numpy'].asarray(value)
+
+
+def _numpy_item(obj):
+    return obj.item()
+
+
+type_codecs = {
+    datetime: TypeCodec(_from_isoformat, _isoformat),
+    date: TypeCodec(_from_isoformat, _isoformat),
+    time: TypeCodec(_from_isoformat, _isoformat),
+    UUID: TypeCodec(lambda value, type_: type_(value), str),
+    Decimal: TypeCodec(_decode_decimal, str),
+    Enum: TypeCodec(lambda value, type_: type_(value), lambda obj: obj.value),
+}
+# Same, for types of optional dependencies, keyed by (module, qualname)
+type_codecs_by_name = {
+    ('numpy', 'ndarray'): TypeCodec(_decode_ndarray, lambda obj: obj.tolist()),
+    ('numpy', 'generic'): TypeCodec(lambda value, type_: type_(value), _numpy_item),
+}
+
+
+def register_type(type_, decode, encode, schema):
+    """Register how to convert ``type_`` from and to JSON values, and its schema.
+
+    >>> from fractions import Fraction
+    >>> register_type(
+    ...     Fraction,
+    ...     decode=lambda value, type_: type_(value),
+    ...     encode=str,
+    ...     schema={'type': 'string', 'format': 'fraction'},
+    ... )
+    >>> decode_value('1/3', Fraction)
+    Fraction(1, 3)
+    >>> encode_value(Fraction(1, 3))
+    '1/3'
+    """
+    type_codecs[type_] = TypeCodec(decode, encode)
+    COMPLEX_TYPE_MAPPING[type_] = schema
+    codec_for.cache_clear()
+    clear_schema_caches()
+
+
+@lru_cache(maxsize=None)
+def codec_for(type_):
+    """The `TypeCodec` of ``type_`` (or of its closest registered base), or None.
+
+    Dataclasses and NamedTuples get a codec converting them from and to JSON objects,
+    whose field converters are compiled (once) on first use.
+    """
+    codec = type_codecs.get(type_)
+    if codec is None and is_model(type_):
+        return _mk_model_codec(type_)
+    for cls in getattr(type_, '__mro__', ()):
+        codec = type_codecs.get(cls) or type_codecs_by_name.get(
+            (cls.__module__, cls.__qualname__)
+        )
+        if codec is not None:
+            return codec
+    return None
+
+
+def _mk_model_codec(model):
+    fields_ = model_fields(model)
+    compiled = {}
+
+    def compile_fields():
+        # Done on first use, so that recursive models find their (cached) own codec
+        compiled['decoders'] = [
+            (name, decoder)
+            for name, (type_, _) in fields_.items()
+            if (decoder := mk_decoder(type_)) is not None
+        ]
+        compiled['encoders'] = [
+            (name, mk_encoder(type_) or _identity)
+            for name, (type_, _) in fields_.items()
+        ]
+
+    def decode(value, type_):
+        if 'decoders' not in compiled:
+            compile_fields()
+        if isinstance(value, (list, tuple)):
+            value = dict(zip(fields_, value))
+        value = dict(value)
+        for name, decoder in compiled['decoders']:
+            if name in value:
+                value[name] = decoder(value[name])
+        return type_(**value)
+
+    def encode(obj):
+        if 'encoders' not in compiled:
+            compile_fields()
+        return {
+            name: encoder(getattr(obj, name)) for name, encoder in compiled['encoders']
+        }
+
+    return TypeCodec(decode, encode)
+
+
+def encode_value(obj):
+    """Convert ``obj`` to a JSON value, if its type has a codec (else return it as is).
+
+    >>> encode_value(datetime(2020, 1, 2, 3, 4, 5))
+    '2020-01-02T03:04:05'
+    >>> encode_value(Decimal('1.10'))
+    '1.10'
+    """
+    codec = codec_for(type(obj))
+    if codec is None:
+        return obj
+    return codec.encode(obj)
+
+
+def decode_value(value, type_):
+    """Convert the JSON value ``value`` to ``type_``.
+
+    >>> decode_value('2020-01-02', date)
+    datetime.date(2020, 1, 2)
+    >>> decode_value([{'when': '2020-01-02'}], list[dict[str, date]])
+    [{'when': datetime.date(2020, 1, 2)}]
+    """
+    decoder = mk_decoder(type_)
+    return value if decoder is None else decoder(value)
+
+
+_no_conversion_types = (Any, Parameter.empty, str, int, float, bool, list, dict)
+_list_origins = {list, abc.Iterable, abc.Sequence, abc.Collection, abc.MutableSequence}
+_set_origins = {set, frozenset, abc.Set, abc.MutableSet}
+_dict_origins = {dict, abc.Mapping, abc.MutableMapping}
+_decoding_errors = (ValueError, TypeError, KeyError, InvalidOperation)
+
+
+def mk_decoder(type_) -> Union[Callable, None]:
+    """Make a function converting JSON values to ``type_``, or return None if JSON
+    values of ``type_`` don't need any conversion (so callers can skip them entirely).
+
+    >>> from typing import Iterable, Literal, Optional
+    >>> mk_decoder(int) is None
+    True
+    >>> mk_decoder(Iterable[str]) is None
+    True
+    >>> decode = mk_decoder(Optional[Iterable[UUID]])
+    >>> decode(['12345678-1234-5678-1234-567812345678'])
+    [UUID('12345678-1234-5678-1234-567812345678')]
+    >>> decode(None) is None
+    True
+    >>> mk_decoder(Union[date, str])('2020-01-02'), mk_decoder(Union[date, str])('now')
+    (datetime.date(2020, 1, 2), 'now')
+    >>> mk_decoder(Literal['asc', 'desc'])('up')
+    Traceback (most recent call last):
+      ...
+    ValueError: 'up' is not one of ('asc', 'desc')
+    """
+    if type_ in _no_conversion_types:
+        return None
+    codec = codec_for(type_)
+    if codec is not None:
+        decode = codec.decode
+
+        def decode_type(value):
+            if value is None or isinstance(value, type_):
+                return value
+            return decode(value, type_)
+
+        return decode_type
+    if isinstance(type_, _TypedDictMeta):
+        return _mk_fields_decoder(type_hints(type_))
+
+    origin, args = get_origin(type_), get_args(type_)
+    if origin is Union:
+        return _mk_union_decoder(args)
+    if origin is Literal:
+        return _mk_literal_checker(args)
+    if origin in _list_origins or origin in _set_origins:
+        decode = mk_decoder(args[0]) if args else None
+        if decode is None and origin not in _set_origins:
+            return None
+        container = list if origin in _list_origins else origin
+        if container in (abc.Set, abc.MutableSet):
+            container = set
+        if decode is None:
+            return container
+        return lambda value: container(map(decode, value))
+    if origin is tuple:
+        if len(args) == 2 and args[1] is Ellipsis:
+            decode = mk_decoder(args[0])
+            if decode is None:
+                return tuple
+            return lambda value: tuple(map(decode, value))
+        decoders = [mk_decoder(arg) or _identity for arg in args]
+        return lambda value: tuple(d(v) for d, v in zip(decoders, value))
+    if origin in _dict_origins:
+        decode = mk_decoder(args[1]) if len(args) == 2 else None
+        if decode is None:
+            return None
+        return lambda value: {k: decode(v) for k, v in value.items()}
+    return None
+
+
+def _identity(value):
+    return value
+
+
+def _mk_fields_decoder(types: dict):
+    decoders = {k: d for k, t in types.items() if (d := mk_decoder(t)) is not None}
+    if not decoders:
+        return None
+
+    def decode_fields(value: dict):
+        value = dict(value)
+        for key, decode in decoders.items():
+            if key in value:
+                value[key] = decode(value[key])
+        return value
+
+    return decode_fields
+
+
+def _is_json_instance(value, type_):
+    cls = get_origin(type_) or type_
+    return isinstance(cls, type) and isinstance(value, cls)
+
+
+def _mk_union_decoder(args):
+    nullable = type(None) in args
+    args = [arg for arg in args if arg is not type(None)]
+    decoders = [mk_decoder(arg) for arg in args]
+    if not any(decoders):
+        return None
+    if len(args) == 1:
+        decode = decoders[0]
+        return lambda value: None if value is None else decode(value)
+
+    def decode_union(value):
+        if value is None and nullable:
+            return None
+        for arg, decode in zip(args, decoders):  # the first type that fits wins
+            if decode is None:
+                if _is_json_instance(value, arg):
+                    return value
+                continue
+            try:
+                return decode(value)
+            except _decoding_errors:
+                continue
+        raise ValueError(f'{value!r} is not a {Union[tuple(args)]}')
+
+    return decode_union
+
+
+def _mk_literal_checker(values):
+    def check_literal(value):
+        if value not in values:
+            raise ValueError(f'{value!r} is not one of {values}')
+        return value
+
+    return check_literal
+
+
+def mk_encoder(type_) -> Union[Callable, None]:
+    """Make a function converting objects of ``type_`` to JSON values, or return None
+    if they don't need any conversion.
+
+    >>> from dataclasses import dataclass
+    >>> @dataclass
+    ... class Event:
+    ...     name: str
+    ...     when: datetime
+    >>> encode = mk_encoder(list[Event])
+    >>> encode([Event('launch', datetime(2020, 1, 2))])
+    [{'name': 'launch', 'when': '2020-01-02T00:00:00'}]
+    >>> mk_encoder(dict[str, list[int]]) is None
+    True
+    """
+    if type_ in _no_conversion_types:
+        return None
+    codec = codec_for(type_)
+    if codec is not None:
+        encode = codec.encode
+        return lambda obj: None if obj is None else encode(obj)
+    if isinstance(type_, _TypedDictMeta):
+        return _mk_fields_encoder(type_hints(type_))
+
+    origin, args = get_origin(type_), get_args(type_)
+    if origin is Union:
+        encoders = [mk_encoder(arg) for arg in args if arg is not type(None)]
+        if not any(encoders):
+            return None
+        if len(encoders) == 1:
+            encode = encoders[0]
+            return lambda obj: None if obj is None else encode(obj)
+        return encode_value  # which type it is is only known at runtime
+    if origin in _list_origins or origin in _set_origins or origin is tuple:
+        if origin is tuple and not (len(args) == 2 and args[1] is Ellipsis):
+            encoders = [mk_encoder(arg) or _identity for arg in args]
+            if all(encoder is _identity for encoder in encoders):
+                return None
+            return lambda obj: [e(v) for e, v in zip(encoders, obj)]
+        encode = mk_encoder(args[0]) if args else None
+        if encode is None:
+            return None if origin in _list_origins or origin is tuple else list
+        return lambda obj: [encode(x) for x in obj]
+    if origin in _dict_origins:
+        encode = mk_encoder(args[1]) if len(args) == 2 else None
+        if encode is None:
+            return None
+        return lambda obj: {k: encode(v) for k, v in obj.items()}
+    return None
+
+
+def _mk_fields_encoder(types: dict):
+    encoders = {k: e for k, t in types.items() if (e := mk_encoder(t)) is not None}
+    if not encoders:
+        return None
+
+    def encode_fields(obj: dict):
+        obj = dict(obj)
+        for key, encode in encoders.items():
+            if key in obj:
+                obj[key] = encode(obj[key])
+        return obj
+
+    return encode_fields
+
+
+def mk_output_encoder(func) -> Union[Callable, None]:
+    """Make a function converting the outputs of ``func`` to JSON values, according
+    to its return annotation, or return None if they don't need any conversion.
+
+    >>> from typing import NamedTuple
+    >>> class Point(NamedTuple):
+    ...     x: float
+    ...     y: float
+    >>> def origin() -> Point:
+    ...     return Point(0.0, 0.0)
+    >>> mk_output_encoder(origin)(origin())
+    {'x': 0.0, 'y': 0.0}
+    """
+    return mk_encoder(type_hints(func).get('return', Any))
+
+
+def mk_input_decoder(func) -> Union[Callable, None]:
+    """Make a ``decode_inputs(inputs: dict) -> dict`` function converting the values
+    of the JSON inputs of ``func`` to the types of its annotations. Returns None if
+    no input needs converting. Conversion failures raise an ``InputError``.
+
+    >>> def since(start: datetime, n_days: int = 1, *, tz: Enum = None):
+    ...     ...
+    >>> decode_inputs = mk_input_decoder(since)
+    >>> decode_inputs({'start': '2020-01-02T03:04:05', 'n_days': 2})
+    {'start': datetime.datetime(2020, 1, 2, 3, 4, 5), 'n_days': 2}
+    >>> decode_inputs({'start': 'yesterday'})
+    Traceback (most recent call last):
+      ...
+    i2.errors.InputError: Invalid parameter "start": Invalid isoformat string: 'yesterday'
+    >>> mk_input_decoder(lambda x, y: x + y) is None
+    True
+    """
+    hints = type_hints(func)
+    types = {
+        name: hints.get(name, param.annotation)
+        for name, param in signature(func).parameters.items()
+        if param.kind not in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD)
+    }
+    decoders = {k: d for k, t in types.items() if (d := mk_decoder(t)) is not None}
+    if not decoders:
+        return None
+
+    def decode_inputs(inputs: dict) -> dict:
+        inputs = dict(inputs)
+        for name, decode in decoders.items():
+            if name in inputs:
+                try:
+                    inputs[name] = decode(inputs[name])
+                except _decoding_errors as error:
+                    raise InputError(f'Invalid parameter "{name}": {error}')
+        return inputs
+
+    return decode_inputs
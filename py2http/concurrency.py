@@ -0,0 +1,340 @@
+"""Tools to control how requests are executed concurrently by a py2http service.
+
+The `ConcurrencyLimiter` bounds the number of requests a route can run at once (in a
+given worker process). Requests exceeding that bound wait for a (short) while, then
+are rejected with an `OverloadedError`, which the default error handlers turn into a
+``503 Service Unavailable`` response with a ``Retry-After`` header. Shedding excess
+load this way keeps a slow endpoint from exhausting all the workers of a service, and
+keeps the latency of the requests that are accepted bounded.
+
+The executors (see `mk_func_executor`) are used to offload the execution of functions
+to thread or process pools.
+
+The async functions, mappers and plugins of (sync) Bottle apps are run in the event
+loop of their worker (see `run_in_worker_loop`), made once, and reused by all the
+requests it serves."""
+
+import asyncio
+import atexit
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from os import getpid
+import pickle
+from threading import BoundedSemaphore, Lock, local
+from typing import Optional
+
+
+class OverloadedError(Exception):
+    """Raised when a request is rejected because its route is at full capacity.
+
+    :param retry_after: Number of seconds the client should wait before retrying
+    """
+
+    def __init__(self, message='Service overloaded', retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Bounds the number of concurrent executions of something (typically, a route).
+
+    :param max_concurrency: Maximum number of concurrent executions
+    :param queue_timeout_ms: How long (in milliseconds) an execution waits for a slot
+        before being rejected. With 0, executions are rejected as soon as all slots
+        are taken.
+    :param retry_after: The ``retry_after`` (seconds) of the raised `OverloadedError`
+    :param name: A name to use in error messages
+
+    >>> limiter = ConcurrencyLimiter(max_concurrency=1, name='foo')
+    >>> with limiter:
+    ...     limiter.stats()
+    ...     with limiter:  # no slot left
+    ...         pass
+    Traceback (most recent call last):
+      ...
+    py2http.concurrency.OverloadedError: foo is at full capacity (1 concurrent requests)
+    >>> limiter.stats()
+    {'max_concurrency': 1, 'in_flight': 0, 'waiting': 0, 'max_waiting': 0, 'accepted': 1, 'rejected': 1}
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        queue_timeout_ms: Optional[float] = 0,
+        retry_after: int = 1,
+        name='route',
+    ):
+        if max_concurrency <= 0:
+            raise ValueError(f'max_concurrency must be positive. Was: {max_concurrency}')
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = (queue_timeout_ms or 0) / 1000
+        self.retry_after = retry_after
+        self.name = name
+        self._semaphore = BoundedSemaphore(max_concurrency)
+        self._lock = Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def acquire(self, blocking=True) -> bool:
+        """Try to get an execution slot, waiting at most ``queue_timeout`` seconds
+        (not at all if ``blocking`` is False). Returns True if a slot was obtained."""
+        # fast path: no waiting, no queue accounting
+        acquired = self._semaphore.acquire(blocking=False)
+        if not acquired and blocking and self.queue_timeout > 0:
+            with self._lock:
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        with self._lock:
+            if acquired:
+                self.in_flight += 1
+                self.accepted += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def overloaded_error(self):
+        return OverloadedError(
+            f'{self.name} is at full capacity '
+            f'({self.max_concurrency} concurrent requests)',
+            retry_after=self.retry_after,
+        )
+
+    def stats(self) -> dict:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+        }
+
+    def __enter__(self):
+        if not self.acquire():
+            raise self.overloaded_error()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+# Executors ####################################################################
+# Functions can be executed "inline" (in the thread serving the request), or offloaded
+# to a thread or process pool. The latter lets CPU-bound functions use all the cores
+# of the machine without tying up the request-serving workers (or event loop).
+
+INLINE, THREAD, PROCESS = 'inline', 'thread', 'process'
+executor_kinds = (INLINE, THREAD, PROCESS)
+
+
+def _noop():
+    return None
+
+
+class ManagedExecutor:
+    """A thread or process pool executor with an (optional) bound on the number of
+    tasks in flight (running or queued).
+
+    :param kind: ``'thread'`` or ``'process'``
+    :param max_workers: Number of workers of the pool (defaults to the number of CPUs)
+    :param max_in_flight: If given, ``submit`` waits for a task to finish when there
+        are already that many tasks in flight
+
+    >>> executor = ManagedExecutor('thread', max_workers=2, max_in_flight=4)
+    >>> executor.run(pow, 2, 10)
+    1024
+    >>> executor.shutdown()
+
+    Functions run in a process pool (and their arguments and outputs) must be
+    picklable: Typically module-level functions.
+
+    >>> from operator import mul
+    >>> executor = ManagedExecutor('process', max_workers=2).warm()
+    >>> executor.run(mul, 6, 7)
+    42
+    >>> executor.shutdown()
+    """
+
+    def __init__(
+        self, kind, max_workers: Optional[int] = None, max_in_flight=None,
+    ):
+        if kind == THREAD:
+            self._executor = ThreadPoolExecutor(max_workers)
+        elif kind == PROCESS:
+            self._executor = ProcessPoolExecutor(max_workers)
+        else:
+            raise ValueError(f'Unknown executor kind: {kind}')
+        self.kind = kind
+        self.max_workers = self._executor._max_workers
+        self.max_in_flight = max_in_flight
+        self._in_flight = (
+            BoundedSemaphore(max_in_flight) if max_in_flight is not None else None
+        )
+
+    def submit(self, func, /, *args, **kwargs) -> Future:
+        """Submit ``func(*args, **kwargs)`` for execution, waiting for a slot if the
+        executor already has ``max_in_flight`` tasks in flight"""
+        return self._submit(func, args, kwargs, blocking=True)
+
+    def try_submit(self, func, /, *args, **kwargs) -> Future:
+        """Like ``submit``, but raises an `OverloadedError` instead of waiting for a
+        slot (for callers that mustn't block, like event loops)"""
+        return self._submit(func, args, kwargs, blocking=False)
+
+    def _submit(self, func, args, kwargs, blocking):
+        if self._in_flight is None:
+            return self._executor.submit(func, *args, **kwargs)
+        if not self._in_flight.acquire(blocking=blocking):
+            raise OverloadedError(
+                f'The {self.kind} executor has {self.max_in_flight} tasks in flight'
+            )
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: self._in_flight.release())
+        return future
+
+    def run(self, func, /, *args, **kwargs):
+        """Execute ``func(*args, **kwargs)`` in the pool, and wait for its result"""
+        return self.submit(func, *args, **kwargs).result()
+
+    def warm(self):
+        """Start all the workers of the pool now, instead of on first use"""
+        futures = [self._executor.submit(_noop) for _ in range(self.max_workers)]
+        for future in futures:
+            future.result()
+        return self
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_executors = {}
+_executors_lock = Lock()
+
+
+def get_executor(
+    kind, max_workers: Optional[int] = None, max_in_flight=None, warm=False
+) -> ManagedExecutor:
+    """Get the (shared) executor of a given kind and size, making it if needed.
+
+    Executors are made lazily, in the process that uses them, so that they're not
+    inherited (broken) by forked server workers.
+
+    >>> executor = get_executor('thread', max_workers=2)
+    >>> executor is get_executor('thread', max_workers=2)
+    True
+    >>> executor is get_executor('thread', max_workers=3)
+    False
+    """
+    key = (getpid(), kind, max_workers, max_in_flight)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            executor = _executors[key] = ManagedExecutor(
+                kind, max_workers, max_in_flight
+            )
+            if warm:
+                executor.warm()
+    return executor
+
+
+@atexit.register
+def shutdown_executors(wait=True):
+    """Shut down all the executors made (by this process) with ``get_executor``"""
+    pid = getpid()
+    with _executors_lock:
+        for key in [k for k in _executors if k[0] == pid]:
+            _executors.pop(key).shutdown(wait=wait)
+
+
+def mk_func_executor(
+    func, kind=INLINE, max_workers=None, max_in_flight=None, warm=False
+):
+    """Make a ``call(args, kwargs)`` function that executes ``func`` with the given
+    kind of executor.
+
+    >>> call = mk_func_executor(pow, 'thread')
+    >>> call((2, 3), {})
+    8
+    >>> mk_func_executor(lambda x: x, 'process')
+    Traceback (most recent call last):
+      ...
+    ValueError: <lambda> can't be executed in a process pool: it's not picklable
+    """
+    if kind not in executor_kinds:
+        raise ValueError(f'executor must be one of {executor_kinds}. Was: {kind}')
+    if kind == INLINE:
+
+        def call(args, kwargs):
+            return func(*args, **kwargs)
+
+        return call
+
+    if kind == PROCESS:
+        try:
+            pickle.dumps(func)
+        except Exception:
+            raise ValueError(
+                f"{getattr(func, '__name__', func)} can't be executed in a process "
+                "pool: it's not picklable"
+            )
+
+    def call(args, kwargs):
+        executor = get_executor(kind, max_workers, max_in_flight, warm)
+        return executor.run(func, *args, **kwargs)
+
+    def submit(args, kwargs):
+        executor = get_executor(kind, max_workers, max_in_flight, warm)
+        return executor.try_submit(func, *args, **kwargs)
+
+    call.submit = submit
+    return call
+
+
+_worker = local()
+
+
+def worker_loop() -> asyncio.AbstractEventLoop:
+    """The event loop of the current worker (thread, of the current process), made the
+    first time it's needed.
+
+    >>> worker_loop() is worker_loop()
+    True
+    """
+    loop = getattr(_worker, 'loop', None)
+    if loop is None or loop.is_closed() or _worker.pid != getpid():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        _worker.loop, _worker.pid = loop, getpid()
+    return loop
+
+
+def run_in_worker_loop(awaitable):
+    """Run ``awaitable`` (in the event loop of the worker), and return its result.
+
+    Unlike with an event loop per call (``asyncio.run``), what async code keeps between
+    calls (clients, connection pools, caches...), which is bound to the loop it was
+    made in, can be reused.
+
+    >>> async def double(x):
+    ...     await asyncio.sleep(0)
+    ...     return x * 2
+    >>> run_in_worker_loop(double(21))
+    42
+    """
+    return worker_loop().run_until_complete(awaitable)
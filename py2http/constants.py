@@ -4,3 +4,9 @@ BINARY_CONTENT_TYPE = 'application/octet-stream'
 FORM_CONTENT_TYPE = 'multipart/form-data'
 RAW_CONTENT_TYPE = 'text/plain'
 HTML_CONTENT_TYPE = 'text/html'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+CBOR_CONTENT_TYPE = 'application/cbor'
+NPY_CONTENT_TYPE = 'application/x-npy'
+SSE_CONTENT_TYPE = 'text/event-stream'
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
@@ -13,8 +13,7 @@ import pickle
 from typing import Iterable, Callable, Union, Mapping
 from functools import lru_cache, partial, wraps, update_wrapper
 from json import JSONEncoder, dumps
-from aiohttp import web
-from bottle import response
+from bottle import request, response
 
 # import collections
 from typing import Awaitable, get_origin
@@ -30,6 +29,7 @@ from i2.signatures import (
 )
 from i2.errors import ModuleNotFoundIgnore
 
+from py2http.coercion import codec_for
 from py2http.schema_tools import mk_input_schema_from_func, validate_input
 from py2http.config import AIOHTTP, BOTTLE
 from py2http.constants import (
@@ -38,7 +38,12 @@ from py2http.constants import (
     FORM_CONTENT_TYPE,
     RAW_CONTENT_TYPE,
     HTML_CONTENT_TYPE,
+    NDJSON_CONTENT_TYPE,
+    MSGPACK_CONTENT_TYPE,
+    CBOR_CONTENT_TYPE,
 )
+from py2http.serialization import cbor_dumps, cbor_loads, msgpack_dumps, msgpack_loads
+from py2http.streaming import EventStream
 
 
 def ensure_awaitable_return_annot(func):
@@ -997,27 +1002,107 @@ def route(route_name):
     return add_attrs(route=route_name)
 
 
-def _validate_and_invoke_mapper(func, inputs):
+def inputs_by_ref(func):
+    """Mark a mapper as taking the inputs of the request by reference, as a single
+    mapping (``func(inputs)`` for the functions decorated by ``handle_json_req`` and
+    co, ``output_mapper(output, inputs)`` for output mappers), instead of as keyword
+    arguments. The inputs are then not unpacked, and so copied, each time a mapper is
+    called. Mappers taking them by reference must not modify them (it's also the
+    mapping the function is called with).
+
+    >>> @send_json_resp
+    ... @inputs_by_ref
+    ... def output_mapper(output, inputs):
+    ...     return {'output': output, 'x': inputs['x']}
+    >>> output_mapper.inputs_by_ref
+    True
+    >>> output_mapper(2, {'x': 1})
+    '{"output": 2, "x": 1}'
+
+    The output mappers made from them can still be called with the inputs as keyword
+    arguments:
+
+    >>> output_mapper(2, x=1)
+    '{"output": 2, "x": 1}'
+    """
+    func.inputs_by_ref = True
+    return func
+
+
+def _mk_output_mapper(func, respond):
+    """Make an output mapper returning ``respond(func(output, ...))``, taking the inputs
+    like ``func`` does (by reference, or as keyword arguments), and async if ``func``
+    is, so that the same functions can be used in sync and async apps"""
+    if getattr(func, 'inputs_by_ref', False):
+        # (the inputs can also be given as keyword arguments, as to other mappers)
+        if iscoroutinefunction(func):
+
+            async def output_mapper(output, inputs=None, /, **kwargs):
+                return respond(await func(output, kwargs if inputs is None else inputs))
+
+        else:
+
+            def output_mapper(output, inputs=None, /, **kwargs):
+                return respond(func(output, kwargs if inputs is None else inputs))
+
+        return inputs_by_ref(output_mapper)
+    if iscoroutinefunction(func):
+
+        async def output_mapper(output, **inputs):
+            return respond(await func(output, **inputs))
+
+    else:
+
+        def output_mapper(output, **inputs):
+            return respond(func(output, **inputs))
+
+    return output_mapper
+
+
+def _validate_and_invoke_mapper(func, inputs, by_ref=False):
     request_schema = getattr(func, 'request_schema', None)
     if request_schema:
         validate_input(inputs, request_schema)
-    return func(**inputs)
+    return func(inputs) if by_ref else func(**inputs)
 
 
-def _handle_req(func, content_type):
-    func.request_schema = mk_input_schema_from_func(func)
+def _handle_req(func, content_type, *alt_content_types):
+    """Make an input mapper for requests of ``content_type``, or (if given) of one of
+    the ``alt_content_types``."""
+    by_ref = getattr(func, 'inputs_by_ref', False)
+    if by_ref:  # (the signature of func isn't that of the inputs)
+        func.request_schema = getattr(func, 'request_schema', None)
+    else:
+        func.request_schema = mk_input_schema_from_func(func)
     func.content_type = content_type
+    content_types = (content_type,) + alt_content_types
+    if alt_content_types:
+        func.content_types = content_types
 
-    # TODO: make this work with Bottle
-    @wraps(func)
-    def input_mapper(req):
-        if content_type not in req.content_type:
-            raise RuntimeError(
+    def read_inputs(req):
+        req_content_type = next(
+            (ct for ct in content_types if ct in (req.content_type or '')), None
+        )
+        if req_content_type is None:
+            from py2http.negotiation import UnsupportedMediaTypeError
+
+            raise UnsupportedMediaTypeError(
                 f"The incoming request's content is of type \
-{req.content_type}, when {content_type} is expected."
+{req.content_type}, when {' or '.join(content_types)} is expected."
             )
-        inputs = _get_inputs_from_request(req, content_type)
-        return _validate_and_invoke_mapper(func, inputs)
+        return _get_inputs_from_request(req, req_content_type)
+
+    if iscoroutinefunction(func):  # (so that apps know they have async mappers)
+
+        @wraps(func)
+        async def input_mapper(req):
+            return await _validate_and_invoke_mapper(func, read_inputs(req), by_ref)
+
+    else:
+
+        @wraps(func)
+        def input_mapper(req):
+            return _validate_and_invoke_mapper(func, read_inputs(req), by_ref)
 
     return input_mapper
 
@@ -1034,6 +1119,17 @@ def handle_form_req(func):
     return _handle_req(func, FORM_CONTENT_TYPE)
 
 
+def handle_msgpack_req(func):
+    """Input mapper decorator for MessagePack requests (JSON requests are accepted too,
+    so that a same route can serve both)"""
+    return _handle_req(func, MSGPACK_CONTENT_TYPE, JSON_CONTENT_TYPE)
+
+
+def handle_cbor_req(func):
+    """Input mapper decorator for CBOR requests (JSON requests are accepted too)"""
+    return _handle_req(func, CBOR_CONTENT_TYPE, JSON_CONTENT_TYPE)
+
+
 def handle_raw_req(func):
     return _handle_req(func, RAW_CONTENT_TYPE)
 
@@ -1049,6 +1145,9 @@ def base_output_mapper(output, **inputs):
 #   Fourthly, if we do have such specific package-dependent stuffs, we need to condition on existence
 class JsonRespEncoder(JSONEncoder):
     def default(self, o):
+        codec = codec_for(type(o))
+        if codec is not None:  # datetime, UUID, Decimal, Enum, numpy arrays...
+            return codec.encode(o)
         with ModuleNotFoundIgnore():  # added this to condition bson existence
             from bson import ObjectId  # added this to condition bson existence
 
@@ -1090,47 +1189,110 @@ class ProposalJsonRespEncoder(JSONEncoder):
         return JSONEncoder.default(self, o)
 
 
+class JsonLines:
+    """Wraps an iterable to indicate that it should be streamed to the client as
+    newline-delimited JSON (one JSON document per item), instead of being serialized
+    as a whole. This keeps the memory used by the server bounded, whatever the number
+    of items.
+
+    >>> list(JsonLines(iter([1, 'two', {'three': 3}])).lines())
+    ['1\\n', '"two"\\n', '{"three": 3}\\n']
+    """
+
+    def __init__(self, iterable: Iterable):
+        self.iterable = iterable
+
+    def lines(self):
+        encode = JsonRespEncoder().encode
+        for item in self.iterable:
+            yield encode(item) + '\n'
+
+
 def send_json_resp(func):
     framework = os.getenv('PY2HTTP_FRAMEWORK', BOTTLE)
     if framework == AIOHTTP:
+        from aiohttp import web
 
-        async def output_mapper(output, **input_kwargs):
-            mapped_output = func(output, **input_kwargs)
-            if isawaitable(mapped_output):
-                mapped_output = await mapped_output
+        def respond(mapped_output):
             return web.json_response(mapped_output, dumps=JsonRespEncoder().encode)
 
     else:
 
-        def output_mapper(output, **input_kwargs):
+        def respond(mapped_output):
+            if isinstance(mapped_output, JsonLines):
+                response.content_type = NDJSON_CONTENT_TYPE
+                return mapped_output.lines()
+            if isinstance(mapped_output, EventStream):
+                return mapped_output.respond()
             response.content_type = JSON_CONTENT_TYPE
-            mapped_output = func(output, **input_kwargs)
             return dumps(mapped_output, cls=JsonRespEncoder)
 
+    output_mapper = _mk_output_mapper(func, respond)
     output_mapper.content_type = JSON_CONTENT_TYPE
     return output_mapper
 
 
 def send_binary_resp(func):
-    def output_mapper(output, **input_kwargs):
+    def respond(mapped_output):
         response.content_type = BINARY_CONTENT_TYPE
-        mapped_output = func(output, **input_kwargs)
         return pickle.dumps(mapped_output)
 
+    output_mapper = _mk_output_mapper(func, respond)
     output_mapper.content_type = BINARY_CONTENT_TYPE
     output_mapper.response_schema = {'type': 'binary'}
     return output_mapper
 
 
 def send_raw_resp(func):
-    def output_mapper(output, **input_kwargs):
+    def respond(mapped_output):
         response.content_type = RAW_CONTENT_TYPE
-        return func(output, **input_kwargs)
+        return mapped_output
 
+    output_mapper = _mk_output_mapper(func, respond)
     output_mapper.content_type = RAW_CONTENT_TYPE
     return output_mapper
 
 
+def _send_structured_resp(func, content_type, serialize):
+    """Make an output mapper serializing outputs to ``content_type``, unless the
+    ``Accept`` header of the request prefers JSON"""
+    from py2http.negotiation import Negotiator, NotAcceptableError  # (import cycle)
+
+    negotiator = Negotiator([content_type, JSON_CONTENT_TYPE])
+
+    def respond(mapped_output):
+        if isinstance(mapped_output, EventStream):
+            return mapped_output.respond()
+        try:
+            response_content_type = negotiator.response_content_type(
+                request.get_header('Accept')
+            )
+        except NotAcceptableError:  # (clients accepting neither get content_type)
+            response_content_type = content_type
+        if response_content_type == JSON_CONTENT_TYPE:
+            response.content_type = JSON_CONTENT_TYPE
+            return dumps(mapped_output, cls=JsonRespEncoder)
+        response.content_type = content_type
+        return serialize(mapped_output)
+
+    output_mapper = _mk_output_mapper(func, respond)
+    output_mapper.content_type = content_type
+    output_mapper.content_types = (content_type, JSON_CONTENT_TYPE)
+    return output_mapper
+
+
+def send_msgpack_resp(func):
+    """Output mapper decorator for MessagePack responses (or JSON ones, for clients
+    that only accept JSON)"""
+    return _send_structured_resp(func, MSGPACK_CONTENT_TYPE, msgpack_dumps)
+
+
+def send_cbor_resp(func):
+    """Output mapper decorator for CBOR responses (or JSON ones, for clients that only
+    accept JSON)"""
+    return _send_structured_resp(func, CBOR_CONTENT_TYPE, cbor_dumps)
+
+
 def send_html_resp(func):
     # TODO bottle support
     # async def output_mapper(output, **input_kwargs):
@@ -1179,13 +1341,18 @@ def _get_inputs_from_request(request, content_type):
         elif content_type == BINARY_CONTENT_TYPE:
             data = request.body.read()
             inputs = pickle.loads(data)
+        elif content_type == MSGPACK_CONTENT_TYPE:
+            inputs = msgpack_loads(request.body.read())
+        elif content_type == CBOR_CONTENT_TYPE:
+            inputs = cbor_loads(request.body.read())
         elif content_type == FORM_CONTENT_TYPE:
             fields = json.loads(
                 request.files.pop('__fields').file.read().decode('utf-8')
             )
             binaries = {k: v.file.read() for k, v in request.files.items()}
             inputs = dict(fields, **binaries)
-        return dict(defaults, **inputs)
+        # (not copying the inputs if there's nothing to add to them)
+        return dict(defaults, **inputs) if defaults else inputs
     else:
         raise NotImplementedError('Only POST is supported for now')
 
@@ -12,7 +12,6 @@ these configurations based on the specific requirements of the project.
 Overall, this module serves as a foundational component for building and setting 
 up an HTTP service in Python using the py2http library."""
 
-from aiohttp import web
 from bottle import response
 import json
 import os
@@ -25,7 +24,19 @@ from i2.errors import (
     DuplicateRecordError,
 )
 
-from py2http.decorators import handle_json_req, send_json_resp, JsonRespEncoder
+from py2http.decorators import (
+    inputs_by_ref,
+    handle_json_req,
+    send_json_resp,
+    JsonRespEncoder,
+    handle_msgpack_req,
+    send_msgpack_resp,
+    handle_cbor_req,
+    send_cbor_resp,
+)
+from py2http.concurrency import OverloadedError
+from py2http.jobs import IdempotencyKeyMismatchError
+from py2http.negotiation import NotAcceptableError, UnsupportedMediaTypeError
 from py2http.config import AIOHTTP, BOTTLE, FLASK
 from py2http.constants import JSON_CONTENT_TYPE
 
@@ -33,15 +44,47 @@ DFLT_CONTENT_TYPE = JSON_CONTENT_TYPE
 
 
 @handle_json_req
-def default_input_mapper(**inputs):
+@inputs_by_ref
+def default_input_mapper(inputs):
     return inputs
 
 
 @send_json_resp
-def default_output_mapper(output, **inputs):
+@inputs_by_ref
+def default_output_mapper(output, inputs):
     return output
 
 
+# MessagePack and CBOR mappers (that also serve JSON, to clients that use it), for
+# services that exchange a lot of (numerical) data. Like the default ones, they pass
+# the inputs on by reference, and their request schema is the one of the function.
+# Usage: mk_app(funcs, input_mapper=msgpack_input_mapper,
+#               output_mapper=msgpack_output_mapper)
+@handle_msgpack_req
+@inputs_by_ref
+def msgpack_input_mapper(inputs):
+    return inputs
+
+
+@send_msgpack_resp
+@inputs_by_ref
+def msgpack_output_mapper(output, inputs):
+    return output
+
+
+@handle_cbor_req
+@inputs_by_ref
+def cbor_input_mapper(inputs):
+    return inputs
+
+
+@send_cbor_resp
+@inputs_by_ref
+def cbor_output_mapper(output, inputs):
+    return output
+
+
+
 def flask_output_mapper(output, **inputs):
     return output
 
@@ -51,17 +94,26 @@ def bottle_output_mapper(output, **inputs):
     return json.dumps(output, cls=JsonRespEncoder)
 
 
-def _raise_http_client_error(error, message, reason=None):
+def _raise_http_client_error(error, message, reason=None, headers=None):
     raise error(
         text=json.dumps({'error': message}),
         content_type=JSON_CONTENT_TYPE,
         reason=reason,
+        headers=headers,
     )
 
 
 def aiohttp_error_handler(error: Exception):
+    from aiohttp import web
+
     message = str(error)
-    if isinstance(error, (AuthorizationError, InputError, DuplicateRecordError)):
+    if isinstance(error, UnsupportedMediaTypeError):
+        _raise_http_client_error(web.HTTPUnsupportedMediaType, message)
+    elif isinstance(error, NotAcceptableError):
+        _raise_http_client_error(web.HTTPNotAcceptable, message)
+    elif isinstance(error, IdempotencyKeyMismatchError):
+        _raise_http_client_error(web.HTTPUnprocessableEntity, message)
+    elif isinstance(error, (AuthorizationError, InputError, DuplicateRecordError)):
         _raise_http_client_error(
             web.HTTPBadRequest, message, reason=type(error).__name__
         )
@@ -69,6 +121,12 @@ def aiohttp_error_handler(error: Exception):
         _raise_http_client_error(web.HTTPForbidden, message)
     elif isinstance(error, NotFoundError):
         _raise_http_client_error(web.HTTPNotFound, message)
+    elif isinstance(error, OverloadedError):
+        _raise_http_client_error(
+            web.HTTPServiceUnavailable,
+            message,
+            headers={'Retry-After': str(error.retry_after)},
+        )
     else:
         message = 'Internal server error'
         _raise_http_client_error(web.HTTPInternalServerError, message)
@@ -76,13 +134,21 @@ def aiohttp_error_handler(error: Exception):
 
 def bottle_error_handler(error: Exception):
     message = str(error)
-    if isinstance(error, (AuthorizationError, InputError, DuplicateRecordError)):
+    if isinstance(
+        error,
+        (UnsupportedMediaTypeError, NotAcceptableError, IdempotencyKeyMismatchError),
+    ):
+        response.status = error.status
+    elif isinstance(error, (AuthorizationError, InputError, DuplicateRecordError)):
         response.status = f'400 {type(error).__name__}'
         # response.reason = type(error).__name__
     elif isinstance(error, ForbiddenError):
         response.status = 403
     elif isinstance(error, NotFoundError):
         response.status = 404
+    elif isinstance(error, OverloadedError):
+        response.status = 503
+        response.set_header('Retry-After', str(error.retry_after))
     else:
         response.status = 500
         if os.getenv('OPAQUE_ERRORS', None):
@@ -116,6 +182,7 @@ default_configs = {
     'host': 'localhost',
     'port': 3030,
     'server': 'gunicorn',
+    'server_options': {},
     'http_method': 'post',
     'openapi': {},
     'logger': None,
@@ -129,4 +196,29 @@ default_configs = {
     'swagger_title': 'Swagger',
     'ssl_certfile': None,
     'ssl_keyfile': None,
+    'max_concurrency': None,
+    'queue_timeout_ms': 0,
+    'retry_after': 1,
+    'executor': 'inline',
+    'executor_max_workers': None,
+    'executor_max_in_flight': None,
+    'warm_executor': False,
+    'coerce_inputs': False,
+    'coerce_outputs': False,
+    'content_types': None,
+    'publish_batch': False,
+    'batch_url': '/batch',
+    'batch_max_calls': 100,
+    'batch_max_workers': 1,
+    'build_cache_dir': None,
+    'mount_sub_apps': False,
+    'streaming': None,
+    'sse_heartbeat': 15,
+    'mode': None,
+    'job_store': None,
+    'job_executor': 'thread',
+    'job_max_workers': None,
+    'job_max_in_flight': None,
+    'coalesce': False,
+    'coalesce_ttl': 5,
 }
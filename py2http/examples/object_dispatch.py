@@ -20,7 +20,7 @@ class BackendStore(MutableMapping):
         self.store = store
 
     def __iter__(self):
-        return list(self.store)
+        return iter(self.store)
 
     def __getitem__(self, key: str) -> str:
         return self.store[key].decode()
@@ -43,7 +43,7 @@ handlers = [
     dict(
         endpoint=backend_store,
         name='backend_store',
-        attr_names=['__iter__', '__getitem__', '__setitem__'],
+        attr_names=['__iter__', '__getitem__', '__setitem__', 'getmany', 'setmany'],
     ),
 ]
 
@@ -62,9 +62,32 @@ def test_service(rooturl='http://localhost:8080'):
     }
     assert requests.post(url, json=add_args).json() == ['some_key', 'some_other_key']
 
+    # iterate over keys a page at a time...
+    add_args = {'_attr_name': '__iter__', '_limit': 1}
+    assert requests.post(url, json=add_args).json() == {
+        'items': ['some_key'],
+        'cursor': '1',
+    }
+    add_args = {'_attr_name': '__iter__', '_limit': 1, '_cursor': '1'}
+    assert requests.post(url, json=add_args).json() == {
+        'items': ['some_other_key'],
+        'cursor': None,
+    }
+
+    # ... or stream them as JSON lines
+    add_args = {'_attr_name': '__iter__', '_stream': True}
+    assert requests.post(url, json=add_args).text == '"some_key"\n"some_other_key"\n'
+
     add_args = {'_attr_name': '__getitem__', 'key': 'some_key'}
     assert requests.post(url, json=add_args).json() == 'some_value'
 
+    # bulk operations: many keys in a single request
+    add_args = {'_attr_name': 'setmany', 'items': {'k1': 'v1', 'k2': 'v2'}}
+    assert requests.post(url, json=add_args).json() == 2
+
+    add_args = {'_attr_name': 'getmany', 'keys': ['k1', 'k2', 'no_such_key']}
+    assert requests.post(url, json=add_args).json() == ['v1', 'v2', None]
+
 
 if __name__ == '__main__':
     app.run()
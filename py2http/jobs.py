@@ -0,0 +1,341 @@
+"""Running slow functions as jobs: submitted by a request, and polled by others.
+
+With ``mk_app(funcs, mode={'analyze': 'job'})`` (or a ``mode = 'job'`` attribute on
+the function), ``analyze`` gets three routes instead of one:
+
+- ``/analyze`` (submit) takes the inputs of the function, and returns at once (with a
+  ``202 Accepted`` status) the id of the job running it in a worker pool:
+  ``{"job_id": "...", "status": "pending"}``
+- ``/analyze/status`` takes a ``job_id``, and returns the status of the job:
+  ``pending``, ``done`` or ``failed`` (with the ``error``)
+- ``/analyze/result`` takes a ``job_id``, and returns the result of the job (through
+  the output mapper of the function), a ``202`` status if it's still pending, or a
+  ``500`` error if it failed
+
+so that HTTP workers are not tied up by slow requests (nor clients by connections
+lasting minutes).
+
+Submissions with an ``Idempotency-Key`` header are idempotent: the job of a key is
+only submitted once (as long as it's in the store), so clients can retry them safely.
+Keys are those of a client (its identity, given by an auth plugin, or its
+``Authorization`` header), and reusing one with other inputs is an error (a ``422``).
+
+The jobs (their status and results) are kept in a job store: by default, a
+`MemoryJobStore` of the process, bounded and expiring its jobs. With several worker
+processes, a `SqliteJobStore` lets any of them answer the status and result requests
+of the jobs the others run. The jobs of a worker that stops are lost (they stay
+pending until they expire).
+"""
+
+from functools import partial, wraps
+from hashlib import sha256
+from inspect import iscoroutinefunction, signature
+import json
+from os import getpid
+import pickle
+import sqlite3
+from threading import Lock, local
+from time import time
+from typing import Optional
+from uuid import uuid4
+
+from bottle import request, response
+from i2.errors import InputError, NotFoundError
+
+from py2http.coalescing import inputs_key
+from py2http.concurrency import INLINE, THREAD, get_executor, run_in_worker_loop
+from py2http.constants import IDEMPOTENCY_KEY_HEADER
+from py2http.util import TTLCache
+
+JOB = 'job'
+modes = (JOB,)
+PENDING, DONE, FAILED = 'pending', 'done', 'failed'
+DFLT_MAX_JOBS = 10_000
+DFLT_JOB_TTL = 3600
+
+
+class JobFailedError(Exception):
+    """Raised (by the result route of a job) when the job failed"""
+
+
+class IdempotencyKeyMismatchError(InputError):
+    """Raised when a job is submitted with the ``Idempotency-Key`` of a job with other
+    inputs"""
+
+    status = 422
+
+
+class MemoryJobStore:
+    """The jobs of the process, at most ``max_jobs`` of them (the least recently used
+    are dropped first), each kept for ``ttl`` seconds after its last update.
+
+    >>> store = MemoryJobStore()
+    >>> store.create('job', {'status': 'pending'})
+    True
+    >>> store.create('job', {'status': 'pending'})  # it exists already
+    False
+    >>> store.update('job', {'status': 'done', 'result': 42})
+    >>> store.get('job')
+    {'status': 'done', 'result': 42}
+    """
+
+    def __init__(self, max_jobs: int = DFLT_MAX_JOBS, ttl: float = DFLT_JOB_TTL):
+        self._jobs = TTLCache(max_jobs, ttl)
+        self._lock = Lock()
+
+    def create(self, job_id: str, record: dict) -> bool:
+        """Add the job, unless it exists already. Return whether it was added."""
+        with self._lock:
+            if self._jobs.get(job_id) is not None:
+                return False
+            self._jobs.set(job_id, record)
+            return True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    def update(self, job_id: str, record: dict):
+        self._jobs.set(job_id, record)
+
+    def delete(self, job_id: str):
+        self._jobs.pop(job_id)
+
+
+class SqliteJobStore:
+    """Jobs kept in a sqlite file, so that they are shared by the processes using the
+    same file (like the workers of a gunicorn server). See `MemoryJobStore`.
+
+    The results of jobs are pickled: the file must only be writable by the service.
+
+    :param path: The path of the sqlite file (made if missing)
+    :param timeout: How long (in seconds) to wait for the lock of the database
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_jobs: int = DFLT_MAX_JOBS,
+        ttl: float = DFLT_JOB_TTL,
+        *,
+        timeout: float = 5,
+        timer=time,
+    ):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.timeout = timeout
+        self._timer = timer  # wall-clock time, as it's shared by processes
+        self._local = local()
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs '
+            '(job_id TEXT PRIMARY KEY, record BLOB, expires_at REAL)'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)'
+        )
+
+    def _connection(self):
+        # a connection per thread, and per process (connections can't be shared)
+        if getattr(self._local, 'pid', None) != getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, getpid()
+        return self._local.connection
+
+    def create(self, job_id: str, record: dict) -> bool:
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = self._timer()
+            connection.execute('DELETE FROM jobs WHERE expires_at <= ?', (now,))
+            added = connection.execute(
+                'INSERT OR IGNORE INTO jobs VALUES (?, ?, ?)',
+                (job_id, pickle.dumps(record), now + self.ttl),
+            ).rowcount
+            # (dropping the jobs expiring first, beyond max_jobs)
+            connection.execute(
+                'DELETE FROM jobs WHERE job_id IN (SELECT job_id FROM jobs '
+                'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_jobs,),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return bool(added)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = (
+            self._connection()
+            .execute(
+                'SELECT record FROM jobs WHERE job_id = ? AND expires_at > ?',
+                (job_id, self._timer()),
+            )
+            .fetchone()
+        )
+        return pickle.loads(row[0]) if row else None
+
+    def update(self, job_id: str, record: dict):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)',
+            (job_id, pickle.dumps(record), self._timer() + self.ttl),
+        )
+
+    def delete(self, job_id: str):
+        self._connection().execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+
+_default_store = None
+_default_store_lock = Lock()
+
+
+def default_job_store() -> MemoryJobStore:
+    """The job store of the process, for the apps that don't specify one"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MemoryJobStore()
+    return _default_store
+
+
+def _caller() -> Optional[str]:
+    """Who makes the current request, if it's known: the identity an auth plugin gave
+    it, or else its ``Authorization`` header"""
+    for attr in ('identity', 'token'):  # (see AuthPlugin, and JWTPlugin)
+        value = getattr(request, attr, None)
+        if value is not None:
+            return json.dumps(value, sort_keys=True, default=str)
+    return request.get_header('Authorization')
+
+
+def _job_id(method_name):
+    """The id of the job of the current request: made from its ``Idempotency-Key``
+    header, if it has one (so that retries get the same job), and its caller (so that
+    a key can't get the job of another client), random otherwise"""
+    key = request.get_header(IDEMPOTENCY_KEY_HEADER)
+    if key:
+        key = json.dumps([method_name, _caller(), key])
+        return sha256(key.encode()).hexdigest()[:32]
+    return uuid4().hex
+
+
+def _run_async(func, /, **inputs):
+    """Run the async ``func`` (in the event loop of the pool worker it's run in)"""
+    return run_in_worker_loop(func(**inputs))
+
+
+def _record_outcome(store, job_id, record, future):
+    """Record the outcome of the job (the done callback of its future)"""
+    error = future.exception()
+    if error is None:
+        record = dict(record, status=DONE, result=future.result())
+    else:
+        record = dict(record, status=FAILED, error=str(error) or type(error).__name__)
+    record['finished_at'] = time()
+    try:
+        store.update(job_id, record)
+    except Exception as error:  # say, a result that can't be pickled
+        store.update(job_id, dict(record, status=FAILED, result=None, error=str(error)))
+
+
+def _status_of(job_id, record):
+    status = {'job_id': job_id, 'status': record['status']}
+    if record['status'] == FAILED:
+        status['error'] = record['error']
+    return status
+
+
+def mk_job_funcs(
+    func,
+    *,
+    method_name: str,
+    path: str,
+    output_mapper,
+    status_output_mapper,
+    store=None,
+    executor: str = THREAD,
+    max_workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+):
+    """Make the functions of the submit, status and result routes of the jobs of
+    ``func`` (see the module docs)
+
+    :param method_name: The name of the route of ``func`` (that of the submit route)
+    :param path: The path of the route of ``func`` (that of the submit route)
+    :param output_mapper: The output mapper of ``func`` (for the result route)
+    :param status_output_mapper: The output mapper of the submit and status routes
+    :param store: The job store (by default, the `MemoryJobStore` of the process)
+    :param executor: The kind of pool the jobs run in: ``'thread'`` or ``'process'``
+        (``func`` must then be picklable)
+    :param max_workers: The number of workers of the pool
+    :param max_in_flight: How many jobs (running or waiting) the pool can have at once:
+        submissions beyond it are rejected (with a ``503`` status)
+    """
+    store = store or default_job_store()
+    is_async = iscoroutinefunction(func)
+    if executor == INLINE:
+        executor = THREAD  # (jobs run in the background, whatever happens)
+
+    @wraps(func)  # (with the signature, and configs attributes, of func)
+    def submit(**inputs):
+        job_id = _job_id(method_name)
+        record = {
+            'status': PENDING,
+            'submitted_at': time(),
+            'inputs_key': inputs_key((), inputs),
+        }
+        if not store.create(job_id, record):  # (a retry: the job exists already)
+            existing = store.get(job_id) or record
+            if existing.get('inputs_key') != record['inputs_key']:
+                raise IdempotencyKeyMismatchError(
+                    f'{IDEMPOTENCY_KEY_HEADER} was used for a job with other inputs'
+                )
+            response.status = 202
+            return _status_of(job_id, existing)
+        response.status = 202
+        pool = get_executor(executor, max_workers, max_in_flight)
+        try:
+            if is_async:
+                future = pool.try_submit(_run_async, func, **inputs)
+            else:
+                future = pool.try_submit(func, **inputs)
+        except BaseException:
+            store.delete(job_id)
+            raise
+        future.add_done_callback(partial(_record_outcome, store, job_id, record))
+        return _status_of(job_id, record)
+
+    submit.__signature__ = signature(func)
+    submit.executor = INLINE  # (submit returns at once: it runs in the HTTP worker)
+    submit.output_mapper = status_output_mapper
+
+    def status(job_id: str) -> dict:
+        record = store.get(job_id)
+        if record is None:
+            raise NotFoundError(f'No job {job_id}')
+        return _status_of(job_id, record)
+
+    def result(job_id: str):
+        record = store.get(job_id)
+        if record is None:
+            raise NotFoundError(f'No job {job_id}')
+        if record['status'] == FAILED:
+            raise JobFailedError(record['error'])
+        if record['status'] == PENDING:
+            response.status = 202
+            return _status_of(job_id, record)
+        return record['result']
+
+    status.__name__ = f'{method_name}_status'
+    status.__doc__ = f'The status of a {method_name} job'
+    status.route = f'{path}/status'
+    status.output_mapper = status_output_mapper
+    result.__name__ = f'{method_name}_result'
+    result.__doc__ = f'The result of a {method_name} job'
+    result.route = f'{path}/result'
+    result.output_mapper = output_mapper
+    return submit, status, result
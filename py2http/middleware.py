@@ -17,15 +17,87 @@ within the Py2http framework. These functions ensure secure access to HTTP route
 by verifying credentials and permissions. Use these middleware functions to enforce 
 authentication and control access to web resources.
 """
+from hashlib import sha256
 import json
+from math import ceil
+from numbers import Number
+from typing import Iterable
 from warnings import warn
 from py2http.constants import JSON_CONTENT_TYPE
+from py2http.rate_limiting import RateLimiter, client_ip
+from py2http.util import TTLCache
 
+DFLT_JWT_CACHE_SIZE = 1024
+DFLT_JWT_CACHE_TTL = 300
 
-def mk_jwt_middleware(secret, verify=True):
+
+def mk_jwt_decoder(
+    secret,
+    verify: bool = True,
+    algorithms: Iterable[str] = ('HS256',),
+    mapper: dict = None,
+    *,
+    cache_size: int = DFLT_JWT_CACHE_SIZE,
+    cache_ttl: float = DFLT_JWT_CACHE_TTL,
+):
+    """Make a function decoding a JWT into its claims (renamed with ``mapper``),
+    raising ``jwt`` errors on invalid tokens.
+
+    Verifying a signature (especially an RS256 one) is expensive, and clients use the
+    same token for many requests, so the claims of verified tokens are cached (keyed by
+    a hash of the token) until the token expires, or for ``cache_ttl`` seconds if
+    sooner. Invalid tokens are never cached. Use ``cache_size=0`` to disable the cache.
+
+    >>> import jwt
+    >>> decode = mk_jwt_decoder('secret', mapper={'sub': 'user'})
+    >>> token = jwt.encode({'sub': 'bob'}, 'secret')
+    >>> decode(token)
+    {'user': 'bob'}
+    >>> decode(token) is decode(token)  # each call gets its own copy of the claims
+    False
+    """
+    import jwt
+
+    algorithms = list(algorithms)
+    mapper = mapper or {}
+    cache = TTLCache(cache_size, cache_ttl)
+
+    def decode(token: str) -> dict:
+        key = sha256(token.encode()).digest()
+        claims = cache.get(key)
+        if claims is None:
+            claims = jwt.decode(
+                token,
+                secret,
+                options={'verify_signature': verify},
+                algorithms=algorithms,
+            )
+            for k, v in mapper.items():
+                if k in claims:
+                    claims[v] = claims.pop(k)
+            exp = claims.get('exp')
+            cache.set(key, claims, exp if isinstance(exp, Number) else None)
+        return dict(claims)
+
+    decode.cache = cache
+    return decode
+
+
+def mk_jwt_middleware(
+    secret,
+    verify=True,
+    *,
+    algorithms: Iterable[str] = ('HS256', 'RS256'),
+    cache_size: int = DFLT_JWT_CACHE_SIZE,
+    cache_ttl: float = DFLT_JWT_CACHE_TTL,
+):
     from aiohttp import web
     import jwt
 
+    decode = mk_jwt_decoder(
+        secret, verify, algorithms, cache_size=cache_size, cache_ttl=cache_ttl
+    )
+
     @web.middleware
     async def middleware(req, handler):
         if handler.__name__ == 'ping' or handler.__name__ == 'openapi':
@@ -33,10 +105,7 @@ def mk_jwt_middleware(secret, verify=True):
         auth_header = req.headers.get('Authorization', '')
         token = auth_header[7:]
         try:
-            decoded = jwt.decode(
-                token, secret, options={'verify': verify}, algorithms=['HS256', 'RS256']
-            )
-            req.token = decoded
+            req.token = decode(token)
             return await handler(req)
         except jwt.DecodeError as error:
             if verify:
@@ -54,6 +123,57 @@ def mk_jwt_middleware(secret, verify=True):
     return middleware
 
 
+too_many_requests_body = json.dumps({'error': 'Too many requests'})
+
+
+def mk_rate_limit_middleware(
+    rate,
+    burst: float = None,
+    *,
+    key=client_ip,
+    store=None,
+    per_route: bool = True,
+    route_rates: dict = None,
+    ignore_methods: Iterable[str] = ('ping', 'openapi'),
+):
+    """Make a middleware rejecting the requests of clients exceeding their rate limit,
+    with a ``429 Too Many Requests`` response. See `py2http.rate_limiting.RateLimiter`
+    for the arguments."""
+    from aiohttp import web
+
+    limiter = RateLimiter(
+        rate,
+        burst,
+        key=key,
+        store=store,
+        per_route=per_route,
+        route_rates=route_rates,
+        ignore_methods=ignore_methods,
+    )
+    checks = {}  # handler name -> check (or None), made on the first request
+
+    @web.middleware
+    async def middleware(req, handler):
+        name = (
+            getattr(handler, 'method_name', None)
+            or req.match_info.route.name
+            or handler.__name__
+        )
+        if name not in checks:
+            checks[name] = limiter.mk_check(name)
+        check = checks[name]
+        wait = check(req) if check is not None else 0
+        if not wait:
+            return await handler(req)
+        return web.HTTPTooManyRequests(
+            text=too_many_requests_body,
+            content_type=JSON_CONTENT_TYPE,
+            headers={'Retry-After': str(ceil(wait))},
+        )
+
+    return middleware
+
+
 def mk_superadmin_middleware(secret):
     from aiohttp import web
 
@@ -0,0 +1,260 @@
+"""Content negotiation: serving several content types (JSON, MessagePack, CBOR,
+NDJSON, npy arrays...) from the same route.
+
+A route that negotiates has one codec per content type it supports. The codec used to
+read a request is chosen from its ``Content-Type`` header, and the one used to write
+the response from its ``Accept`` header (with the usual q-value preferences). The
+choices only involve dict lookups in tables computed when the route is made (and a
+cached parse of ``Accept`` headers, which clients repeat), so negotiating is cheap.
+
+Browsers and http2py clients can then use JSON while high-volume clients use a
+compact binary format, on the same routes:
+
+    mk_app(funcs, content_types=['application/json', 'application/msgpack'])
+"""
+
+from functools import lru_cache
+import json
+import pickle
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from bottle import request, response
+from i2.errors import InputError
+
+from py2http.constants import (
+    JSON_CONTENT_TYPE,
+    BINARY_CONTENT_TYPE,
+    NDJSON_CONTENT_TYPE,
+    MSGPACK_CONTENT_TYPE,
+    CBOR_CONTENT_TYPE,
+    NPY_CONTENT_TYPE,
+)
+from py2http.decorators import JsonLines, JsonRespEncoder, inputs_by_ref
+from py2http.streaming import EventStream
+from py2http.serialization import (
+    cbor_dumps,
+    cbor_loads,
+    msgpack_dumps,
+    msgpack_loads,
+    npy_dumps,
+)
+
+
+class UnsupportedMediaTypeError(InputError):
+    """Raised when the content type of a request is not supported by its route"""
+
+    status = 415
+
+
+class NotAcceptableError(InputError):
+    """Raised when a route can't produce any of the content types a request accepts"""
+
+    status = 406
+
+
+class Codec(NamedTuple):
+    """How to read (``loads(body_bytes)``) and write (``dumps(obj)``) a content type.
+    Either can be None, for content types that are only used in one direction."""
+
+    loads: Optional[Callable]
+    dumps: Optional[Callable]
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, cls=JsonRespEncoder)
+
+
+def _ndjson_dumps(obj):
+    if not isinstance(obj, JsonLines):
+        obj = JsonLines(obj)
+    return obj.lines()
+
+
+codecs = {
+    JSON_CONTENT_TYPE: Codec(json.loads, _json_dumps),
+    MSGPACK_CONTENT_TYPE: Codec(msgpack_loads, msgpack_dumps),
+    CBOR_CONTENT_TYPE: Codec(cbor_loads, cbor_dumps),
+    NDJSON_CONTENT_TYPE: Codec(None, _ndjson_dumps),
+    NPY_CONTENT_TYPE: Codec(None, npy_dumps),
+    # pickle is unsafe with untrusted clients: Only use it if you trust them
+    BINARY_CONTENT_TYPE: Codec(pickle.loads, pickle.dumps),
+}
+DFLT_CONTENT_TYPES = (JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, CBOR_CONTENT_TYPE)
+
+
+@lru_cache(maxsize=1024)
+def parse_accept(accept: str) -> tuple:
+    """Parse an ``Accept`` header into ``(media_range, q)`` pairs, by decreasing
+    preference (q value, then specificity, then order).
+
+    >>> parse_accept('text/*;q=0.5, application/msgpack, */*;q=0.1, text/html')
+    (('application/msgpack', 1.0), ('text/html', 1.0), ('text/*', 0.5), ('*/*', 0.1))
+    """
+    media_ranges = []
+    for i, item in enumerate(accept.split(',')):
+        media_range, *params = (part.strip() for part in item.split(';'))
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        specificity = 2 - media_range.count('*')
+        media_ranges.append((-q, -specificity, i, media_range.lower(), q))
+    return tuple((media_range, q) for *_, media_range, q in sorted(media_ranges))
+
+
+def _media_ranges_of(content_type):
+    main_type = content_type.split('/')[0]
+    return content_type, f'{main_type}/*', '*/*'
+
+
+def _q_of(content_type, q_of_range):
+    """The q value ``Accept`` media ranges give ``content_type``: that of the most
+    specific range matching it
+
+    >>> _q_of('application/json', {'*/*': 1.0, 'application/*': 0.0})
+    0.0
+    >>> _q_of('application/json', {'application/json': 0.5, 'application/*': 0.0})
+    0.5
+    """
+    for media_range in _media_ranges_of(content_type):
+        if media_range in q_of_range:
+            return q_of_range[media_range]
+    return 0.0
+
+
+class Negotiator:
+    """Chooses the codecs of requests and responses among those of ``content_types``.
+
+    >>> negotiator = Negotiator(['application/json', 'application/msgpack'])
+    >>> negotiator.response_content_type('application/msgpack, */*;q=0.1')
+    'application/msgpack'
+    >>> negotiator.response_content_type('text/html, application/*;q=0.9')
+    'application/json'
+    >>> negotiator.response_content_type('*/*, application/json;q=0')
+    'application/msgpack'
+    >>> negotiator.response_content_type('application/*;q=0, application/json')
+    'application/json'
+    >>> negotiator.response_content_type('text/html')
+    Traceback (most recent call last):
+      ...
+    py2http.negotiation.NotAcceptableError: None of the accepted content types (text/html) is available: application/json, application/msgpack
+    >>> negotiator.request_codec('application/json; charset=utf-8').loads(b'{"x": 1}')
+    {'x': 1}
+    """
+
+    def __init__(self, content_types: Iterable[str] = DFLT_CONTENT_TYPES):
+        content_types = tuple(content_types)
+        unknown = [ct for ct in content_types if ct not in codecs]
+        if unknown:
+            raise ValueError(
+                f'No codec for content types {unknown}: '
+                'add them to py2http.negotiation.codecs'
+            )
+        self.request_content_types = tuple(
+            ct for ct in content_types if codecs[ct].loads is not None
+        )
+        self.response_content_types = tuple(
+            ct for ct in content_types if codecs[ct].dumps is not None
+        )
+        self._request_codecs = {ct: codecs[ct] for ct in self.request_content_types}
+        # media range -> the content types it matches, in order of preference
+        self._response_content_types_of_range = {}
+        for ct in self.response_content_types:
+            for media_range in _media_ranges_of(ct):
+                self._response_content_types_of_range.setdefault(
+                    media_range, []
+                ).append(ct)
+        self.response_content_type = lru_cache(maxsize=256)(
+            self._response_content_type
+        )
+
+    def request_codec(self, content_type: Optional[str]) -> Codec:
+        """The codec to read a request with ``content_type``"""
+        content_type = (content_type or '').split(';')[0].strip().lower()
+        if not content_type and self.request_content_types:
+            content_type = self.request_content_types[0]
+        codec = self._request_codecs.get(content_type)
+        if codec is None:
+            raise UnsupportedMediaTypeError(
+                f'Unsupported content type: {content_type}. '
+                f'Supported: {", ".join(self.request_content_types)}'
+            )
+        return codec
+
+    def _response_content_type(self, accept: Optional[str]) -> str:
+        if not accept:
+            return self.response_content_types[0]
+        media_ranges = parse_accept(accept)
+        q_of_range = {}
+        for media_range, q in media_ranges:
+            q_of_range.setdefault(media_range, q)
+        for media_range, q in media_ranges:
+            if q <= 0:
+                break  # sorted by decreasing q: only excluded ones left
+            for content_type in self._response_content_types_of_range.get(
+                media_range, ()
+            ):
+                if _q_of(content_type, q_of_range) > 0:
+                    return content_type
+        raise NotAcceptableError(
+            f'None of the accepted content types ({accept}) is available: '
+            f'{", ".join(self.response_content_types)}'
+        )
+
+
+def mk_negotiating_input_mapper(content_types: Iterable[str] = DFLT_CONTENT_TYPES):
+    """Make an input mapper reading the request body (into the function's kwargs) with
+    the codec of its content type"""
+    negotiator = Negotiator(content_types)
+
+    def input_mapper(req):
+        codec = negotiator.request_codec(req.content_type)
+        body = req.body.read()
+        if not body:
+            inputs = {}
+        else:
+            try:
+                inputs = codec.loads(body)
+            except ImportError:  # (a missing codec library isn't an input error)
+                raise
+            except Exception as error:
+                raise InputError(f'Malformed {req.content_type} body: {error}')
+            if not isinstance(inputs, dict):
+                type_name = type(inputs).__name__
+                raise InputError(f'The body must be an object. Was: {type_name}')
+        defaults = getattr(req, 'defaults', None)
+        return dict(defaults, **inputs) if defaults else inputs
+
+    input_mapper.content_type = negotiator.request_content_types[0]
+    input_mapper.content_types = negotiator.request_content_types
+    input_mapper.request_schema = None  # the schema is the one of the function
+    return input_mapper
+
+
+def mk_negotiating_output_mapper(content_types: Iterable[str] = DFLT_CONTENT_TYPES):
+    """Make an output mapper writing the output of the function with the codec of the
+    content type the request accepts best"""
+    negotiator = Negotiator(content_types)
+
+    @inputs_by_ref
+    def output_mapper(output, inputs):
+        if isinstance(output, EventStream):
+            return output.respond()
+        if isinstance(output, JsonLines):  # streamed outputs
+            content_type = NDJSON_CONTENT_TYPE
+        else:
+            content_type = negotiator.response_content_type(
+                request.get_header('Accept')
+            )
+        response.content_type = content_type
+        return codecs[content_type].dumps(output)
+
+    output_mapper.content_type = negotiator.response_content_types[0]
+    output_mapper.content_types = negotiator.response_content_types
+    return output_mapper
@@ -11,9 +11,13 @@ Overall, this module allows you to define API routes and generate corresponding
 OpenAPI specifications directly from your Python functions. It provides a convenient 
 way to document and expose your functions as HTTP endpoints."""
 
+import hashlib
+import json
 from typing import Any
 
-from py2http.default_configs import DFLT_CONTENT_TYPE
+from py2http.constants import JSON_CONTENT_TYPE as DFLT_CONTENT_TYPE
+from py2http.coercion import encode_value
+from py2http.schema_tools import complex_type_schema
 from py2http.util import conditional_logger, CreateProcess, lazyprop
 
 oatype_for_pytype = {
@@ -94,6 +98,32 @@ def add_paths_to_spec(paths_spec, new_paths):
         paths_spec[pathname] = new_paths[pathname]
 
 
+def add_api_to_spec(openapi_spec, api_spec, prefix):
+    """Add the paths (and components) of the OpenAPI spec of an API to ``openapi_spec``,
+    that of an app serving this API under ``prefix``.
+
+    >>> spec = mk_openapi_template({'base_url': 'http://localhost:3030'})
+    >>> api_spec = mk_openapi_template({'base_url': 'http://localhost:3030/foo_api'})
+    >>> api_spec['paths'] = {'/foo': {'post': {'x-method_name': 'foo'}}}
+    >>> api_spec['components'] = {'schemas': {'Schema_1cb17b1b': {'type': 'object'}}}
+    >>> add_api_to_spec(spec, api_spec, '/foo_api')
+    >>> spec['paths']
+    {'/foo_api/foo': {'post': {'x-method_name': 'foo'}}}
+    >>> spec['components']
+    {'schemas': {'Schema_1cb17b1b': {'type': 'object'}}}
+    """
+    add_paths_to_spec(
+        openapi_spec['paths'],
+        {prefix + path: path_item for path, path_item in api_spec['paths'].items()},
+    )
+    # (component schemas are named after their structure, so those of several APIs
+    # don't clash)
+    for kind, components in api_spec.get('components', {}).items():
+        openapi_spec.setdefault('components', {}).setdefault(kind, {}).update(
+            components
+        )
+
+
 def set_auth(openapi_spec, auth_type='jwt', *, login_details=None):
     """
     :param openapi_spec: An OpenAPI formatted server specification
@@ -138,6 +168,137 @@ def set_auth(openapi_spec, auth_type='jwt', *, login_details=None):
         openapi_spec['security']['apiKey'] = []
 
 
+def _schemas_of_spec(openapi_spec):
+    """Generate the (top level) request and response schemas of an openapi spec"""
+    for path_info in openapi_spec.get('paths', {}).values():
+        for method_info in path_info.values():
+            contents = [method_info.get('requestBody', {}).get('content', {})]
+            for response in method_info.get('responses', {}).values():
+                contents.append(response.get('content', {}))
+            for content in contents:
+                for media_type in content.values():
+                    if 'schema' in media_type:
+                        yield media_type
+
+
+def _is_hoistable(schema):
+    return (
+        isinstance(schema, dict)
+        and schema.get('type') == 'object'
+        and bool(schema.get('properties'))
+    )
+
+
+def _sub_schemas(schema):
+    """The (container, key) pairs of the direct sub-schemas of ``schema``"""
+    for key in schema.get('properties', {}):
+        yield schema['properties'], key
+    if isinstance(schema.get('items'), dict):
+        yield schema, 'items'
+
+
+def _structural_hash(schema, hash_of_sub_schema):
+    """A hash of the structure of ``schema``, computed from the hashes of its
+    sub-schemas (so that hashing a whole tree of schemas is linear)"""
+    shallow = {k: v for k, v in schema.items() if k not in ('properties', 'items')}
+    if 'properties' in schema:
+        shallow['properties'] = {
+            k: hash_of_sub_schema(v) for k, v in schema['properties'].items()
+        }
+    if isinstance(schema.get('items'), dict):
+        shallow['items'] = hash_of_sub_schema(schema['items'])
+    serialized = json.dumps(shallow, sort_keys=True, default=repr)
+    return hashlib.sha1(serialized.encode()).hexdigest()
+
+
+def _component_name(components, full_name, schema, min_size=8):
+    """Add ``schema`` to ``components`` (unless it's there), under the shortest prefix
+    of ``full_name`` (of at least ``min_size`` characters after the name prefix) that
+    isn't the name of another schema, and return that name
+
+    >>> components = {'Schema_1234': {'type': 'string'}}
+    >>> _component_name(components, 'Schema_12345678', {'type': 'object'}, min_size=4)
+    'Schema_12345'
+    >>> _component_name(components, 'Schema_12345678', {'type': 'string'}, min_size=4)
+    'Schema_1234'
+    """
+    start = full_name.rindex('_') + 1 + min_size
+    for size in range(start, len(full_name) + 1):
+        name = full_name[:size]
+        existing = components.setdefault(name, schema)
+        if existing is schema or existing == schema:
+            return name
+    i = 1  # (the full name is that of another schema: a user's component)
+    while components.setdefault(f'{full_name}_{i}', schema) != schema:
+        i += 1
+    return f'{full_name}_{i}'
+
+
+def hoist_component_schemas(openapi_spec, min_count=2, name_prefix='Schema'):
+    """Move the object schemas that appear (identically) at least ``min_count`` times
+    in the request and response schemas of ``openapi_spec`` to its
+    ``components/schemas``, replacing them with ``$ref`` references.
+
+    Schemas are compared structurally, and named after (a prefix of) a hash of their
+    structure, so a same schema always gets the same name, unless it's taken by
+    another schema (a component of the spec, or a schema whose hash has the same
+    prefix): the name is then lengthened.
+
+    >>> point = {'type': 'object', 'properties': {
+    ...     'x': {'type': 'number'}, 'y': {'type': 'number'}}}
+    >>> def body(**properties):
+    ...     return {'requestBody': {'content': {'application/json': {
+    ...         'schema': {'type': 'object', 'properties': properties}}}}}
+    >>> spec = {'paths': {
+    ...     '/move': {'post': body(point=dict(point), dx={'type': 'number'})},
+    ...     '/dist': {'post': body(a=dict(point), b=dict(point))},
+    ... }}
+    >>> spec = hoist_component_schemas(spec)
+    >>> list(spec['components']['schemas'])
+    ['Schema_1cb17b1b']
+    >>> spec['paths']['/dist']['post']['requestBody']['content']['application/json']
+    {'schema': {'type': 'object', 'properties': {'a': {'$ref': '#/components/schemas/Schema_1cb17b1b'}, 'b': {'$ref': '#/components/schemas/Schema_1cb17b1b'}}}}
+    """
+    # First pass: hash and count the object schemas, bottom up
+    hash_of_id = {}  # schemas are hashed once, before any replacement
+    counts = {}
+
+    def hash_of(schema):
+        if not isinstance(schema, dict):
+            return repr(schema)
+        schema_hash = _structural_hash(schema, hash_of)
+        hash_of_id[id(schema)] = schema_hash
+        if _is_hoistable(schema):
+            counts[schema_hash] = counts.get(schema_hash, 0) + 1
+        return schema_hash
+
+    media_types = list(_schemas_of_spec(openapi_spec))
+    for media_type in media_types:
+        hash_of(media_type['schema'])
+
+    # Second pass: replace the repeated schemas by references, bottom up
+    components = openapi_spec.setdefault('components', {}).setdefault('schemas', {})
+
+    def hoist(schema):
+        if not isinstance(schema, dict):
+            return schema
+        schema_hash = hash_of_id.get(id(schema))
+        for container, key in list(_sub_schemas(schema)):
+            container[key] = hoist(container[key])
+        if not _is_hoistable(schema) or counts.get(schema_hash, 0) < min_count:
+            return schema
+        name = _component_name(components, f'{name_prefix}_{schema_hash}', schema)
+        return {'$ref': f'#/components/schemas/{name}'}
+
+    for media_type in media_types:
+        media_type['schema'] = hoist(media_type['schema'])
+    if not components:
+        del openapi_spec['components']['schemas']
+        if not openapi_spec['components']:
+            del openapi_spec['components']
+    return openapi_spec
+
+
 def mk_openapi_path(
     pathname='/',
     method='post',
@@ -162,19 +323,31 @@ def mk_openapi_path(
         new_path_spec['requestBody'] = {
             'required': True,
             'content': {
-                request_content_type: {'schema': mk_arg_schema(request_schema)}
+                content_type: {'schema': mk_arg_schema(request_schema)}
+                for content_type in _content_types(request_content_type)
             },
         }
     new_path_spec['responses'] = {
-        '200': {'description': '', 'content': {response_content_type: {'schema': {}}}}
+        '200': {
+            'description': '',
+            'content': {
+                content_type: {
+                    'schema': mk_arg_schema(response_schema) if response_schema else {}
+                }
+                for content_type in _content_types(response_content_type)
+            },
+        }
     }
-    if response_schema:
-        new_path_spec['responses']['200']['content'][response_content_type][
-            'schema'
-        ] = mk_arg_schema(response_schema)
     return new_path
 
 
+def _content_types(content_type):
+    """The content type(s) of a request or response, as a tuple"""
+    if isinstance(content_type, str):
+        return (content_type,)
+    return tuple(content_type)
+
+
 def mk_obj_schema(request_object):
     output = {}
     try:
@@ -190,13 +363,18 @@ def mk_arg_schema(arg):
     required = True
     if 'default' in arg:
         required = False
-        default = arg['default']
+        default = encode_value(arg['default'])
     val_type = openapi_type_mapping(arg.get('type', Any))
-    if not val_type:
+    complex_schema = None if val_type else complex_type_schema(arg_type)
+    if complex_schema is not None:
+        output = dict(complex_schema)
+    elif not val_type:
         raise ValueError(
             f'Request schema value {arg_type} is an invalid type. Only JSON-compatible types are allowed.'
         )
-    if val_type == 'object':
+    elif 'anyOf' in arg:
+        output = {'anyOf': [mk_arg_schema(sub_arg) for sub_arg in arg['anyOf']]}
+    elif val_type == 'object':
         output = {
             'type': 'object',
             'properties': mk_obj_schema(arg.get('properties', {})),
@@ -204,6 +382,8 @@ def mk_arg_schema(arg):
         required_props = arg.get('required', [])
         if required_props:
             output['required'] = required_props
+        if 'additionalProperties' in arg:
+            output['additionalProperties'] = mk_arg_schema(arg['additionalProperties'])
     elif val_type == 'array':
         output = {'type': 'array'}
         sub_args = arg.get('items', None)
@@ -215,11 +395,14 @@ def mk_arg_schema(arg):
         output = {'type': 'string', 'format': 'binary'}
     else:
         output = {'type': val_type}
+    if 'enum' in arg:
+        output['enum'] = [encode_value(value) for value in arg['enum']]
+    if arg.get('nullable'):
+        output['nullable'] = True
     if not required:
         output['default'] = default
     return output
 
-
 from py2http.schema_tools import mk_input_schema_from_func
 
 
@@ -0,0 +1,287 @@
+"""Rate limiting: bounding how many requests each client can make (per route).
+
+Each client (identified by a key: its IP address, API key, or a JWT claim) has a token
+bucket (per route, by default): a bucket holding at most ``burst`` tokens, refilled at
+``rate`` tokens per second. A request takes a token, and is rejected (with a ``429 Too
+Many Requests`` response, and a ``Retry-After`` header) if there is none left. Clients
+can then make ``burst`` requests at once, but no more than ``rate`` per second on
+average, so that a single noisy client can't use up the capacity of a service.
+
+The buckets are kept in a store: in memory (`MemoryBucketStore`), per worker process,
+by default, or in a sqlite file (`SqliteBucketStore`), shared by the worker processes
+of a machine (e.g. those of gunicorn), so that the limits hold across workers.
+
+The `RateLimiter` is used by the bottle `RateLimitPlugin` and by the aiohttp
+middleware made by `mk_rate_limit_middleware`:
+
+    mk_app(funcs, plugins=[RateLimitPlugin('10/second', burst=20, key=api_key)])
+"""
+
+from collections import OrderedDict
+from hashlib import sha256
+from itertools import count
+from os import getpid
+import sqlite3
+from threading import Lock, local
+from time import monotonic, time
+from typing import Callable, Iterable, Optional, Union
+
+Rate = Union[float, str]
+
+_seconds_per_unit = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate: Rate) -> float:
+    """Get a rate in requests per second, from a number (of requests per second), or
+    a ``'<number>/<unit>'`` string.
+
+    >>> parse_rate('120/minute')
+    2.0
+    >>> parse_rate(0.5)
+    0.5
+    """
+    if isinstance(rate, str):
+        n, _, unit = rate.partition('/')
+        unit = unit.strip().rstrip('s') or 'second'
+        if unit not in _seconds_per_unit:
+            raise ValueError(
+                f'Invalid rate unit: {unit}. Use one of {list(_seconds_per_unit)}'
+            )
+        rate = float(n) / _seconds_per_unit[unit]
+    if rate <= 0:
+        raise ValueError(f'A rate must be positive: {rate}')
+    return float(rate)
+
+
+def take_tokens(tokens, elapsed, rate, burst, cost=1):
+    """Take ``cost`` tokens from a bucket that had ``tokens`` tokens ``elapsed``
+    seconds ago.
+
+    :return: A ``(tokens_left, wait)`` pair, ``wait`` being 0 if the tokens were taken,
+        or how long to wait (in seconds) until they can be.
+
+    >>> take_tokens(1, elapsed=0.5, rate=2, burst=5)
+    (1.0, 0.0)
+    >>> take_tokens(0, elapsed=0.25, rate=2, burst=5)
+    (0.5, 0.25)
+    """
+    tokens = min(burst, tokens + elapsed * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Token buckets kept in memory (so, per process). At most ``max_keys`` buckets
+    are kept: the least recently used ones are dropped first (which only makes them
+    full again).
+
+    >>> clock = iter([0, 0, 0, 0.5]).__next__
+    >>> store = MemoryBucketStore(timer=clock)
+    >>> [store.take('client', rate=2, burst=2) for _ in range(3)]
+    [0.0, 0.0, 0.5]
+    >>> store.take('client', rate=2, burst=2)  # half a second later
+    0.0
+    """
+
+    def __init__(self, max_keys: int = 100_000, *, timer=monotonic):
+        self.max_keys = max_keys
+        self._timer = timer
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = Lock()
+
+    def take(self, key, rate: float, burst: float, cost: float = 1) -> float:
+        """Take ``cost`` tokens from the bucket of ``key``. Returns 0 if they were
+        taken, or how long to wait (in seconds) until they can be."""
+        now = self._timer()
+        with self._lock:
+            tokens, updated = self._buckets.get(key) or (burst, now)
+            tokens, wait = take_tokens(tokens, now - updated, rate, burst, cost)
+            if not wait:  # (the bucket is unchanged by rejections)
+                self._buckets[key] = (tokens, now)
+                self._buckets.move_to_end(key)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+        return wait
+
+
+class SqliteBucketStore:
+    """Token buckets kept in a sqlite file, so that they are shared by the processes
+    using the same file (like the workers of a gunicorn server).
+
+    :param path: The path of the sqlite file (made if missing)
+    :param timeout: How long (in seconds) to wait for the lock of the database
+    :param prune_every: How many takes (per process) between the deletions of the
+        buckets that are full again (as good as missing), which keeps the file small
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        timeout: float = 5,
+        prune_every: int = 1000,
+        timer=time,
+    ):
+        self.path = path
+        self.timeout = timeout
+        self.prune_every = prune_every
+        self._timer = timer  # wall-clock time, as it's shared by processes
+        self._local = local()
+        self._takes = count(1)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL, updated REAL, full_at REAL)'
+        )
+
+    def _connection(self):
+        # a connection per thread, and per process (connections can't be shared)
+        if getattr(self._local, 'pid', None) != getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, getpid()
+        return self._local.connection
+
+    def take(self, key, rate: float, burst: float, cost: float = 1) -> float:
+        """Take ``cost`` tokens from the bucket of ``key``. Returns 0 if they were
+        taken, or how long to wait (in seconds) until they can be."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = self._timer()
+            row = connection.execute(
+                'SELECT tokens, updated FROM buckets WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated = row or (burst, now)
+            tokens, wait = take_tokens(tokens, now - updated, rate, burst, cost)
+            if not wait:
+                connection.execute(
+                    'INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)',
+                    (key, tokens, now, now + (burst - tokens) / rate),
+                )
+            if next(self._takes) % self.prune_every == 0:
+                connection.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return wait
+
+
+# Client keys ##################################################################
+# Functions getting the key identifying the client of a request (a bottle or aiohttp
+# request). If they return None, the IP address of the client is used.
+
+
+def client_ip(req) -> Optional[str]:
+    """The IP address of the client of the request (not the one of X-Forwarded-For
+    headers, which clients can set: use your own key function if behind a proxy)"""
+    environ = getattr(req, 'environ', None)  # bottle
+    if environ is not None:
+        return environ.get('REMOTE_ADDR')
+    return req.remote  # aiohttp
+
+
+def api_key(req) -> Optional[str]:
+    """A hash of the ``Authorization`` header of the request"""
+    authorization = req.headers.get('Authorization')
+    if authorization:
+        return sha256(authorization.encode()).hexdigest()[:32]
+
+
+def jwt_claim(claim: str = 'sub') -> Callable:
+    """Make a key function getting ``claim`` from the ``token`` of requests (set by
+    the JWT plugin or middleware, which must then come before the rate limiter)"""
+
+    def key(req):
+        token = getattr(req, 'token', None)
+        if isinstance(token, dict):
+            value = token.get(claim)
+            return None if value is None else f'{claim}={value}'
+
+    return key
+
+
+class RateLimiter:
+    """Decides which requests to accept, with a token bucket per client (and route).
+
+    :param rate: The number of requests per second (or a string like ``'100/minute'``)
+        each client can make (on average)
+    :param burst: The number of requests a client can make at once (by default, the
+        number of requests per second, or 1 if less)
+    :param key: The function getting the key identifying the client of a request
+    :param store: Where to keep the buckets (by default, a new `MemoryBucketStore`)
+    :param per_route: Whether clients have a bucket per route, or one for all routes
+    :param route_rates: The ``rate`` (or ``(rate, burst)``) of specific routes (by
+        method name). None means the route is not limited.
+    :param ignore_methods: The method names of routes that are not limited
+
+    >>> limiter = RateLimiter('1/second', burst=2, route_rates={'cheap': '100/second'})
+    >>> check = limiter.mk_check('expensive')
+    >>> class Request:
+    ...     environ = {'REMOTE_ADDR': '1.2.3.4'}
+    >>> [check(Request) > 0 for _ in range(3)]
+    [False, False, True]
+    >>> limiter.mk_check('cheap')(Request)
+    0.0
+    """
+
+    def __init__(
+        self,
+        rate: Rate,
+        burst: Optional[float] = None,
+        *,
+        key: Callable = client_ip,
+        store=None,
+        per_route: bool = True,
+        route_rates: Optional[dict] = None,
+        ignore_methods: Iterable[str] = (),
+    ):
+        self.limits = self._limits(rate, burst)
+        self.key = key
+        self.store = store if store is not None else MemoryBucketStore()
+        self.per_route = per_route
+        self.route_limits = {
+            name: (
+                None
+                if route_rate is None
+                else self._limits(*_rate_and_burst(route_rate))
+            )
+            for name, route_rate in (route_rates or {}).items()
+        }
+        self.route_limits.update(dict.fromkeys(ignore_methods))
+
+    @staticmethod
+    def _limits(rate, burst=None):
+        rate = parse_rate(rate)
+        return rate, float(burst if burst is not None else max(rate, 1))
+
+    def mk_check(self, method_name=None, rule=None) -> Optional[Callable]:
+        """Make the function checking the requests of a route: It returns 0 if the
+        request is accepted, or how long (in seconds) the client should wait before
+        retrying. Returns None if the route is not limited.
+
+        With ``per_route``, the buckets of the route are those of its ``rule`` (path)
+        if given, else of its method name (which routes of different APIs can share).
+        """
+        limits = self.route_limits.get(method_name, self.limits)
+        if limits is None:
+            return None
+        rate, burst = limits
+        key_of, take = self.key, self.store.take
+        prefix = f'{rule or method_name}:' if self.per_route else ''
+
+        def check(req) -> float:
+            key = key_of(req) or client_ip(req)
+            return take(f'{prefix}{key}', rate, burst)
+
+        return check
+
+
+def _rate_and_burst(route_rate):
+    if isinstance(route_rate, tuple):
+        return route_rate
+    return route_rate, None
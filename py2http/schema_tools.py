@@ -5,67 +5,304 @@ dictionary. The module aims to assist in the generation of API specifications an
 input validation for HTTP services built using Python. The functions are designed to 
 simplify the process of defining API inputs and outputs, and ensuring data integrity 
 in request handling."""
+from collections import abc
+from dataclasses import MISSING, fields as dataclass_fields, is_dataclass
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache, wraps
 from inspect import signature, Signature, Parameter
-from typing import Any, _TypedDictMeta, T_co, Union, _GenericAlias
+from typing import (
+    Any,
+    _TypedDictMeta,
+    T_co,
+    Union,
+    _GenericAlias,
+    Literal,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+from uuid import UUID
 from i2.errors import InputError
 
-COMPLEX_TYPE_MAPPING = {}
+# The (openAPI) schemas of the types that are not JSON types, but can be converted
+# from/to JSON values (see py2http.coercion for the conversions)
+COMPLEX_TYPE_MAPPING = {
+    datetime: {'type': 'string', 'format': 'date-time'},
+    date: {'type': 'string', 'format': 'date'},
+    time: {'type': 'string', 'format': 'time'},
+    UUID: {'type': 'string', 'format': 'uuid'},
+    Decimal: {'type': 'string', 'format': 'decimal'},
+}
+# Same, for types of optional dependencies, keyed by (module, qualname), so that these
+# don't have to be imported
+COMPLEX_TYPE_MAPPING_BY_NAME = {
+    ('numpy', 'ndarray'): {'type': 'array'},
+}
 JSON_TYPES = [list, str, int, float, dict, bool]
+_oatype_of_enum_value = {str: 'string', int: 'integer', float: 'number'}
 
 
-def mk_sub_dict_schema_from_typed_dict(typed_dict):
-    total = getattr(typed_dict, '__total__', False)
-    required_properties = []
+def complex_type_schema(obj_type):
+    """The openAPI schema of a (non-JSON) type, or None if it has none.
+
+    >>> complex_type_schema(datetime)
+    {'type': 'string', 'format': 'date-time'}
+    >>> class Color(Enum):
+    ...     red = 'red'
+    ...     blue = 'blue'
+    >>> complex_type_schema(Color)
+    {'type': 'string', 'enum': ['red', 'blue']}
+    >>> complex_type_schema(list) is None
+    True
+    """
+    for cls in getattr(obj_type, '__mro__', ()):
+        if cls is object:
+            break
+        if cls is Enum:
+            values = [member.value for member in obj_type]
+            schema = {'enum': values}
+            value_types = {type(value) for value in values}
+            if len(value_types) == 1 and value_types <= _oatype_of_enum_value.keys():
+                schema = {'type': _oatype_of_enum_value[value_types.pop()], **schema}
+            return schema
+        schema = COMPLEX_TYPE_MAPPING.get(cls) or COMPLEX_TYPE_MAPPING_BY_NAME.get(
+            (cls.__module__, cls.__qualname__)
+        )
+        if schema is not None:
+            return schema
+    return None
+
+_schema_caches = []
+
+
+def cache_schemas(func):
+    """Memoize a schema making function on its (hashable) arguments.
+
+    Schemas are made from types and signatures, which don't change, so there's no need
+    to compute them again every time a type is used, or a function is dispatched.
+    Note that the cached schemas are shared, so should not be mutated.
+    Arguments that are not hashable are just not cached.
+
+    >>> @cache_schemas
+    ... def schema_of(x):
+    ...     print(f'computing schema of {x}')
+    ...     return {'type': x}
+    >>> schema_of(int)
+    computing schema of <class 'int'>
+    {'type': <class 'int'>}
+    >>> schema_of(int)
+    {'type': <class 'int'>}
+    >>> schema_of([int])  # unhashable: computed every time
+    computing schema of [<class 'int'>]
+    {'type': [<class 'int'>]}
+    """
+    cached_func = lru_cache(maxsize=None)(func)
+    _schema_caches.append(cached_func)
+
+    @wraps(func)
+    def _func(*args, **kwargs):
+        try:
+            return cached_func(*args, **kwargs)
+        except TypeError:  # unhashable arguments
+            return func(*args, **kwargs)
+
+    _func.cache_info = cached_func.cache_info
+    return _func
+
+
+def clear_schema_caches():
+    """Clear the cached schemas (e.g. after changing ``COMPLEX_TYPE_MAPPING``)"""
+    for cached_func in _schema_caches:
+        cached_func.cache_clear()
+
+
+def is_named_tuple(obj_type):
+    return (
+        isinstance(obj_type, type)
+        and issubclass(obj_type, tuple)
+        and hasattr(obj_type, '_fields')
+    )
+
+
+def is_model(obj_type):
+    """Whether ``obj_type`` is a type with fields: A dataclass or a NamedTuple"""
+    return isinstance(obj_type, type) and (
+        is_dataclass(obj_type) or is_named_tuple(obj_type)
+    )
+
+
+def type_hints(obj):
+    """The (resolved, if possible) annotations of ``obj``"""
+    try:
+        return get_type_hints(obj)
+    except Exception:  # unresolvable (string) annotations
+        return dict(getattr(obj, '__annotations__', {}))
+
+
+def model_fields(model):
+    """The ``{name: (type, default)}`` of the fields of a dataclass or NamedTuple
+    (with ``Parameter.empty`` defaults for fields that are required).
+
+    >>> from typing import NamedTuple
+    >>> class Point(NamedTuple):
+    ...     x: float
+    ...     y: float = 0.0
+    >>> model_fields(Point)
+    {'x': (<class 'float'>, <class 'inspect._empty'>), 'y': (<class 'float'>, 0.0)}
+    """
+    hints = type_hints(model)
+    if is_named_tuple(model):
+        defaults = model._field_defaults
+        return {
+            name: (hints.get(name, Any), defaults.get(name, Parameter.empty))
+            for name in model._fields
+        }
+    fields_ = {}
+    for field in dataclass_fields(model):
+        if not field.init:
+            continue
+        if field.default is not MISSING:
+            default = field.default
+        elif field.default_factory is not MISSING:
+            default = field.default_factory()
+        else:
+            default = Parameter.empty
+        fields_[field.name] = (hints.get(field.name, field.type), default)
+    return fields_
+
+
+_json_literal_types = (str, int, float, bool, type(None))
 
-    def set_property(key, value):
-        optional = False
-        if getattr(value, '__origin__', None) == Union:
-            optional = type(None) in value.__args__
-            value = [x for x in value.__args__ if type(None) != x][0]
+
+@cache_schemas
+def mk_schema_from_type(obj_type) -> dict:
+    """Make the schema of a type annotation.
+
+    Handles JSON types, the types of ``COMPLEX_TYPE_MAPPING`` (and Enums), TypedDicts,
+    dataclasses and NamedTuples (as objects), ``Iterable``/``list``/``set``/``tuple``
+    generics, ``dict[str, ...]``, ``Optional``/``Union`` and ``Literal``.
+    Other types are ``Any``.
+
+    >>> from dataclasses import dataclass
+    >>> from typing import Literal, Optional
+    >>> @dataclass
+    ... class Item:
+    ...     name: str
+    ...     tags: Optional[list[str]] = None
+    >>> mk_schema_from_type(dict[str, Item])  # doctest: +NORMALIZE_WHITESPACE
+    {'type': <class 'dict'>,
+     'additionalProperties': {'type': <class 'dict'>,
+        'properties': {'name': {'type': <class 'str'>},
+                       'tags': {'type': <class 'list'>,
+                                'items': {'type': <class 'str'>},
+                                'nullable': True,
+                                'default': None}},
+        'required': ['name']}}
+    >>> mk_schema_from_type(Literal['asc', 'desc'])
+    {'type': <class 'str'>, 'enum': ['asc', 'desc']}
+    """
+    return _mk_schema_from_type(obj_type, ())
+
+
+def _mk_schema_from_type(obj_type, parents):
+    # parents: the models obj_type is a field of (to not recurse forever on recursive
+    # models, which are then just described as objects)
+    if obj_type in JSON_TYPES or complex_type_schema(obj_type) is not None:
+        return {'type': obj_type}
+    if isinstance(obj_type, _TypedDictMeta) or is_model(obj_type):
+        if obj_type in parents:
+            return {'type': dict}
+        parents = parents + (obj_type,)
+        if isinstance(obj_type, _TypedDictMeta):
+            properties, required = _mk_typed_dict_fields_schema(obj_type, parents)
+        else:
+            properties, required = _mk_model_fields_schema(obj_type, parents)
+        schema = {'type': dict, 'properties': properties}
+        if required:
+            schema['required'] = required
+        return schema
+
+    origin, args = get_origin(obj_type), get_args(obj_type)
+    if origin is Union:
+        non_none_args = [arg for arg in args if arg is not type(None)]
+        if len(non_none_args) == 1:
+            schema = _mk_schema_from_type(non_none_args[0], parents)
+        else:
+            schema = {
+                'type': Any,
+                'anyOf': [_mk_schema_from_type(arg, parents) for arg in non_none_args],
+            }
+        if len(non_none_args) < len(args):
+            schema = dict(schema, nullable=True)
+        return schema
+    if origin is Literal:
+        schema = {'type': Any, 'enum': list(args)}
+        value_types = {type(arg) for arg in args}
+        if len(value_types) == 1 and value_types <= set(JSON_TYPES):
+            schema['type'] = value_types.pop()
+        return schema
+    if origin in _list_origins or origin is tuple:
+        schema = {'type': list}
+        if origin is tuple and not (len(args) == 2 and args[1] is ...):
+            args = ()  # a fixed-length tuple: items of different types
+        if args:
+            schema['items'] = _mk_schema_from_type(args[0], parents)
+        return schema
+    if origin in _dict_origins:
+        schema = {'type': dict}
+        if len(args) == 2 and args[1] is not Any:
+            schema['additionalProperties'] = _mk_schema_from_type(args[1], parents)
+        return schema
+    return {'type': Any}
+
+
+_list_origins = {
+    list,
+    set,
+    frozenset,
+    abc.Iterable,
+    abc.Sequence,
+    abc.MutableSequence,
+    abc.Collection,
+    abc.Set,
+    abc.MutableSet,
+}
+_dict_origins = {dict, abc.Mapping, abc.MutableMapping}
+
+
+def _mk_typed_dict_fields_schema(typed_dict, parents):
+    total = getattr(typed_dict, '__total__', False)
+    properties, required = {}, []
+    for key, value in type_hints(typed_dict).items():
+        properties[key] = _mk_schema_from_type(value, parents)
+        optional = get_origin(value) is Union and type(None) in get_args(value)
         if total and not optional:
-            required_properties.append(key)
-        if value in JSON_TYPES:
-            properties[key]['type'] = value
-        elif getattr(value, '_name', None) == 'Iterable':
-            properties[key]['type'] = list
-            properties[key]['items'] = mk_sub_list_schema_from_iterable(value)
-        elif isinstance(value, _TypedDictMeta):
-            properties[key]['type'] = dict
-            (
-                sub_dict_props,
-                sub_dict_required_props,
-            ) = mk_sub_dict_schema_from_typed_dict(value)
-            properties[key]['properties'] = sub_dict_props
-            if sub_dict_required_props:
-                properties[key]['required'] = sub_dict_required_props
-
-    properties = {}
-    for key, value in typed_dict.__annotations__.items():
-        properties[key] = {}
-        properties[key]['type'] = Any
-        set_property(key, value)
-    return properties, required_properties
+            required.append(key)
+    return properties, required
+
+
+def _mk_model_fields_schema(model, parents):
+    properties, required = {}, []
+    for key, (value, default) in model_fields(model).items():
+        properties[key] = _mk_schema_from_type(value, parents)
+        if default is Parameter.empty:
+            required.append(key)
+        elif isinstance(default, _json_literal_types):
+            properties[key] = dict(properties[key], default=default)
+    return properties, required
+
+
+def mk_sub_dict_schema_from_typed_dict(typed_dict):
+    """The ``(properties, required_properties)`` of the schema of a TypedDict"""
+    schema = mk_schema_from_type(typed_dict)
+    return schema['properties'], schema.get('required', [])
 
 
 def mk_sub_list_schema_from_iterable(iterable_type):
-    result = {}
-    items_type = iterable_type.__args__[0]
-    if type(items_type) == _TypedDictMeta:
-        result['type'] = dict
-        sub_dict_props, sub_dict_required = mk_sub_dict_schema_from_typed_dict(
-            items_type
-        )
-        result['properties'] = sub_dict_props
-        if sub_dict_required:
-            result['required'] = sub_dict_required
-    elif getattr(items_type, '_name', None) == 'Iterable':
-        result['type'] = list
-        result['items'] = mk_sub_list_schema_from_iterable(items_type)
-    elif items_type in JSON_TYPES:
-        result['type'] = items_type
-    else:
-        result['type'] = Any
-    return result
+    """The schema of the items of an iterable type"""
+    return mk_schema_from_type(iterable_type).get('items', {'type': Any})
 
 
 # changes: simplified from sig.parameters[key] to looping over items of parameters
@@ -111,13 +348,31 @@ def mk_input_schema_from_func(func, exclude_keys=None, include_func_params=False
     ...        'z': {'type': int, 'default': 1}},
     ...     'required': ['x']}
     >>> assert got == expected, f"\\n  expected {expected}\\n  got {got}"
+
+    Schemas are cached by signature, so functions with the same signature share the
+    same schema (which should therefore not be mutated).
+
+    >>> def mult2(x: float, y=1, z: int=1):
+    ...     return 2 * (x * y) ** z
+    >>> assert mk_input_schema_from_func(mult2) is got
     """
-    if not exclude_keys:
-        exclude_keys = {}
+    sig = signature(func)
+    if include_func_params:  # Parameter objects are part of the schema: don't share
+        return _mk_input_schema_from_sig.__wrapped__(sig, exclude_keys or (), (), True)
+    # Note: default types are part of the key since equal defaults (e.g. 1 and True)
+    # can be of different types, and lead to different schemas
+    default_types = tuple(type(p.default) for p in sig.parameters.values())
+    return _mk_input_schema_from_sig(sig, frozenset(exclude_keys or ()), default_types)
+
+
+@cache_schemas
+def _mk_input_schema_from_sig(
+    sig, exclude_keys, default_types, include_func_params=False
+):
     input_properties = {}
     required_properties = []
     input_schema = {'type': dict, 'properties': input_properties}
-    params = signature(func).parameters
+    params = sig.parameters
     for key, param in params.items():
         if key in exclude_keys:
             continue
@@ -142,21 +397,10 @@ def mk_input_schema_from_func(func, exclude_keys=None, include_func_params=False
 
         arg_type = default_type  # TODO: Not used. Check why (seems the if clause does covers all)
         if param.annotation != Signature.empty:
-            arg_type = param.annotation
-            if isinstance(arg_type, _TypedDictMeta):
-                (
-                    sub_dict_props,
-                    sub_dict_required,
-                ) = mk_sub_dict_schema_from_typed_dict(arg_type)
-                p['properties'] = sub_dict_props
-                if sub_dict_required:
-                    p['required'] = sub_dict_required
-                arg_type = dict
-            elif getattr(arg_type, '_name', None) == 'Iterable':
-                p['items'] = mk_sub_list_schema_from_iterable(arg_type)
-                arg_type = list
-            elif arg_type not in JSON_TYPES and not COMPLEX_TYPE_MAPPING.get(arg_type):
-                arg_type = default_type
+            type_schema = mk_schema_from_type(param.annotation)
+            if type_schema != {'type': Any}:
+                p.update(type_schema)
+                arg_type = type_schema['type']
         p['type'] = arg_type
 
         if include_func_params:
@@ -169,23 +413,17 @@ def mk_input_schema_from_func(func, exclude_keys=None, include_func_params=False
 
 
 def mk_output_schema_from_func(func):
-    result = {}
-    sig = signature(func)
-    output_type = sig.return_annotation
-    # print(f'output_type: {output_type}')  # TODO: Remove: Use conditional logging instead
+    return _mk_output_schema_from_type(signature(func).return_annotation)
+
+
+@cache_schemas
+def _mk_output_schema_from_type(output_type):
     if output_type in [Signature.empty, Any]:
         return {}
-    if isinstance(output_type, _TypedDictMeta):
-        result['type'] = dict
-        result['properties'] = mk_sub_dict_schema_from_typed_dict(output_type)[0]
-    elif getattr(output_type, '_name', None) == 'Iterable':
-        result['type'] = list
-        result['items'] = mk_sub_list_schema_from_iterable(output_type)
-    elif output_type not in JSON_TYPES and not COMPLEX_TYPE_MAPPING.get(output_type):
+    schema = mk_schema_from_type(output_type)
+    if schema == {'type': Any}:
         return {}
-    else:
-        result['type'] = output_type
-    return result
+    return schema
 
 
 def validate_input(raw_input: Any, schema: dict):
@@ -207,7 +445,14 @@ def validate_input(raw_input: Any, schema: dict):
             f'Invalid parameter "{param_path}"' if param_path else 'Invalid input'
         )
         param_type = spec.get('type', Any)
-        if param_type != Any and not isinstance(param, param_type):
+        if param is None and spec.get('nullable'):
+            return
+        if 'enum' in spec and param not in spec['enum']:
+            errors.append(f'{invalid_input_msg}. Must be one of {spec["enum"]}.')
+            return
+        if param_type not in JSON_TYPES:  # Any, or a complex type: still a JSON value
+            return
+        if not isinstance(param, param_type):
             errors.append(
                 f'{invalid_input_msg}. Must be of type "{param_type.__name__}".'
             )
@@ -0,0 +1,73 @@
+"""Compact binary serialization formats (MessagePack, CBOR, and numpy's npy for
+arrays) for requests and responses.
+
+Both have the same data model as JSON (so the same schemas describe them), but are
+smaller and faster to parse, especially for numeric data, and, contrary to pickle, are
+safe to decode from untrusted clients. Their packages are optional dependencies:
+
+    pip install py2http[msgpack]  # or py2http[cbor], or py2http[numpy]
+
+Values that the formats don't support natively (datetimes, Decimals, dataclasses,
+numpy arrays...) are encoded with the codecs of `py2http.coercion`."""
+
+from importlib import import_module
+from io import BytesIO
+
+from py2http.coercion import codec_for
+
+
+def _import_optional(module_name, extra):
+    try:
+        return import_module(module_name)
+    except ModuleNotFoundError as error:
+        raise ModuleNotFoundError(
+            f'{module_name} is needed for this content type: '
+            f'pip install py2http[{extra}]'
+        ) from error
+
+
+def _encode_unsupported(obj):
+    codec = codec_for(type(obj))
+    if codec is None:
+        raise TypeError(f'Object of type {type(obj).__name__} is not serializable')
+    return codec.encode(obj)
+
+
+def msgpack_dumps(obj) -> bytes:
+    """Serialize ``obj`` to MessagePack bytes"""
+    msgpack = _import_optional('msgpack', 'msgpack')
+    return msgpack.packb(obj, default=_encode_unsupported, use_bin_type=True)
+
+
+def msgpack_loads(data: bytes):
+    msgpack = _import_optional('msgpack', 'msgpack')
+    return msgpack.unpackb(data, raw=False)
+
+
+def _cbor_default(encoder, obj):
+    encoder.encode(_encode_unsupported(obj))
+
+
+def cbor_dumps(obj) -> bytes:
+    """Serialize ``obj`` to CBOR bytes (datetimes, Decimals, UUIDs... are native CBOR
+    types, so are decoded back to their type)"""
+    cbor2 = _import_optional('cbor2', 'cbor')
+    return cbor2.dumps(obj, default=_cbor_default)
+
+
+def cbor_loads(data: bytes):
+    cbor2 = _import_optional('cbor2', 'cbor')
+    return cbor2.loads(data)
+
+
+def npy_dumps(obj) -> bytes:
+    """Serialize an array (or array-like, like a list of numbers) to npy bytes"""
+    numpy = _import_optional('numpy', 'numpy')
+    buffer = BytesIO()
+    numpy.save(buffer, numpy.asarray(obj), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def npy_loads(data: bytes):
+    numpy = _import_optional('numpy', 'numpy')
+    return numpy.load(BytesIO(data), allow_pickle=False)
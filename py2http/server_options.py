@@ -0,0 +1,98 @@
+"""Tuning the HTTP server an app is run with (see `run_app`), whatever server it is.
+
+The ``server_options`` config takes options with the same names (and meaning) for all
+servers (see `ServerOptions`), translated here into those of the server (``server``
+config) running the app:
+
+======================  ============  =====================
+option                  gunicorn      waitress
+======================  ============  =====================
+``workers``             workers
+``threads``             threads       threads
+``backlog``             backlog       backlog
+``keep_alive``          keepalive     channel_timeout
+``max_request_size``                  max_request_body_size
+``read_timeout``        timeout
+======================  ============  =====================
+
+Options a server doesn't have are ignored, with a warning. Other (server specific)
+options are passed on as they are.
+
+Notes:
+
+- ``keep_alive`` is how long (in seconds) idle connections are kept open for the next
+  requests of their client; ``0`` closes connections after each response. With
+  gunicorn, connections are only kept alive by workers with ``threads`` (its sync
+  workers close them anyway).
+- waitress has a single inactivity timeout (``channel_timeout``) for idle and slow
+  connections: it's given ``keep_alive``.
+- gunicorn's ``timeout`` (given ``read_timeout``) bounds the time a worker can take to
+  read and handle a request before it's restarted.
+"""
+
+from typing import TypedDict, get_type_hints
+from warnings import warn
+
+
+class ServerOptions(TypedDict, total=False):
+    workers: int  # number of worker processes
+    threads: int  # number of threads (per worker process) handling requests
+    backlog: int  # number of connections that can wait to be accepted
+    keep_alive: float  # seconds idle connections are kept open (0: not kept open)
+    max_request_size: int  # bytes a request body can have
+    read_timeout: float  # seconds a request can take to be read (and handled)
+
+
+server_option_names = {
+    'gunicorn': {
+        'workers': 'workers',
+        'threads': 'threads',
+        'backlog': 'backlog',
+        'keep_alive': 'keepalive',
+        'read_timeout': 'timeout',
+    },
+    'waitress': {
+        'threads': 'threads',
+        'backlog': 'backlog',
+        'keep_alive': 'channel_timeout',
+        'max_request_size': 'max_request_body_size',
+    },
+}
+
+_option_types = {
+    name: (int, float) if type_ is float else type_
+    for name, type_ in get_type_hints(ServerOptions).items()
+}
+
+
+def server_kwargs(server: str, options: ServerOptions) -> dict:
+    """The keyword arguments of ``server`` for the given server ``options``
+
+    >>> server_kwargs('gunicorn', {'threads': 8, 'keep_alive': 5, 'preload_app': True})
+    {'threads': 8, 'keepalive': 5, 'preload_app': True}
+    >>> server_kwargs('waitress', {'threads': 8, 'keep_alive': 5})
+    {'threads': 8, 'channel_timeout': 5}
+    >>> server_kwargs('waitress', {'threads': '8'})
+    Traceback (most recent call last):
+      ...
+    TypeError: Server option threads must be of type int. Was: '8'
+    """
+    names = server_option_names.get(server, {})
+    kwargs = {}
+    for option, value in options.items():
+        if value is None:
+            continue
+        if option not in _option_types:  # (an option of the server)
+            kwargs[option] = value
+            continue
+        expected_type = _option_types[option]
+        if not isinstance(value, expected_type) or isinstance(value, bool):
+            type_name = getattr(expected_type, '__name__', 'number')
+            raise TypeError(
+                f'Server option {option} must be of type {type_name}. Was: {value!r}'
+            )
+        if option in names:
+            kwargs[names[option]] = value
+        else:
+            warn(f"The {server} server has no {option} option: it's ignored")
+    return kwargs
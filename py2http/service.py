@@ -17,11 +17,11 @@ with minimal setup."""
 
 import inspect
 from uuid import uuid4
-from aiohttp import web
 import asyncio
-from copy import deepcopy
 from functools import partial, wraps
-from inspect import isawaitable
+from inspect import isawaitable, iscoroutinefunction, isgenerator
+from itertools import islice
+from collections.abc import Iterator
 import json
 from typing import Any, Callable, Dict, Iterable, Optional, TypedDict, Union
 from types import FunctionType
@@ -29,34 +29,60 @@ import logging
 import os
 from bottle import Bottle, run as run_bottle
 import traceback
-from swagger_ui import api_doc
 from i2 import name_of_obj
 from i2.errors import InputError, DataError, AuthorizationError
 from i2 import Sig
 
-from py2http.bottle_plugins import CorsPlugin, OPTIONS
+from py2http.batch import BATCH_METHOD_NAME, mk_batch_openapi_path, mk_batch_route
+from py2http.bottle_plugins import CorsPlugin, PluginChain, OPTIONS
+from py2http.build_cache import BuildCache, build_key
+from py2http.coalescing import mk_coalescing_caller
+from py2http.coercion import mk_input_decoder, mk_output_encoder
+from py2http.concurrency import (
+    ConcurrencyLimiter,
+    mk_func_executor,
+    run_in_worker_loop,
+    INLINE,
+)
 from py2http.config import mk_config, FLASK, AIOHTTP, BOTTLE
 from py2http.default_configs import (
     default_configs,
     DFLT_CONTENT_TYPE,
     default_input_mapper,
+    default_output_mapper,
+)
+from py2http.negotiation import (
+    mk_negotiating_input_mapper,
+    mk_negotiating_output_mapper,
 )
 from py2http.openapi_utils import (
+    add_api_to_spec,
     add_paths_to_spec,
+    hoist_component_schemas,
     mk_openapi_path,
     mk_openapi_template,
 )
+from py2http.server_options import server_kwargs
 from py2http.schema_tools import (
     mk_input_schema_from_func,
     mk_output_schema_from_func,
 )
+from py2http.decorators import JsonLines
+from py2http.jobs import mk_job_funcs, modes
+from py2http.streaming import (
+    cancel_token_param,
+    mk_event_streamer,
+    streaming_protocols,
+)
 from py2http.util import TypeAsserter
-from py2http.constants import JSON_CONTENT_TYPE
+from py2http.constants import JSON_CONTENT_TYPE, SSE_CONTENT_TYPE
 
 obj_store = {}
 
 
 def method_not_found(method_name):
+    from aiohttp import web
+
     raise web.HTTPNotFound(
         text=json.dumps({'error': f'method {method_name} not found'}),
         content_type=JSON_CONTENT_TYPE,
@@ -77,15 +103,21 @@ def func_copy(func) -> Callable:
         func.__defaults__,
         func.__closure__,
     )
-    new_func.__dict__.update(deepcopy(func.__dict__))
+    new_func.__kwdefaults__ = func.__kwdefaults__
+    new_func.__qualname__ = func.__qualname__
+    # the metadata (annotations, attributes) is shared with func, not copied
+    new_func.__annotations__ = func.__annotations__
+    new_func.__dict__.update(func.__dict__)
     return new_func
 
 
-def mk_route(func, **configs):
+def mk_route(func, *, with_openapi_path=True, **configs):
     """
     Generate a route object and an OpenAPI path specification for a function
 
     :param func: The function
+    :param with_openapi_path: If False, the OpenAPI path is not made (None is returned
+        instead), nor the schemas it needs
 
     :Keyword Arguments: The configuration settings
     """
@@ -107,27 +139,75 @@ def mk_route(func, **configs):
         mk_config, func=func, configs=configs, defaults=default_configs
     )
     framework = _get_framework(configs, default_configs)
+    if framework == AIOHTTP:
+        from aiohttp import web
     input_mapper = config_for('input_mapper')
     output_mapper = config_for('output_mapper')
+    content_types = config_for('content_types')
+    if content_types:  # negotiate the content types (unless mappers were given)
+        if input_mapper is default_input_mapper:
+            input_mapper = mk_negotiating_input_mapper(content_types)
+        if output_mapper is default_output_mapper:
+            output_mapper = mk_negotiating_output_mapper(content_types)
     error_handler = config_for('error_handler')
     header_inputs = config_for('header_inputs', type=dict)
     logger = config_for('logger')
-
-    exclude_request_keys = header_inputs.keys()
-    request_schema = getattr(input_mapper, 'request_schema', None)
-    if request_schema is None or input_mapper.__name__ == default_input_mapper.__name__:
-        request_schema = mk_input_schema_from_func(
-            func, exclude_keys=exclude_request_keys
-        )
-    request_content_type = getattr(input_mapper, 'content_type', DFLT_CONTENT_TYPE)
-    response_schema = getattr(
-        output_mapper, 'response_schema', mk_output_schema_from_func(output_mapper),
+    max_concurrency = config_for('max_concurrency')
+    executor = config_for('executor')
+    call_func = mk_func_executor(
+        func,
+        executor,
+        max_workers=config_for('executor_max_workers'),
+        max_in_flight=config_for('executor_max_in_flight'),
+        warm=config_for('warm_executor'),
     )
-    if not response_schema:
-        response_schema = getattr(
-            func, 'response_schema', mk_output_schema_from_func(func)
+    streaming = config_for('streaming')
+    if config_for('coalesce'):
+        if streaming:
+            raise ValueError("Streamed responses can't be coalesced")
+        call_func = mk_coalescing_caller(
+            call_func,
+            is_async=iscoroutinefunction(func),
+            ttl=config_for('coalesce_ttl', type=(int, float)),
+        )
+    if streaming:
+        if streaming not in streaming_protocols:
+            raise ValueError(
+                f'streaming must be one of {streaming_protocols}. Was: {streaming}'
+            )
+        if executor != INLINE:  # (generators can't be pickled, nor need a pool)
+            raise ValueError(
+                'Streamed functions already run in a thread of their own: '
+                f'their executor must be {INLINE}. Was: {executor}'
+            )
+        call_func = mk_event_streamer(
+            func, call_func, heartbeat=config_for('sse_heartbeat', type=(int, float))
         )
-    response_content_type = getattr(output_mapper, 'content_type', DFLT_CONTENT_TYPE)
+    decode_inputs = config_for('coerce_inputs') and mk_input_decoder(func)
+    encode_output = config_for('coerce_outputs') and mk_output_encoder(func)
+    if getattr(output_mapper, 'inputs_by_ref', False):
+        map_output = output_mapper  # (the inputs are passed on as they are)
+    else:
+        map_output = lambda output, inputs: output_mapper(output, **inputs)
+
+    def on_error(error):
+        """Log the ``error`` (being handled) of a request, and return its response"""
+        if isinstance(error, (DataError, AuthorizationError, InputError)):
+            if logger:
+                level = (
+                    logging.INFO
+                    if logger.getEffectiveLevel() >= logging.INFO
+                    else logging.DEBUG
+                )
+                exc_info = level == logging.DEBUG
+                logger.log(level, traceback.format_exc(), exc_info=exc_info)
+            else:
+                print(traceback.format_exc())
+        else:
+            print(traceback.format_exc())
+            if logger:
+                logger.exception(error)
+        return error_handler(error)
 
     def handle_error(func):
         def handle_request(req):
@@ -135,23 +215,19 @@ def mk_route(func, **configs):
                 logger.debug(f'Handling {http_method.upper()} {path}')
             try:
                 return func(req)
-            except (DataError, AuthorizationError, InputError) as error:
-                if logger:
-                    level = (
-                        logging.INFO
-                        if logger.getEffectiveLevel() >= logging.INFO
-                        else logging.DEBUG
-                    )
-                    exc_info = level == logging.DEBUG
-                    logger.log(level, traceback.format_exc(), exc_info=exc_info)
-                else:
-                    print(traceback.format_exc())
-                return error_handler(error)
             except Exception as error:
-                print(traceback.format_exc())
-                if logger:
-                    logger.exception(error)
-                return error_handler(error)
+                return on_error(error)
+
+        return handle_request
+
+    def handle_async_error(func):
+        async def handle_request(req):
+            if logger:
+                logger.debug(f'Handling {http_method.upper()} {path}')
+            try:
+                return await func(req)
+            except Exception as error:
+                return on_error(error)
 
         return handle_request
 
@@ -159,25 +235,44 @@ def mk_route(func, **configs):
     def sync_handle_request(req):
         inputs = input_mapper(req)
         input_args, input_kwargs = get_input_args_and_kwargs(inputs)
-        raw_result = func(*input_args, **input_kwargs)
-        return output_mapper(raw_result, **inputs)
-
-    @handle_error
-    async def aiohttp_handle_request(req):
+        if decode_inputs:
+            input_kwargs = decode_inputs(input_kwargs)
+        raw_result = call_func(input_args, input_kwargs)
+        if encode_output:
+            raw_result = encode_output(raw_result)
+        return map_output(raw_result, inputs)
+
+    @handle_async_error
+    async def async_handle_request(req):
         inputs = input_mapper(req)
         if isawaitable(inputs):  # Pattern: pass-on async property
             inputs = await inputs
         input_args, input_kwargs = get_input_args_and_kwargs(inputs)
-        raw_result = func(*input_args, **input_kwargs)
+        if decode_inputs:
+            input_kwargs = decode_inputs(input_kwargs)
+        if executor == INLINE or streaming:
+            raw_result = call_func(input_args, input_kwargs)
+        else:  # don't block the event loop while the executor works
+            raw_result = asyncio.wrap_future(call_func.submit(input_args, input_kwargs))
         if isawaitable(raw_result):  # Pattern: pass-on async property
             raw_result = await raw_result
-        final_result = output_mapper(raw_result, **inputs)
+        if encode_output:
+            raw_result = encode_output(raw_result)
+        final_result = map_output(raw_result, inputs)
         if isawaitable(final_result):
             final_result = await final_result
+        return final_result
+
+    async def aiohttp_handle_request(req):
+        final_result = await async_handle_request(req)
         if not isinstance(final_result, web.Response):
             final_result = web.json_response(final_result)
         return final_result
 
+    # The requests of (sync) frameworks are handled in the event loop of their worker
+    # if the function or mappers are async
+    is_async = any(map(iscoroutinefunction, (func, input_mapper, output_mapper)))
+
     #  TODO: Align config keys and variable names
     valid_http_methods = {'get', 'put', 'post', 'delete'}  # outside function
     http_method = config_for('http_method')  # read
@@ -185,10 +280,36 @@ def mk_route(func, **configs):
     http_method = http_method.lower()  # normalization
     assert http_method in valid_http_methods  # validation
 
+    def mk_limiter(method_name):
+        if not max_concurrency:
+            return None
+        return ConcurrencyLimiter(
+            max_concurrency,
+            queue_timeout_ms=config_for('queue_timeout_ms'),
+            retry_after=config_for('retry_after'),
+            name=method_name,
+        )
+
     def mk_framework_route(http_method, path, method_name):
+        limiter = mk_limiter(method_name)
         if framework == AIOHTTP:
             web_mk_route = getattr(web, http_method)
-            return web_mk_route(path, aiohttp_handle_request)
+            # so that middleware can tell routes apart
+            aiohttp_handle_request.method_name = method_name
+            if limiter is None:
+                return web_mk_route(path, aiohttp_handle_request)
+
+            async def limited_aiohttp_handle_request(req):
+                # never block the event loop waiting for a slot
+                if not limiter.acquire(blocking=False):
+                    return error_handler(limiter.overloaded_error())
+                try:
+                    return await aiohttp_handle_request(req)
+                finally:
+                    limiter.release()
+
+            limited_aiohttp_handle_request.method_name = method_name
+            return web_mk_route(path, limited_aiohttp_handle_request)
         else:
             if framework == FLASK:
                 from flask import request
@@ -196,27 +317,74 @@ def mk_route(func, **configs):
                 from bottle import request
 
             def handle_request(*args):
-                result = sync_handle_request(request)
-                if isawaitable(result):
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    result = loop.run_until_complete(result)
-                return result
+                if limiter is not None and not limiter.acquire():
+                    return error_handler(limiter.overloaded_error())
+                release = limiter is not None
+                try:
+                    if is_async:
+                        result = run_in_worker_loop(async_handle_request(request))
+                    else:
+                        result = sync_handle_request(request)
+                    # (an async function, or mapper, that isn't declared so)
+                    if isawaitable(result):
+                        result = run_in_worker_loop(result)
+                    if release and streaming and isgenerator(result):
+                        # the stream runs after the request is handled: it keeps the
+                        # slot until it ends (or its client is gone)
+                        result, release = _release_when_done(result, limiter), False
+                    return result
+                finally:
+                    if release:
+                        limiter.release()
 
             handle_request.path = path
             handle_request.http_method = http_method
             handle_request.method_name = method_name
+            handle_request.limiter = limiter
             return handle_request
 
     # TODO: Make func -> path a function (not hardcoded)
     # TODO: Make sure that func -> path MAPPING is known outside (perhaps through openapi)
-    method_name = config_for('name') or func.__name__
-    path = config_for('route') or f'/{method_name}'
+    method_name = config_for('name', type=str) or func.__name__
+    path = config_for('route', type=str) or f'/{method_name}'
 
     route = mk_framework_route(http_method, path, method_name)
+    if not with_openapi_path:
+        return route, None
 
+    exclude_request_keys = set(header_inputs)
+    if streaming:
+        exclude_request_keys.add(cancel_token_param(func))
+    request_schema = getattr(input_mapper, 'request_schema', None)
+    if request_schema is None or input_mapper.__name__ == default_input_mapper.__name__:
+        request_schema = mk_input_schema_from_func(
+            func, exclude_keys=exclude_request_keys
+        )
+    request_content_type = getattr(
+        input_mapper,
+        'content_types',
+        getattr(input_mapper, 'content_type', DFLT_CONTENT_TYPE),
+    )
+    response_schema = getattr(output_mapper, 'response_schema', None)
+    if response_schema is None:
+        response_schema = mk_output_schema_from_func(output_mapper)
+    if not response_schema:
+        response_schema = getattr(func, 'response_schema', None)
+        if response_schema is None:
+            response_schema = mk_output_schema_from_func(func)
+    response_content_type = getattr(
+        output_mapper,
+        'content_types',
+        getattr(output_mapper, 'content_type', DFLT_CONTENT_TYPE),
+    )
     extra_path_info = {'description': func.__doc__ or ''}
     path_fields = dict({'x-method_name': method_name}, **extra_path_info)
+    if streaming:
+        response_content_type = SSE_CONTENT_TYPE
+        path_fields['x-streaming'] = {
+            'protocol': streaming,
+            'heartbeat': config_for('sse_heartbeat', type=(int, float)),
+        }
     openapi_path = mk_openapi_path(
         path,
         http_method,
@@ -230,17 +398,66 @@ def mk_route(func, **configs):
     return route, openapi_path
 
 
+def _funcs_to_route(funcs, configs):
+    """The functions to make routes of: those of ``funcs``, but for functions in job
+    mode, replaced by the functions of their submit, status and result routes (see
+    py2http.jobs)"""
+    for func in funcs:
+        config_for = partial(
+            mk_config, func=func, configs=configs, defaults=default_configs
+        )
+        mode = config_for('mode')
+        if not mode:
+            yield func
+            continue
+        if mode not in modes:
+            raise ValueError(f'mode must be one of {modes}. Was: {mode}')
+        method_name = config_for('name', type=str) or func.__name__
+        yield from mk_job_funcs(
+            func,
+            method_name=method_name,
+            path=config_for('route', type=str) or f'/{method_name}',
+            output_mapper=config_for('output_mapper'),
+            status_output_mapper=mk_config(
+                'output_mapper', None, configs, default_configs
+            ),
+            store=config_for('job_store'),
+            executor=config_for('job_executor'),
+            max_workers=config_for('job_max_workers'),
+            max_in_flight=config_for('job_max_in_flight'),
+        )
+
+
+def _release_when_done(body, limiter):
+    """Generate the chunks of the (streamed) ``body``, releasing the slot of the
+    ``limiter`` when it's done, or closed"""
+    try:
+        yield from body
+    finally:
+        limiter.release()
+
+
 def mk_routes_and_openapi_specs(funcs, **configs):
     routes = []
     get_config = partial(
         mk_config, func=None, configs=configs, defaults=default_configs
     )
+    funcs = list(_funcs_to_route(funcs, configs))
+    build_cache_dir = get_config('build_cache_dir')
+    if build_cache_dir:
+        build_cache = BuildCache(build_cache_dir)
+        build_cache_key = build_key(funcs, configs)
+        cached_openapi_spec = build_cache.get(build_cache_key)
+        if cached_openapi_spec is not None:
+            for func in funcs:
+                route, _ = mk_route(func, with_openapi_path=False, **configs)
+                routes.append(route)
+            return routes, cached_openapi_spec
     openapi_config = get_config('openapi', type=dict)
     if 'base_url' not in openapi_config:
-        host = get_config('host')
-        port = get_config('port')
-        protocol = 'https' if port == 443 else 'http'
-        openapi_config['base_url'] = f'{protocol}://{host}:{port}'
+        # (not modifying openapi_config, which may be shared: it's the default one if
+        # none was given)
+        openapi_config = dict(openapi_config, base_url=_base_url(configs))
     openapi_spec = mk_openapi_template(openapi_config)
     header_inputs = get_config('header_inputs')
     if header_inputs:
@@ -249,10 +466,14 @@ def mk_routes_and_openapi_specs(funcs, **configs):
         route, openapi_path = mk_route(func, **configs)
         routes.append(route)
         add_paths_to_spec(openapi_spec['paths'], openapi_path)
+    if openapi_config.get('hoist_schemas'):
+        hoist_component_schemas(openapi_spec)
     openapi_filename = openapi_config.get('filename', None)
     if openapi_filename:
         with open(openapi_filename, 'w') as fp:
             json.dump(openapi_spec, fp)
+    if build_cache_dir:
+        build_cache.set(build_cache_key, openapi_spec)
     return routes, openapi_spec
 
 
@@ -296,48 +517,112 @@ def mk_bottle_app(funcs, **configs):
 
     routes, openapi_spec = mk_routes_and_openapi_specs(funcs, **configs)
     app = Bottle(catchall=False)
-    enable_cors = mk_config('enable_cors', None, configs, default_configs)
-    plugins = mk_config('plugins', None, configs, default_configs)
-    if enable_cors:
-        cors_allowed_origins = mk_config(
-            'cors_allowed_origins', None, configs, default_configs
-        )
-        app.install(CorsPlugin(cors_allowed_origins))
-    publish_openapi = mk_config('publish_openapi', None, configs, default_configs)
-    openapi_insecure = mk_config('openapi_insecure', None, configs, default_configs)
-    publish_swagger = mk_config('publish_swagger', None, configs, default_configs)
-    if plugins:
-        for plugin in plugins:
-            app.install(plugin)
+    app.limiters = add_api_to_bottle_app(app, routes, openapi_spec, **configs)
+    app.openapi_spec = openapi_spec
+    return app
+
+
+def _chained_plugins(configs, *, cors_only=False):
+    """The plugins (the CORS one first, if enabled) to chain on the routes of an API"""
+    get_config = partial(
+        mk_config, func=None, configs=configs, defaults=default_configs
+    )
+    plugins = [] if cors_only else list(get_config('plugins') or [])
+    if get_config('enable_cors'):
+        plugins.insert(0, CorsPlugin(get_config('cors_allowed_origins')))
+    return plugins
+
+
+def add_api_to_bottle_app(app, routes, openapi_spec, prefix='', **configs):
+    """Add the routes of an API (and its ping, batch, openapi and swagger routes) to a
+    bottle ``app``, under ``prefix``, and return the concurrency limiters of its routes.
+
+    The plugins of the configs are installed in the app if there's no prefix, and
+    applied to the routes of the API only otherwise, so that the APIs of a (flat)
+    multi-API app can have plugins of their own.
+    """
+    get_config = partial(
+        mk_config, func=None, configs=configs, defaults=default_configs
+    )
+    enable_cors = get_config('enable_cors')
+    plugins = get_config('plugins')
+    chained_plugins = _chained_plugins(configs)
+    publish_openapi = get_config('publish_openapi')
+    openapi_insecure = get_config('openapi_insecure')
+    publish_swagger = get_config('publish_swagger')
+    apply = []
+    if chained_plugins:
+        # a single wrapper per route for all of them (see PluginChain)
+        chain = PluginChain(chained_plugins)
+        if prefix:
+            chain.setup(app)
+            apply = [chain]
+        else:
+            app.install(chain)
     for route in routes:
         route_http_method = route.http_method.upper()
         http_methods = (
             route.http_method if not enable_cors else [OPTIONS, route_http_method]
         )
         # print(f'Mounting route: {route.path} {route.http_method.upper()}')
-        app.route(route.path, http_methods, route, route.method_name)
+        app.route(
+            prefix + route.path, http_methods, route, route.method_name, apply=apply
+        )
     app.route(
-        path='/ping', callback=lambda: {'ping': 'pong'}, name='ping', skip=plugins
+        path=prefix + '/ping',
+        callback=lambda: {'ping': 'pong'},
+        name='ping',
+        apply=apply,
+        skip=plugins,
     )
+    if get_config('publish_batch'):
+        batch_url = get_config('batch_url')
+        bottle_routes = {
+            (bottle_route.rule, bottle_route.method): bottle_route
+            for bottle_route in app.routes
+        }
+        batch_route = mk_batch_route(
+            {
+                route.method_name: bottle_routes[
+                    prefix + route.path, route.http_method.upper()
+                ]
+                for route in routes
+            },
+            get_config('error_handler'),
+            max_calls=get_config('batch_max_calls'),
+            max_workers=get_config('batch_max_workers'),
+        )
+        app.route(
+            prefix + batch_url, 'POST', batch_route, BATCH_METHOD_NAME, apply=apply
+        )
+        add_paths_to_spec(
+            openapi_spec['paths'],
+            mk_batch_openapi_path(batch_url, [route.method_name for route in routes]),
+        )
     if publish_openapi:
         skip = plugins if openapi_insecure else None
         app.route(
-            path='/openapi', callback=lambda: openapi_spec, name='openapi', skip=skip,
+            path=prefix + '/openapi',
+            callback=lambda: openapi_spec,
+            name='openapi',
+            apply=apply,
+            skip=skip,
         )
-    app.openapi_spec = openapi_spec
     if publish_swagger:
-        swagger_url = mk_config('swagger_url', None, configs, default_configs)
-        swagger_title = mk_config('swagger_title', None, configs, default_configs)
+        from swagger_ui import api_doc
+
         api_doc(
             app,
             config_spec=json.dumps(openapi_spec),
-            url_prefix=swagger_url,
-            title=swagger_title,
+            url_prefix=prefix + get_config('swagger_url'),
+            title=get_config('swagger_title'),
         )
-    return app
+    return {route.method_name: route.limiter for route in routes if route.limiter}
 
 
 def mk_aiohttp_app(funcs, **configs):
+    from aiohttp import web
+
     routes, openapi_spec = mk_routes_and_openapi_specs(funcs, **configs)
     middleware = mk_config('middleware', None, configs, default_configs)
     app = web.Application(middlewares=middleware)
@@ -424,10 +709,23 @@ def mk_app(app_spec: AppSpec, **configs):
     ...     'bar_api': [bar],
     ... }
     >>> app = mk_app(handler_spec, publish_openapi=True)
-    >>> app.get_url('/foo_api')
-    '/foo_api'
-    >>> app.get_url('/bar_api')
-    '/bar_api'
+    >>> app.get_url('/foo_api/foo')
+    '/foo_api/foo'
+    >>> app.get_url('/bar_api/bar')
+    '/bar_api/bar'
+
+    The routes of all the APIs are in the same app (under the prefix of their API),
+    which publishes an OpenAPI spec of all of them, and one of each API.
+
+    >>> list(app.openapi_spec['paths'])
+    ['/foo_api/foo', '/bar_api/bar']
+    >>> list(app.openapi_specs['/bar_api']['paths'])
+    ['/bar']
+
+    Each API can also have its own configs, with
+    ``{'handlers': [...], 'config': {...}}`` specs (instead of lists of handlers).
+    With ``mount_sub_apps=True``, an app is made for each API, and mounted in a parent
+    app.
 
     :param handler_spec: The handler specification. Can be a list of python to expose,
     or a dict with a list of functions to expose per route in case of a multi-service
@@ -438,9 +736,12 @@ def mk_app(app_spec: AppSpec, **configs):
     :type **configs: dict
     """
 
-    def mk_single_api_app():
+    def handlers_and_configs(handlers_spec, base_configs):
+        """The functions of the handlers of an API, and the configs of the API (with
+        the mappers of the handlers given with theirs)"""
+
         def add_mappers_to_config():
-            handlers_with_mappers = [x for x in app_spec if isinstance(x, dict)]
+            handlers_with_mappers = [x for x in handlers_spec if isinstance(x, dict)]
             input_mappers = {}
             output_mappers = {}
             for handler in handlers_with_mappers:
@@ -458,59 +759,116 @@ def mk_app(app_spec: AppSpec, **configs):
                 app_configs['output_mapper'] = output_mappers
 
         def gen_handlers():
-            for handler in app_spec:
+            for handler in handlers_spec:
                 if isinstance(handler, dict):
                     yield _get_func_to_dispatch_handler(handler)
                 else:
                     yield handler
 
-        app_configs = dict(configs)
+        app_configs = dict(base_configs)
         handlers = list(gen_handlers())
         # print(f"{app_spec=}\n{handlers}")
         add_mappers_to_config()
+        return handlers, app_configs
+
+    def mk_single_api_app():
+        handlers, app_configs = handlers_and_configs(app_spec, configs)
         if framework == FLASK:
             return mk_flask_app(handlers, **app_configs)
         if framework == BOTTLE:
             return mk_bottle_app(handlers, **app_configs)
         return mk_aiohttp_app(handlers, **app_configs)
 
+    def gen_apis():
+        """The prefix, handlers and configs of each API of the (multi-API) app"""
+        for route, route_spec in app_spec.items():
+            if isinstance(route_spec, dict):
+                handlers = route_spec['handlers']
+                base_configs = route_spec['config']
+            else:
+                handlers = route_spec
+                base_configs = configs
+            prefix = '/' + route.strip('/')
+            # The configs of the API are an overlay on the base ones: what differs
+            # is set in new dicts, and the rest (plugins, loggers, mappers...) is shared
+            # by all APIs, neither copied nor modified.
+            openapi_config = base_configs.get('openapi') or {}
+            base_url = openapi_config.get('base_url') or _base_url(configs)
+            api_configs = dict(
+                base_configs, openapi=dict(openapi_config, base_url=base_url + prefix)
+            )
+            yield prefix, handlers, api_configs
+
+    def mk_flat_multi_api_app():
+        """A bottle app with the routes of all the APIs, under their prefix (rather
+        than an app per API, mounted in a parent app, which costs a prefix-matching
+        hop per request, and a whole app, plugin stack and spec per API)"""
+        get_config = partial(
+            mk_config, func=None, configs=configs, defaults=default_configs
+        )
+        app = Bottle(catchall=False)
+        openapi_config = get_config('openapi', type=dict)
+        openapi_spec = mk_openapi_template(
+            dict({'base_url': _base_url(configs)}, **openapi_config)
+        )
+        app.openapi_specs = {}
+        app.limiters = {}
+        for prefix, handler_specs, base_configs in gen_apis():
+            handlers, api_configs = handlers_and_configs(handler_specs, base_configs)
+            routes, api_openapi_spec = mk_routes_and_openapi_specs(
+                handlers, **api_configs
+            )
+            limiters = add_api_to_bottle_app(
+                app, routes, api_openapi_spec, prefix, **api_configs
+            )
+            app.limiters.update(
+                {f'{prefix}/{name}': limiter for name, limiter in limiters.items()}
+            )
+            app.openapi_specs[prefix] = api_openapi_spec
+            add_api_to_spec(openapi_spec, api_openapi_spec, prefix)
+        if get_config('publish_openapi'):
+            # (guarded by the top-level plugins, as it describes all the APIs)
+            plugins = _chained_plugins(
+                configs, cors_only=get_config('openapi_insecure')
+            )
+            apply = []
+            if plugins:
+                chain = PluginChain(plugins)
+                chain.setup(app)
+                apply = [chain]
+            app.route(
+                path='/openapi',
+                callback=lambda: openapi_spec,
+                name='openapi',
+                apply=apply,
+            )
+        app.openapi_spec = openapi_spec
+        return app
+
     def mk_multi_api_app():
         def get_web_framework_objects():
             if framework == BOTTLE:
                 app = Bottle(catchall=False)
                 return app, app.mount
             elif framework == AIOHTTP:
+                from aiohttp import web
+
                 app = web.Application()
                 return app, app.add_subapp
             return None
 
         parent_app, add_subapp_meth = get_web_framework_objects()
-        for route, route_spec in app_spec.items():
-            if isinstance(route_spec, dict):
-                handlers = route_spec['handlers']
-                subapp_configs = route_spec['config']
-            else:
-                handlers = route_spec
-                subapp_configs = deepcopy(configs)
-            if 'openapi' not in subapp_configs:
-                subapp_configs['openapi'] = {}
-            if 'base_url' not in subapp_configs['openapi']:
-                get_config = partial(
-                    mk_config, func=None, configs=configs, defaults=default_configs
-                )
-                host = get_config('host')
-                port = get_config('port')
-                protocol = 'https' if port == 443 else 'http'
-                subapp_configs['openapi']['base_url'] = f'{protocol}://{host}:{port}'
-            subapp_configs['openapi']['base_url'] = (
-                subapp_configs['openapi']['base_url'] + route
-            )
-            subapp = mk_app(handlers, **subapp_configs)
-            add_subapp_meth(route, subapp)
+        for prefix, handlers, api_configs in gen_apis():
+            subapp = mk_app(handlers, **api_configs)
+            add_subapp_meth(prefix, subapp)
         return parent_app
 
     framework = _get_framework(configs, default_configs)
     if isinstance(app_spec, dict):
+        if framework == BOTTLE and not mk_config(
+            'mount_sub_apps', None, configs, default_configs
+        ):
+            return mk_flat_multi_api_app()
         return mk_multi_api_app()
     return mk_single_api_app()
 
@@ -539,6 +897,8 @@ def run_app(app_obj: Union[AppSpec, Any], **configs):
         if framework == BOTTLE:
             return run_bottle
         elif framework == AIOHTTP:
+            from aiohttp import web
+
             return web.run_app
         raise NotImplementedError('')
 
@@ -555,6 +915,7 @@ def run_app(app_obj: Union[AppSpec, Any], **configs):
         server = get_config('server')
         ssl_certfile = get_config('ssl_certfile')
         ssl_keyfile = get_config('ssl_keyfile')
+        server_options = get_config('server_options', type=dict)
 
         # run_func(app_obj, host=host, port=port, ssl_context=ssl_context, server='gunicorn')
         run_func(
@@ -564,9 +925,20 @@ def run_app(app_obj: Union[AppSpec, Any], **configs):
             server=server,
             certfile=ssl_certfile,
             keyfile=ssl_keyfile,
+            **server_kwargs(server, server_options),
         )
 
 
+def _base_url(configs):
+    get_config = partial(
+        mk_config, func=None, configs=configs, defaults=default_configs
+    )
+    host = get_config('host')
+    port = get_config('port')
+    protocol = 'https' if port == 443 else 'http'
+    return f'{protocol}://{host}:{port}'
+
+
 def _get_framework(configs, default_configs):
     framework = mk_config('framework', None, configs, default_configs)
     # NOTE Only support Bottle until we redesign py2http using a reusable tool for routing
@@ -587,6 +959,7 @@ def _get_func_to_dispatch_handler(handler):
     if not name:
         raise InputError('No way to determine name of handler')
     attr_names = handler.get('attr_names')
+    bulk_methods = handler.get('bulk_methods') or {}
     if attr_names is None:
         # TODO: This is a hack! Address the problem in a cleaner way.
         #   This hack is just completing some unclean handling of names already present
@@ -603,7 +976,14 @@ def _get_func_to_dispatch_handler(handler):
     if inspect.isclass(endpoint):
         cls = endpoint
 
-        def func(_obj_id=None, _attr_name=None, **kwargs):
+        def func(
+            _obj_id=None,
+            _attr_name=None,
+            _limit: int = None,
+            _cursor: str = None,
+            _stream: bool = False,
+            **kwargs,
+        ):
             if _obj_id is None:
                 if _attr_name is not None:
                     raise InputError('_attr_name must be None when _obj_id is None')
@@ -616,19 +996,177 @@ def _get_func_to_dispatch_handler(handler):
                 raise InputError(f'No object found with id {_obj_id}')
             if _attr_name is None:
                 raise InputError('_attr_name must be provided when _obj_id is not None')
-            return _get_attr_value(obj, _attr_name, attr_names, **kwargs)
+            result = _get_attr_value(
+                obj, _attr_name, attr_names, bulk_methods, **kwargs
+            )
+            return _page_or_stream(result, _limit, _cursor, _stream)
 
     else:
 
-        def func(_attr_name=None, **kwargs):
-            return _get_attr_value(endpoint, _attr_name, attr_names, **kwargs)
+        def func(
+            _attr_name=None,
+            _limit: int = None,
+            _cursor: str = None,
+            _stream: bool = False,
+            **kwargs,
+        ):
+            result = _get_attr_value(
+                endpoint, _attr_name, attr_names, bulk_methods, **kwargs
+            )
+            return _page_or_stream(result, _limit, _cursor, _stream)
 
     func.__name__ = name
     return func
 
 
-def _get_attr_value(obj, attr_name, valid_attr_names, **kwargs):
+def _paginate(iterable, limit, cursor=None):
+    """Get a page of ``limit`` items of ``iterable``, starting at ``cursor``.
+    Only the items of the page (plus one, to know if there's a next page) are
+    kept, so memory stays bounded whatever the size of ``iterable``.
+
+    The cursor is an offset: lists are sliced, but iterators (made anew by each
+    request) are consumed from their start up to the page. Walking through ``n`` items
+    of an iterator therefore takes ``O(n**2 / limit)`` steps, and redoes the side
+    effects of the items before the page (like queries), for every page.
+
+    >>> _paginate(iter('abcde'), limit=2)
+    {'items': ['a', 'b'], 'cursor': '2'}
+    >>> _paginate(iter('abcde'), limit=2, cursor='4')
+    {'items': ['e'], 'cursor': None}
+    """
+    try:
+        start = int(cursor) if cursor else 0
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise InputError(f'Invalid pagination: limit={limit!r}, cursor={cursor!r}')
+    if start < 0 or limit <= 0:
+        raise InputError(f'Invalid pagination: limit={limit!r}, cursor={cursor!r}')
+    if isinstance(iterable, list):
+        items = iterable[start : start + limit + 1]
+    else:
+        items = list(islice(iterable, start, start + limit + 1))
+    next_cursor = str(start + limit) if len(items) > limit else None
+    return {'items': items[:limit], 'cursor': next_cursor}
+
+
+def _page_or_stream(result, limit=None, cursor=None, stream=False):
+    """Prepare the result of a dispatched attribute for the response: Iterators and
+    lists can be paginated (if a ``limit`` is given) or streamed as JSON lines (if
+    ``stream`` is True). Other iterators are gathered in a list.
+
+    >>> _page_or_stream(iter([1, 2, 3]))
+    [1, 2, 3]
+    >>> _page_or_stream(iter([1, 2, 3]), limit=2)
+    {'items': [1, 2], 'cursor': '2'}
+    >>> _page_or_stream([1, 2, 3], limit=2, cursor='2')
+    {'items': [3], 'cursor': None}
+    >>> list(_page_or_stream(iter([1, 2]), stream=True).lines())
+    ['1\\n', '2\\n']
+    >>> _page_or_stream('not paginated', limit=2)
+    'not paginated'
+    """
+    if isinstance(result, (Iterator, list)):
+        if stream:
+            return JsonLines(result)
+        if limit is not None:
+            return _paginate(result, limit, cursor)
+        if isinstance(result, Iterator):
+            return list(result)
+    return result
+
+
+def _getmany(obj, keys):
+    """Get the values of several keys of ``obj``, in order (``None`` for missing keys)
+
+    >>> _getmany({'a': 1, 'b': 2}, ['b', 'c', 'a'])
+    [2, None, 1]
+    """
+    values = []
+    for key in keys:
+        try:
+            values.append(obj[key])
+        except KeyError:
+            values.append(None)
+    return values
+
+
+def _setmany(obj, items):
+    """Set several ``(key, value)`` items (given as a dict or pairs) of ``obj``,
+    returning the number of items written
+
+    >>> d = {}
+    >>> _setmany(d, {'a': 1, 'b': 2})
+    2
+    >>> d
+    {'a': 1, 'b': 2}
+    """
+    if isinstance(items, dict):
+        items = items.items()
+    n = 0
+    for key, value in items:
+        obj[key] = value
+        n += 1
+    return n
+
+
+# Bulk operations that can be dispatched on any object supporting item access, with
+# the name of the argument holding the keys/items of the operation.
+bulk_ops = {
+    'getmany': (_getmany, 'keys'),
+    'setmany': (_setmany, 'items'),
+}
+
+
+def _call_bulk_op(obj, op_name, bulk_methods, **kwargs):
+    """Call a bulk operation on ``obj``, using the store's native bulk method if
+    ``bulk_methods`` specifies one (by name, or as a ``(obj, arg)`` callable)."""
+    op, arg_name = bulk_ops[op_name]
+    if arg_name not in kwargs:
+        raise InputError(f'Missing argument "{arg_name}" for {op_name}')
+    arg = kwargs[arg_name]
+    native = bulk_methods.get(op_name)
+    if native is None:
+        return op(obj, arg)
+    if isinstance(native, str):
+        return getattr(obj, native)(arg)
+    return native(obj, arg)
+
+
+def _get_attr_value(obj, attr_name, valid_attr_names, bulk_methods=None, /, **kwargs):
+    """Get the value of (or call) the attribute of ``obj``, if it's dispatched.
+
+    Bulk operations (``getmany`` and ``setmany``) can be dispatched on any object with
+    item access (``obj[key]``), to get or set many items in a single request.
+
+    >>> store = {'a': 1, 'b': 2}
+    >>> attr_names = ['__len__', 'getmany', 'setmany']
+    >>> _get_attr_value(store, '__len__', attr_names)
+    2
+    >>> _get_attr_value(store, 'getmany', attr_names, keys=['a', 'b'])
+    [1, 2]
+    >>> _get_attr_value(store, 'setmany', attr_names, items={'c': 3, 'd': 4})
+    2
+    >>> sorted(store)
+    ['a', 'b', 'c', 'd']
+
+    If the store has its own (faster) bulk methods, you can use those instead:
+
+    >>> class Store(dict):
+    ...     def mget(self, keys):
+    ...         print('native mget')
+    ...         return [self.get(k) for k in keys]
+    >>> bulk_methods = {'getmany': 'mget'}
+    >>> _get_attr_value(Store(a=1), 'getmany', attr_names, bulk_methods, keys=['a', 'z'])
+    native mget
+    [1, None]
+    """
     valid_attr_names = [attr_name] if valid_attr_names == '*' else valid_attr_names
+    if (
+        attr_name in bulk_ops
+        and attr_name in valid_attr_names
+        and not hasattr(obj, attr_name)
+    ):
+        return _call_bulk_op(obj, attr_name, bulk_methods or {}, **kwargs)
     if attr_name not in valid_attr_names or not hasattr(obj, attr_name):
         raise InputError(
             f'No attribute found with name {attr_name} or it is not dispatched'
@@ -0,0 +1,240 @@
+"""Streaming the results of long-running functions to clients, as Server-Sent Events.
+
+With ``mk_app(funcs, streaming={'train': 'sse'})`` (or a ``streaming = 'sse'``
+attribute on the function), what the ``train`` (generator) function yields (progress,
+partial results...) is pushed to the client as it's produced, as ``text/event-stream``
+events:
+
+    data: {"epoch": 1, "loss": 0.5}
+
+    data: {"epoch": 2, "loss": 0.25}
+
+    event: end
+    data: null
+
+instead of the client waiting (or timing out, or polling) for the whole result. An
+exception raised by the function ends the stream with an ``error`` event.
+
+The function runs in a producer thread of its own, so that heartbeats (comment lines,
+every ``sse_heartbeat`` seconds without events) keep the connection alive, and tell
+when the client is gone: the stream is then cancelled, which propagates into the
+function. Sync generators are closed (``GeneratorExit`` is raised where they yield),
+async ones are cancelled (``CancelledError`` is raised where they await), and functions
+with a parameter annotated with `CancelToken` are given one, to check (or wait on)
+between the long steps that don't yield.
+
+Streaming routes are described in the OpenAPI spec with an ``x-streaming`` extension:
+``{'protocol': 'sse', 'heartbeat': 15}``.
+"""
+
+import asyncio
+from inspect import signature
+import json
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from typing import Callable, Iterable, Optional
+
+from bottle import response
+
+from py2http.constants import SSE_CONTENT_TYPE
+
+SSE = 'sse'
+streaming_protocols = (SSE,)
+DFLT_SSE_HEARTBEAT = 15
+DFLT_MAX_QUEUED_EVENTS = 100
+
+_END, _ERROR = object(), object()
+
+
+class CancelToken:
+    """Tells a function that what it's computing isn't needed anymore (the client of
+    its stream is gone)
+
+    >>> token = CancelToken()
+    >>> token.add_callback(lambda: print('cancelled!'))
+    >>> token.cancelled
+    False
+    >>> token.cancel()
+    cancelled!
+    >>> token.cancelled, token.wait(timeout=0)
+    (True, True)
+    """
+
+    def __init__(self):
+        self._event = Event()
+        self._callbacks = []
+        self._lock = Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait (at most ``timeout`` seconds) for a cancellation. Return whether there
+        was one."""
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable):
+        """Call ``callback()`` on cancellation (now, if it was cancelled already)"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def sse_event(data, event: Optional[str] = None, *, encode=json.dumps) -> str:
+    r"""The text of a Server-Sent Event
+
+    >>> sse_event({'progress': 0.5})
+    'data: {"progress": 0.5}\n\n'
+    >>> sse_event('multi\nline', event='log')
+    'event: log\ndata: "multi\\nline"\n\n'
+    """
+    lines = [f'event: {event}\n'] if event else []
+    lines.extend(f'data: {line}\n' for line in encode(data).split('\n'))
+    return ''.join(lines) + '\n'
+
+
+class EventStream:
+    """Wraps what a function yields (an iterable, or async iterable) to indicate that it
+    should be streamed to the client as Server-Sent Events (see the module docs).
+
+    >>> def count(n):
+    ...     yield from range(n)
+    >>> list(EventStream(count(2)).events())
+    ['data: 0\\n\\n', 'data: 1\\n\\n', 'event: end\\ndata: null\\n\\n']
+    """
+
+    def __init__(
+        self,
+        iterable: Iterable,
+        *,
+        heartbeat: float = DFLT_SSE_HEARTBEAT,
+        cancel: Optional[CancelToken] = None,
+        max_queued: int = DFLT_MAX_QUEUED_EVENTS,
+    ):
+        self.iterable = iterable
+        self.heartbeat = heartbeat
+        self.cancel = cancel or CancelToken()
+        self.max_queued = max_queued
+
+    def events(self):
+        """Generate the events of the stream (and heartbeats), as they're produced.
+        Closing the generator (as servers do when the client is gone) cancels the
+        stream."""
+        from py2http.decorators import JsonRespEncoder
+
+        encode = JsonRespEncoder().encode
+        queue = Queue(self.max_queued)
+        Thread(target=self._produce, args=(queue,), daemon=True).start()
+        try:
+            while True:
+                try:
+                    kind, item = queue.get(timeout=self.heartbeat)
+                except Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                if kind is _END:
+                    yield sse_event(None, 'end', encode=encode)
+                    return
+                if kind is _ERROR:
+                    yield sse_event({'error': str(item)}, 'error', encode=encode)
+                    return
+                yield sse_event(item, encode=encode)
+        finally:  # (done, or the client is gone)
+            self.cancel.cancel()
+
+    def respond(self):
+        """The body of the (bottle) response streaming the events"""
+        response.content_type = SSE_CONTENT_TYPE
+        response.set_header('Cache-Control', 'no-cache')
+        response.set_header('X-Accel-Buffering', 'no')  # (not buffered by proxies)
+        return self.events()
+
+    def _put(self, queue, kind, item=None):
+        """Put an item in the queue, unless (while it's full) the stream is cancelled.
+        Return whether it was put."""
+        while not self.cancel.cancelled:
+            try:
+                queue.put((kind, item), timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _produce(self, queue):
+        try:
+            if hasattr(self.iterable, '__aiter__'):
+                asyncio.run(self._aproduce(queue))
+            else:
+                iterator = iter(self.iterable)
+                try:
+                    for item in iterator:
+                        if not self._put(queue, None, item):
+                            break
+                finally:
+                    if hasattr(iterator, 'close'):  # (GeneratorExit, in the function)
+                        iterator.close()
+        except (Exception, asyncio.CancelledError) as error:
+            if not self.cancel.cancelled:
+                self._put(queue, _ERROR, error)
+            return
+        self._put(queue, _END)
+
+    async def _aproduce(self, queue):
+        iterator = self.iterable
+        loop, task = asyncio.get_running_loop(), asyncio.current_task()
+
+        def cancel_task():
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:  # the loop is closed: the task is done
+                pass
+
+        self.cancel.add_callback(cancel_task)
+        try:
+            async for item in iterator:
+                if not self._put(queue, None, item):
+                    break
+        finally:
+            if hasattr(iterator, 'aclose'):
+                await iterator.aclose()
+
+
+def cancel_token_param(func) -> Optional[str]:
+    """The name of the parameter of ``func`` annotated with `CancelToken`, if any
+
+    >>> def train(epochs: int, cancel: CancelToken = None): ...
+    >>> cancel_token_param(train)
+    'cancel'
+    """
+    try:
+        params = signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    return next((p.name for p in params if p.annotation is CancelToken), None)
+
+
+def mk_event_streamer(func, call_func, *, heartbeat=DFLT_SSE_HEARTBEAT):
+    """Make a ``call(args, kwargs)`` function returning an `EventStream` of what
+    ``call_func(args, kwargs)`` (a call to the function ``func``) yields, with a
+    `CancelToken` given to ``func`` if it has a parameter for it"""
+    param = cancel_token_param(func)
+
+    def call(args, kwargs):
+        cancel = CancelToken()
+        if param:
+            kwargs = dict(kwargs, **{param: cancel})
+        return EventStream(call_func(args, kwargs), heartbeat=heartbeat, cancel=cancel)
+
+    return call
@@ -0,0 +1,64 @@
+import asyncio
+import json
+from time import perf_counter
+
+from py2http.bottle_plugins import AuthPlugin
+from py2http.decorators import handle_json_req, inputs_by_ref, send_json_resp
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+loops = []  # the event loops the async code ran in
+
+
+async def lookup(key):
+    """Stands for the I/O of an async client (of a store, a service...)"""
+    loops.append(asyncio.get_running_loop())
+    await asyncio.sleep(0)
+    return {'alice': 'admin', 'secret-token': 'alice'}.get(key)
+
+
+async def add(x: int, y: int = 1):
+    await lookup(None)
+    return x + y
+
+
+@handle_json_req
+@inputs_by_ref
+async def input_mapper(inputs):
+    await lookup(None)
+    return inputs
+
+
+@send_json_resp
+@inputs_by_ref
+async def output_mapper(output, inputs):
+    return {'sum': output, 'role': await lookup('alice')}
+
+
+async def check(request):
+    token = request.get_header('Authorization', '')[7:]
+    return await lookup(token)
+
+
+def test_async_mappers_and_plugins_in_bottle_apps(n_requests=200):
+    app = mk_app(
+        [add],
+        input_mapper=input_mapper,
+        output_mapper=output_mapper,
+        plugins=[AuthPlugin(check)],
+    )
+    headers = {'Authorization': 'Bearer secret-token'}
+    status, _, body = call_wsgi_app(app, '/add', {'x': 2}, headers=headers)
+    assert status.startswith('200')
+    assert json.loads(body) == {'sum': 3, 'role': 'admin'}
+    status, _, _ = call_wsgi_app(app, '/add', {'x': 2})
+    assert status.startswith('401')
+
+    # all the requests (of a worker) run in the same loop
+    loops.clear()
+    tic = perf_counter()
+    for i in range(n_requests):
+        call_wsgi_app(app, '/add', {'x': i}, headers=headers)
+    elapsed = perf_counter() - tic
+    assert len(loops) == 4 * n_requests and len(set(loops)) == 1
+    print(f'\n{n_requests / elapsed:.0f} requests/s (4 awaits per request)')
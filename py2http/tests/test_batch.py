@@ -0,0 +1,124 @@
+import json
+from threading import Barrier
+
+from bottle import request
+import jwt
+
+from py2http.bottle_plugins import JWTPlugin, RateLimitPlugin
+
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def add(a: int, b: int = 1) -> int:
+    return a + b
+
+
+def fail(message: str):
+    raise ValueError(message)
+
+
+def test_batch():
+    app = mk_app([add, fail], publish_batch=True)
+    calls = [
+        {'method_name': 'add', 'inputs': {'a': 1, 'b': 2}},
+        {'method_name': 'add', 'inputs': {'a': 41}},
+        {'method_name': 'fail', 'inputs': {'message': 'oops'}},
+        {'method_name': 'nope', 'inputs': {}},
+        {'inputs': {}},
+    ]
+    status, _, body = call_wsgi_app(app, '/batch', calls)
+    assert status.startswith('200')
+    results = json.loads(body)
+    assert results[:2] == [{'status': 200, 'result': 3}, {'status': 200, 'result': 42}]
+    assert results[2]['status'] == 500
+    assert [r['status'] for r in results[3:]] == [404, 400]
+
+    status, _, _ = call_wsgi_app(app, '/batch', {'not': 'a list'})
+    assert status.startswith('400')
+    status, _, _ = call_wsgi_app(app, '/batch', [calls[0]] * 101)
+    assert status.startswith('400')
+
+    assert '/batch' in app.openapi_spec['paths']
+
+
+def test_batch_calls_run_in_parallel():
+    barrier = Barrier(3, timeout=5)
+
+    def rendezvous(i: int) -> int:
+        barrier.wait()  # only passes if the 3 calls run at the same time
+        return i
+
+    app = mk_app([rendezvous], publish_batch=True, batch_max_workers=3)
+    calls = [{'method_name': 'rendezvous', 'inputs': {'i': i}} for i in range(3)]
+    status, _, body = call_wsgi_app(app, '/batch', calls)
+    assert [r['result'] for r in json.loads(body)] == [0, 1, 2]
+
+
+def test_batch_calls_go_through_the_plugins_of_their_route():
+    plugin_calls = []
+
+    def auth_plugin(callback):
+        def wrapper(*args, **kwargs):
+            plugin_calls.append(request.path)
+            request.token = {'sub': 'alice'}
+            return callback(*args, **kwargs)
+
+        return wrapper
+
+    def whoami(user: str) -> str:
+        return user
+
+    def user_from_token(req):
+        return {'user': req.token['sub']}
+
+    app = mk_app(
+        [whoami],
+        publish_batch=True,
+        plugins=[auth_plugin],
+        input_mapper={'whoami': user_from_token},
+    )
+    calls = [{'method_name': 'whoami', 'inputs': {}}] * 3
+    status, _, body = call_wsgi_app(app, '/batch', calls)
+    assert [r['result'] for r in json.loads(body)] == ['alice'] * 3
+    assert plugin_calls == ['/batch'] + ['/whoami'] * 3
+
+
+def expensive(x: int) -> int:
+    return x
+
+
+def test_guarded_routes_cant_be_reached_through_batches():
+    # rate limits
+    app = mk_app(
+        [expensive],
+        publish_batch=True,
+        plugins=[RateLimitPlugin('1/minute', burst=1)],
+    )
+    assert call_wsgi_app(app, '/expensive', {'x': 1})[0].startswith('200')
+    assert call_wsgi_app(app, '/expensive', {'x': 1})[0].startswith('429')
+    calls = [{'method_name': 'expensive', 'inputs': {'x': 1}}] * 100
+    status, _, body = call_wsgi_app(app, '/batch', calls)
+    assert status.startswith('200')
+    assert {r['status'] for r in json.loads(body)} == {429}
+
+    # authentication (of the routes, not only of the batch route)
+    secret = 'not so secret'
+    app = mk_app(
+        [expensive, add],
+        publish_batch=True,
+        plugins=[JWTPlugin(secret, ignore_methods=['batch', 'add'])],
+    )
+    calls = [
+        {'method_name': 'expensive', 'inputs': {'x': 1}},
+        {'method_name': 'add', 'inputs': {'a': 1}},
+    ]
+    _, _, body = call_wsgi_app(app, '/batch', calls)
+    assert [r['status'] for r in json.loads(body)] == [401, 200]
+    token = jwt.encode({'sub': 'bob'}, secret, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    _, _, body = call_wsgi_app(app, '/batch', calls, headers=headers)
+    assert json.loads(body) == [
+        {'status': 200, 'result': 1},
+        {'status': 200, 'result': 2},
+    ]
@@ -0,0 +1,87 @@
+import json
+from time import perf_counter
+
+from bottle import request
+import jwt
+
+from py2http.bottle_plugins import ApiKeyAuthPlugin, CorsPlugin, JWTPlugin
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def add(x: int, y: int = 1):
+    return x + y
+
+
+def whoami():
+    return 'anonymous'
+
+
+def test_plugin_chain():
+    calls = []
+
+    def logging_plugin(handler):  # a plain decorator, between the guards
+        def wrapped_handler(*args, **kwargs):
+            calls.append(request.path)
+            return handler(*args, **kwargs)
+
+        return wrapped_handler
+
+    app = mk_app(
+        [add, whoami],
+        enable_cors=True,
+        plugins=[logging_plugin, JWTPlugin('secret', ignore_methods=['whoami'])],
+    )
+    status, headers, body = call_wsgi_app(app, '/add', {'x': 1})
+    assert status.startswith('401') and headers['Access-Control-Allow-Origin'] == '*'
+    auth = {'Authorization': f'Bearer {jwt.encode({"sub": "bob"}, "secret")}'}
+    status, _, body = call_wsgi_app(app, '/add', {'x': 1}, headers=auth)
+    assert status.startswith('200') and json.loads(body) == 2
+    status, _, body = call_wsgi_app(app, '/whoami', {})
+    assert status.startswith('200') and json.loads(body) == 'anonymous'
+
+    # preflight requests only get the CORS headers
+    status, headers, body = call_wsgi_app(app, '/add', method='OPTIONS')
+    assert status.startswith('200') and body == b''
+    assert 'Authorization' in headers['Access-Control-Allow-Headers']
+
+    # /ping skips the plugins (but not CORS)
+    status, headers, body = call_wsgi_app(app, '/ping', method='GET')
+    assert json.loads(body) == {'ping': 'pong'}
+    assert 'Access-Control-Allow-Origin' in headers
+    assert calls == ['/add', '/add', '/whoami']
+
+
+def test_tiny_json_requests(n_requests=2000):
+    """Requests per second with plugins each wrapping routes, and chained"""
+
+    def tag_plugin(handler):
+        def wrapped_handler(*args, **kwargs):
+            request.tag = 'tiny'
+            return handler(*args, **kwargs)
+
+        return wrapped_handler
+
+    headers = {'Authorization': f'Bearer {jwt.encode({"sub": "bob"}, "secret")}'}
+    api_key = headers['Authorization']  # (compared to the whole header)
+    plugins = [CorsPlugin(), JWTPlugin('secret'), ApiKeyAuthPlugin(api_key), tag_plugin]
+    separately_installed = mk_app([add])
+    for plugin in plugins:
+        separately_installed.install(plugin)
+    chained = mk_app([add], enable_cors=True, plugins=plugins[1:])
+
+    def requests_per_second(app):
+        tic = perf_counter()
+        for _ in range(n_requests):
+            call_wsgi_app(app, '/add', {'x': 1}, headers=headers)
+        return n_requests / (perf_counter() - tic)
+
+    for app in (separately_installed, chained):  # warm up
+        status, _, body = call_wsgi_app(app, '/add', {'x': 1}, headers=headers)
+        assert status.startswith('200') and json.loads(body) == 2
+    separate_rps = requests_per_second(separately_installed)
+    chained_rps = requests_per_second(chained)
+    print(
+        f'\ntiny JSON requests per second: {separate_rps:.0f} with separate plugins, '
+        f'{chained_rps:.0f} with a plugin chain'
+    )
@@ -0,0 +1,84 @@
+import json
+import subprocess
+import sys
+from typing import List, TypedDict
+
+from py2http import service
+from py2http.schema_tools import clear_schema_caches
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def scale(x: float, factor: float = 2.0) -> float:
+    return x * factor
+
+
+def greet(name: str, greeting: str = 'hello'):
+    return f'{greeting} {name}'
+
+
+def no_schemas(*args, **kwargs):
+    raise AssertionError('The schemas should come from the build cache')
+
+
+def test_build_cache(tmp_path, monkeypatch):
+    configs = dict(build_cache_dir=str(tmp_path), publish_openapi=True)
+    app = mk_app([scale, greet], **configs)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # an app with the same functions and configs loads its spec from the cache
+    monkeypatch.setattr(service, 'mk_input_schema_from_func', no_schemas)
+    monkeypatch.setattr(service, 'mk_output_schema_from_func', no_schemas)
+    cached_app = mk_app([scale, greet], **configs)
+    assert cached_app.openapi_spec == app.openapi_spec
+    status, _, body = call_wsgi_app(cached_app, '/scale', {'x': 3})
+    assert status.startswith('200') and json.loads(body) == 6.0
+
+    # but not if they changed
+    monkeypatch.undo()
+
+    def changed_greet(name: str, greeting: str = 'hi'):
+        return f'{greeting} {name}'
+
+    changed_greet.__name__ = 'greet'
+    app = mk_app([scale, changed_greet], **configs)
+    operation = app.openapi_spec['paths']['/greet']['post']
+    schema = operation['requestBody']['content']['application/json']['schema']
+    assert schema['properties']['greeting']['default'] == 'hi'
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_models_edited_in_place_change_the_build_key(tmp_path):
+    class Point(TypedDict):
+        x: int
+
+    def plot(points: List[Point]):
+        return points
+
+    def property_type(app):
+        operation = app.openapi_spec['paths']['/plot']['post']
+        schema = operation['requestBody']['content']['application/json']['schema']
+        return schema['properties']['points']['items']['properties']['x']['type']
+
+    configs = dict(build_cache_dir=str(tmp_path))
+    assert property_type(mk_app([plot], **configs)) == 'integer'
+    Point.__annotations__['x'] = str  # (same module, qualname and lines)
+    clear_schema_caches()  # (as in a new process: schemas are cached per type)
+    assert property_type(mk_app([plot], **configs)) == 'string'
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_build_keys_are_the_same_across_processes():
+    code = (
+        'from py2http.build_cache import build_key; '
+        'from py2http.tests.test_build_cache import scale, greet; '
+        'from py2http.default_configs import default_configs as c; '
+        "print(build_key([scale, greet], {'error_handler': c['error_handler']}))"
+    )
+    keys = {
+        subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        for _ in range(2)
+    }
+    assert len(keys) == 1
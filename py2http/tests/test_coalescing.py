@@ -0,0 +1,102 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+from threading import Event
+from time import perf_counter, sleep
+
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+calls = []
+release = Event()
+
+
+def report(x: int, fail: bool = False):
+    calls.append(x)
+    release.wait(5)
+    if fail:
+        raise ValueError('backend down')
+    return {'x': x, 'calls': len(calls)}
+
+
+async def areport(x: int):
+    calls.append(x)
+    await asyncio.sleep(0.1)
+    return {'x': x}
+
+
+def call_concurrently(app, path, inputs, n_clients=20, headers=None):
+    """Make ``n_clients`` concurrent requests (released together once all are sent)"""
+    with ThreadPoolExecutor(n_clients) as pool:
+        futures = [
+            pool.submit(call_wsgi_app, app, path, x, headers=headers) for x in inputs
+        ]
+        sleep(0.2)  # (so that they're all in flight)
+        release.set()
+        responses = [future.result() for future in futures]
+    return [(int(status[:3]), json.loads(body)) for status, _, body in responses]
+
+
+def test_concurrent_identical_requests_share_an_execution():
+    app = mk_app([report], coalesce={'report': True})
+    calls.clear()
+    release.clear()
+    responses = call_concurrently(app, '/report', [{'x': 1}] * 10 + [{'x': 2}] * 10)
+    assert sorted(calls) == [1, 2]
+    assert [body['x'] for _, body in responses] == [1] * 10 + [2] * 10
+    # a recent result is given to a retry
+    assert call_wsgi_app(app, '/report', {'x': 1})[0].startswith('200')
+    assert sorted(calls) == [1, 2]
+
+    # errors are shared by the concurrent requests, but not kept
+    calls.clear()
+    release.clear()
+    responses = call_concurrently(app, '/report', [{'x': 3, 'fail': True}] * 5)
+    assert calls == [3]
+    assert responses == [(500, {'error': 'backend down'})] * 5
+    call_wsgi_app(app, '/report', {'x': 3, 'fail': True})
+    assert calls == [3, 3]
+
+
+def test_requests_are_coalesced_on_their_inputs_only():
+    app = mk_app([report], coalesce={'report': True})
+    calls.clear()
+    release.clear()
+    # requests with their own Idempotency-Key, but the same inputs, are coalesced...
+    with ThreadPoolExecutor(5) as pool:
+        futures = [
+            pool.submit(
+                call_wsgi_app,
+                app,
+                '/report',
+                {'x': 4},
+                headers={'Idempotency-Key': f'order-{i}'},
+            )
+            for i in range(5)
+        ]
+        sleep(0.2)  # (so that they're all in flight)
+        release.set()
+        bodies = {future.result()[2] for future in futures}
+    assert calls == [4] and len(bodies) == 1
+    # ... and a request with the same key, but other inputs, doesn't get their result
+    headers = {'Idempotency-Key': 'order-0'}
+    status, _, body = call_wsgi_app(app, '/report', {'x': 7}, headers=headers)
+    assert calls == [4, 7] and json.loads(body)['x'] == 7
+
+
+def test_async_functions_are_coalesced():
+    app = mk_app([areport], coalesce=True)
+    calls.clear()
+    responses = call_concurrently(app, '/areport', [{'x': 5}] * 10)
+    assert calls == [5] and responses == [(200, {'x': 5})] * 10
+
+
+def test_coalescing_speed(n_clients=50):
+    release.set()  # (report takes no time: only the overhead is measured)
+    for coalesce in (False, True):
+        app = mk_app([report], coalesce=coalesce)
+        tic = perf_counter()
+        for i in range(1000):
+            call_wsgi_app(app, '/report', {'x': i})
+        elapsed = perf_counter() - tic
+        print(f'\n{coalesce=}: {1000 / elapsed:.0f} distinct requests/s')
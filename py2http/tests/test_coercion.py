@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from enum import Enum
+import json
+from typing import Iterable, TypedDict
+from uuid import UUID
+
+from py2http.service import mk_app, mk_routes_and_openapi_specs
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+class Unit(Enum):
+    day = 'day'
+    hour = 'hour'
+
+
+class Period(TypedDict):
+    start: datetime
+    unit: Unit
+
+
+def shift(period: Period, n: int, ids: Iterable[UUID] = None) -> Period:
+    assert isinstance(period['start'], datetime) and isinstance(period['unit'], Unit)
+    assert ids is None or all(isinstance(x, UUID) for x in ids)
+    delta = timedelta(**{f'{period["unit"].value}s': n})
+    return {'start': period['start'] + delta, 'unit': period['unit']}
+
+
+def total(prices: Iterable[Decimal]) -> Decimal:
+    return sum(prices, Decimal(0))
+
+
+def test_coerce_inputs_and_encode_outputs():
+    app = mk_app([shift, total], coerce_inputs=True)
+    status, _, body = call_wsgi_app(
+        app,
+        '/shift',
+        {
+            'period': {'start': '2020-01-31T12:00:00', 'unit': 'day'},
+            'n': 1,
+            'ids': ['12345678-1234-5678-1234-567812345678'],
+        },
+    )
+    assert status.startswith('200')
+    assert json.loads(body) == {'start': '2020-02-01T12:00:00', 'unit': 'day'}
+
+    status, _, body = call_wsgi_app(app, '/total', {'prices': ['0.10', 0.2]})
+    assert status.startswith('200') and json.loads(body) == '0.30'
+
+    status, _, body = call_wsgi_app(
+        app, '/shift', {'period': {'start': '2020-01-31', 'unit': 'week'}, 'n': 1}
+    )
+    assert status.startswith('400')
+    assert 'Invalid parameter "period"' in json.loads(body)['error']
+
+
+def test_complex_types_in_openapi_spec():
+    _, openapi_spec = mk_routes_and_openapi_specs([shift])
+    operation = openapi_spec['paths']['/shift']['post']
+    request_schema = operation['requestBody']['content']['application/json']['schema']
+    assert request_schema['properties']['period']['properties'] == {
+        'start': {'type': 'string', 'format': 'date-time'},
+        'unit': {'type': 'string', 'enum': ['day', 'hour']},
+    }
+    assert request_schema['properties']['ids'] == {
+        'type': 'array',
+        'items': {'type': 'string', 'format': 'uuid'},
+        'default': None,
+    }
@@ -0,0 +1,61 @@
+from threading import Event, Thread
+
+import pytest
+
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def test_max_concurrency_sheds_load():
+    started, finish = Event(), Event()
+
+    def slow():
+        started.set()
+        finish.wait(5)
+        return 'done'
+
+    def fast():
+        return 'fast'
+
+    app = mk_app(
+        [slow, fast], max_concurrency={'slow': 1}, retry_after=3,
+    )
+    responses = []
+    thread = Thread(target=lambda: responses.append(call_wsgi_app(app, '/slow', {})))
+    thread.start()
+    assert started.wait(5)
+
+    # slow is at full capacity: requests are shed...
+    status, headers, body = call_wsgi_app(app, '/slow', {})
+    assert status.startswith('503')
+    assert headers['Retry-After'] == '3'
+    # ... but other routes are not affected
+    status, _, body = call_wsgi_app(app, '/fast', {})
+    assert status.startswith('200') and body == b'"fast"'
+
+    finish.set()
+    thread.join()
+    assert responses[0][0].startswith('200')
+
+    assert set(app.limiters) == {'slow'}
+    stats = app.limiters['slow'].stats()
+    assert stats['accepted'] == 1 and stats['rejected'] == 1
+    assert stats['in_flight'] == 0
+
+    with pytest.raises(ValueError, match='max_concurrency must be positive'):
+        mk_app([slow], max_concurrency=-1)
+
+
+def test_process_executor():
+    import pytest
+    from py2http.tests.objects_for_testing import add
+
+    app = mk_app([add], executor='process', executor_max_workers=2)
+    status, _, body = call_wsgi_app(app, '/add', {'a': 40, 'b': 2})
+    assert status.startswith('200') and body == b'42'
+
+    def local_func(x):
+        return x
+
+    with pytest.raises(ValueError):
+        mk_app([local_func], executor='process')
@@ -0,0 +1,46 @@
+"""Import time budgets: the dependencies of optional features (other frameworks, JWT,
+swagger...) must only be imported when these features are used."""
+
+import subprocess
+import sys
+
+# (seconds) generous, so as not to fail on slow machines, but well below what
+# importing all the optional dependencies takes
+SERVICE_IMPORT_BUDGET = 0.5
+OPENAPI_UTILS_IMPORT_BUDGET = 0.25
+OPTIONAL_DEPENDENCIES = ('aiohttp', 'flask', 'jwt', 'swagger_ui', 'glom', 'strand')
+
+
+def import_times(module):
+    """The cumulative import times (in seconds) of the modules imported when importing
+    ``module`` (with ``python -X importtime``, in a fresh interpreter)"""
+    subprocess.run([sys.executable, '-c', f'import {module}'], check=True)  # warm up
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        *_, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def imported_optional_dependencies(times):
+    return sorted(name for name in times if name.split('.')[0] in OPTIONAL_DEPENDENCIES)
+
+
+def test_service_import_time():
+    times = import_times('py2http.service')
+    assert imported_optional_dependencies(times) == []
+    assert times['py2http.service'] < SERVICE_IMPORT_BUDGET
+
+
+def test_openapi_utils_import_time():
+    times = import_times('py2http.openapi_utils')
+    assert imported_optional_dependencies(times) == []
+    assert 'py2http.service' not in times and 'bottle' not in times
+    assert times['py2http.openapi_utils'] < OPENAPI_UTILS_IMPORT_BUDGET
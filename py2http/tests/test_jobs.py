@@ -0,0 +1,133 @@
+import asyncio
+import json
+from multiprocessing import get_context
+from threading import Event
+from time import perf_counter, sleep
+
+from py2http.jobs import SqliteJobStore
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+release = Event()
+
+
+def analyze(x: int, fail: bool = False):
+    release.wait(5)
+    if fail:
+        raise ValueError(f'Can not analyze {x}')
+    return {'x': x, 'squared': x * x}
+
+
+async def aanalyze(x: int):
+    await asyncio.sleep(0.01)
+    return {'x': x, 'squared': x * x}
+
+
+def call(app, path, json_body=None, **kwargs):
+    status, _, body = call_wsgi_app(app, path, json_body, **kwargs)
+    return int(status[:3]), json.loads(body)
+
+
+def wait_for(app, job_id, timeout=5, path='/analyze/status'):
+    tic = perf_counter()
+    while perf_counter() - tic < timeout:
+        _, status = call(app, path, {'job_id': job_id})
+        if status['status'] != 'pending':
+            return status
+        sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+def test_job_mode():
+    app = mk_app([analyze], mode={'analyze': 'job'})
+    assert {r.rule for r in app.routes} >= {
+        '/analyze',
+        '/analyze/status',
+        '/analyze/result',
+    }
+
+    release.clear()
+    code, submitted = call(app, '/analyze', {'x': 3})
+    assert code == 202 and submitted['status'] == 'pending'
+    job_id = submitted['job_id']
+    assert call(app, '/analyze/result', {'job_id': job_id}) == (202, submitted)
+    release.set()
+    assert wait_for(app, job_id) == {'job_id': job_id, 'status': 'done'}
+    code, result = call(app, '/analyze/result', {'job_id': job_id})
+    assert code == 200 and result == {'x': 3, 'squared': 9}
+
+    code, submitted = call(app, '/analyze', {'x': 3, 'fail': True})
+    status = wait_for(app, submitted['job_id'])
+    assert status['status'] == 'failed' and status['error'] == 'Can not analyze 3'
+    code, error = call(app, '/analyze/result', {'job_id': submitted['job_id']})
+    assert code == 500 and error == {'error': 'Can not analyze 3'}
+
+    code, _ = call(app, '/analyze/status', {'job_id': 'unknown'})
+    assert code == 404
+
+
+def test_async_functions_as_jobs(tmp_path):
+    store = SqliteJobStore(str(tmp_path / 'jobs.sqlite'))  # (results are pickled)
+    app = mk_app([aanalyze], mode={'aanalyze': 'job'}, job_store=store)
+    code, submitted = call(app, '/aanalyze', {'x': 6})
+    assert code == 202
+    job_id = submitted['job_id']
+    assert wait_for(app, job_id, path='/aanalyze/status')['status'] == 'done'
+    code, result = call(app, '/aanalyze/result', {'job_id': job_id})
+    assert code == 200 and result == {'x': 6, 'squared': 36}
+
+
+def test_idempotent_submissions():
+    app = mk_app([analyze], mode={'analyze': 'job'})
+    headers = {'Idempotency-Key': 'request-42'}
+    _, first = call(app, '/analyze', {'x': 4}, headers=headers)
+    _, retry = call(app, '/analyze', {'x': 4}, headers=headers)
+    assert retry['job_id'] == first['job_id']
+    _, other = call(app, '/analyze', {'x': 4})
+    assert other['job_id'] != first['job_id']
+    # the key can't be reused for other inputs...
+    code, error = call(app, '/analyze', {'x': 7}, headers=headers)
+    assert code == 422 and 'other inputs' in error['error']
+    # ... and is only that of its client
+    headers = dict(headers, Authorization='Bearer alice')
+    _, alices = call(app, '/analyze', {'x': 4}, headers=headers)
+    assert alices['job_id'] != first['job_id']
+    _, bobs = call(
+        app, '/analyze', {'x': 4}, headers=dict(headers, Authorization='Bob')
+    )
+    assert bobs['job_id'] not in (first['job_id'], alices['job_id'])
+
+
+def _submit_in_other_process(path, queue):
+    app = mk_app([analyze], mode={'analyze': 'job'}, job_store=SqliteJobStore(path))
+    release.set()
+    _, submitted = call(app, '/analyze', {'x': 5})
+    queue.put(wait_for(app, submitted['job_id']))
+
+
+def test_jobs_shared_by_processes(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    # a job run by another process (worker)...
+    ctx = get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_submit_in_other_process, args=(path, queue))
+    process.start()
+    status = queue.get(timeout=30)
+    process.join()
+    assert status['status'] == 'done'
+    # ... is answered by this one
+    app = mk_app([analyze], mode={'analyze': 'job'}, job_store=SqliteJobStore(path))
+    code, result = call(app, '/analyze/result', {'job_id': status['job_id']})
+    assert code == 200 and result == {'x': 5, 'squared': 25}
+
+
+def test_job_submission_speed(tmp_path, n_requests=500):
+    release.set()
+    for store in (None, SqliteJobStore(str(tmp_path / 'jobs.sqlite'))):
+        app = mk_app([analyze], mode={'analyze': 'job'}, job_store=store)
+        tic = perf_counter()
+        for i in range(n_requests):
+            call(app, '/analyze', {'x': i})
+        elapsed = perf_counter() - tic
+        name = type(store).__name__ if store else 'MemoryJobStore'
+        print(f'\n{name}: {n_requests / elapsed:.0f} submissions/s')
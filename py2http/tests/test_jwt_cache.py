@@ -0,0 +1,73 @@
+import json
+from time import perf_counter, time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+
+from py2http.bottle_plugins import JWTPlugin
+from py2http.middleware import mk_jwt_decoder
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def mk_rsa_keys():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_key = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_key, public_key
+
+
+def test_cached_claims_expire_with_the_token():
+    decode = mk_jwt_decoder('secret', cache_ttl=300)
+    now = time()
+    long_lived = jwt.encode({'sub': 'a', 'exp': now + 3600}, 'secret')
+    short_lived = jwt.encode({'sub': 'b', 'exp': now + 1}, 'secret')
+    decode(long_lived), decode(short_lived)
+    expiries = sorted(expires_at for expires_at, _ in decode.cache._items.values())
+    assert expiries[0] == now + 1  # the expiry of the token
+    assert expiries[1] <= time() + 300  # capped by the TTL
+
+    # invalid tokens are not cached
+    try:
+        decode(jwt.encode({'sub': 'c'}, 'not the secret'))
+    except jwt.InvalidSignatureError:
+        pass
+    assert len(decode.cache) == 2
+
+
+def test_jwt_plugin(n_calls=200):
+    """Throughput of RS256 verification, with and without the cache"""
+    private_key, public_key = mk_rsa_keys()
+    token = jwt.encode(
+        {'sub': 'alice', 'exp': time() + 3600}, private_key, algorithm='RS256'
+    )
+
+    def whoami(user: str):
+        return user
+
+    app = mk_app(
+        [whoami],
+        plugins=[JWTPlugin(public_key, mapper={'sub': 'user'}, algorithms=['RS256'])],
+        input_mapper={'whoami': lambda req: {'user': req.token['user']}},
+    )
+    headers = {'Authorization': f'Bearer {token}'}
+    status, _, body = call_wsgi_app(app, '/whoami', {}, headers=headers)
+    assert status.startswith('200') and json.loads(body) == 'alice'
+    bad_headers = {'Authorization': f'Bearer {token[:-4]}AAAA'}
+    status, _, _ = call_wsgi_app(app, '/whoami', {}, headers=bad_headers)
+    assert status.startswith('401')
+
+    throughputs = {}
+    for cache_size in (0, 1024):
+        decode = mk_jwt_decoder(public_key, algorithms=['RS256'], cache_size=cache_size)
+        tic = perf_counter()
+        for _ in range(n_calls):
+            decode(token)
+        throughputs[cache_size] = n_calls / (perf_counter() - tic)
+    print(
+        f'\nRS256 tokens decoded per second: {throughputs[0]:.0f} without cache, '
+        f'{throughputs[1024]:.0f} with cache'
+    )
+    assert throughputs[1024] > 5 * throughputs[0]
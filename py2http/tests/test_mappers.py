@@ -0,0 +1,104 @@
+import json
+from time import perf_counter
+import tracemalloc
+
+from py2http.decorators import handle_json_req, inputs_by_ref, send_json_resp
+from py2http.default_configs import default_output_mapper
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def add(x: int, y: int = 1, z: int = 0):
+    return x + y + z
+
+
+def test_inputs_by_ref():
+    seen = {}
+
+    @handle_json_req
+    @inputs_by_ref
+    def input_mapper(inputs):
+        seen['input_mapper'] = inputs
+        return inputs
+
+    @send_json_resp
+    @inputs_by_ref
+    def output_mapper(output, inputs):
+        seen['output_mapper'] = inputs
+        return {'sum': output, 'x': inputs['x']}
+
+    app = mk_app([add], input_mapper=input_mapper, output_mapper=output_mapper)
+    status, _, body = call_wsgi_app(app, '/add', {'x': 1, 'y': 2})
+    assert status.startswith('200') and json.loads(body) == {'sum': 3, 'x': 1}
+    # the mappers got the (not copied) inputs of the request
+    assert seen['input_mapper'] is seen['output_mapper']
+    assert seen['input_mapper'] == {'x': 1, 'y': 2}
+    # and the request schema is still the one of the function
+    schema = app.openapi_spec['paths']['/add']['post']['requestBody']['content']
+    assert set(schema['application/json']['schema']['properties']) == {'x', 'y', 'z'}
+
+    # mappers taking the inputs as keyword arguments still work
+    @send_json_resp
+    def kwargs_output_mapper(output, x, **inputs):
+        return {'sum': output, 'x': x}
+
+    app = mk_app([add], output_mapper=kwargs_output_mapper)
+    status, _, body = call_wsgi_app(app, '/add', {'x': 1, 'y': 2})
+    assert json.loads(body) == {'sum': 3, 'x': 1}
+    # and the default mappers can still be called with them
+    assert default_output_mapper(3, x=1) == default_output_mapper(3, {'x': 1}) == '3'
+
+
+@handle_json_req
+def kwargs_input_mapper(**inputs):
+    return inputs
+
+
+@send_json_resp
+def kwargs_output_mapper(output, **inputs):
+    return output
+
+
+def _allocated_per_request(app, body, n_requests):
+    call_wsgi_app(app, '/add', body=body)  # warm up
+    tracemalloc.start()
+    try:
+        allocated = 0
+        for _ in range(n_requests):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            call_wsgi_app(app, '/add', body=body)
+            allocated += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return allocated / n_requests
+
+
+def _requests_per_second(app, body, n_requests):
+    tic = perf_counter()
+    for _ in range(n_requests):
+        call_wsgi_app(app, '/add', body=body)
+    return n_requests / (perf_counter() - tic)
+
+
+def test_memory_allocated_per_request(n_requests=2000):
+    """The default mappers (taking the inputs by reference) against the same mappers
+    taking them as keyword arguments (the baseline)"""
+    body = json.dumps({'x': 1, 'y': 2, 'z': 3}).encode()
+    apps = {
+        'kwargs': mk_app(
+            [add],
+            input_mapper=kwargs_input_mapper,
+            output_mapper=kwargs_output_mapper,
+        ),
+        'by ref': mk_app([add]),
+    }
+    allocated = {}
+    for name, app in apps.items():
+        allocated[name] = _allocated_per_request(app, body, n_requests)
+        rps = _requests_per_second(app, body, n_requests)
+        print(
+            f'\n{name}: {allocated[name]:.0f} bytes (peak) allocated per request, '
+            f'{rps:.0f} requests/s'
+        )
+    assert allocated['by ref'] < allocated['kwargs']
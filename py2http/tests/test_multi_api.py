@@ -0,0 +1,117 @@
+import json
+import logging
+from time import perf_counter
+
+import jwt
+
+from py2http.bottle_plugins import ApiKeyAuthPlugin, JWTPlugin, RateLimitPlugin
+from py2http.default_configs import default_configs
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def add(x: int, y: int = 1):
+    return x + y
+
+
+def greet(name: str = 'world'):
+    return f'hello {name}'
+
+
+def test_sub_apps_share_the_configs(n_apis=50):
+    # configs with a plugin that can't be (deep) copied, and a large object
+    plugin = RateLimitPlugin('100/second')
+    openapi = {
+        'title': 'apis',
+        'x-big': {f'k{i}': list(range(100)) for i in range(2000)},
+    }
+    configs = dict(
+        plugins=[plugin], logger=logging.getLogger(__name__), openapi=openapi
+    )
+    spec = {f'/api{i}': [add, greet] for i in range(n_apis)}
+
+    tic = perf_counter()
+    app = mk_app(spec, mount_sub_apps=True, **configs)
+    elapsed = perf_counter() - tic
+    print(f'\n{n_apis} sub-apps made in {elapsed:.3f}s')
+
+    status, _, body = call_wsgi_app(app, '/api7/add', {'x': 2})
+    assert status.startswith('200') and json.loads(body) == 3
+    subapps = {r.rule: r.config['mountpoint.target'] for r in app.routes}
+    for i in (0, 7, n_apis - 1):
+        servers = subapps[f'/api{i}'].openapi_spec['servers']
+        assert servers == [{'url': f'http://localhost:3030/api{i}'}]
+    # the configs given (and the default ones) were not modified
+    assert 'base_url' not in openapi and 'base_url' not in default_configs['openapi']
+
+
+def test_flat_multi_api_app():
+    secret = 'not so secret'
+    spec = {
+        'public': [add, greet],
+        # an API with configs (and plugins) of its own
+        'private': {
+            'handlers': [add],
+            'config': dict(plugins=[JWTPlugin(secret)], publish_openapi=True),
+        },
+    }
+    app = mk_app(spec, publish_openapi=True)
+
+    status, _, body = call_wsgi_app(app, '/public/add', {'x': 2})
+    assert status.startswith('200') and json.loads(body) == 3
+    assert call_wsgi_app(app, '/private/add', {'x': 2})[0].startswith('401')
+    token = jwt.encode({'user': 'bob'}, secret, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    status, _, body = call_wsgi_app(app, '/private/add', {'x': 2}, headers=headers)
+    assert status.startswith('200') and json.loads(body) == 3
+    assert call_wsgi_app(app, '/private/ping', method='GET')[0].startswith('200')
+
+    # an OpenAPI spec of all the APIs, and one of each
+    _, _, body = call_wsgi_app(app, '/openapi', method='GET')
+    assert json.loads(body) == app.openapi_spec
+    assert list(app.openapi_spec['paths']) == [
+        '/public/add',
+        '/public/greet',
+        '/private/add',
+    ]
+    assert app.openapi_spec['servers'] == [{'url': 'http://localhost:3030'}]
+    _, _, body = call_wsgi_app(app, '/private/openapi', method='GET', headers=headers)
+    private_spec = json.loads(body)
+    assert private_spec == app.openapi_specs['/private']
+    assert list(private_spec['paths']) == ['/add']
+    assert private_spec['servers'] == [{'url': 'http://localhost:3030/private'}]
+
+
+def test_the_openapi_of_all_the_apis_is_guarded_by_the_plugins():
+    spec = {'a': [add], 'b': [greet]}
+    plugins = [ApiKeyAuthPlugin('secret')]
+    app = mk_app(spec, publish_openapi=True, plugins=plugins)
+    assert call_wsgi_app(app, '/a/openapi', method='GET')[0].startswith('401')
+    assert call_wsgi_app(app, '/openapi', method='GET')[0].startswith('401')
+    headers = {'Authorization': 'secret'}
+    status, _, body = call_wsgi_app(app, '/openapi', method='GET', headers=headers)
+    assert status.startswith('200') and list(json.loads(body)['paths']) == [
+        '/a/add',
+        '/b/greet',
+    ]
+    # unless it's insecure
+    app = mk_app(spec, publish_openapi=True, openapi_insecure=True, plugins=plugins)
+    assert call_wsgi_app(app, '/openapi', method='GET')[0].startswith('200')
+
+
+def test_the_routes_of_each_api_have_their_own_rate_limits():
+    app = mk_app({'a': [add], 'b': [add]}, plugins=[RateLimitPlugin('1/minute')])
+    assert call_wsgi_app(app, '/a/add', {'x': 2})[0].startswith('200')
+    assert call_wsgi_app(app, '/a/add', {'x': 2})[0].startswith('429')
+    assert call_wsgi_app(app, '/b/add', {'x': 2})[0].startswith('200')
+
+
+def test_flat_multi_api_app_speed(n_apis=20, n_requests=2000):
+    spec = {f'/api{i}': [add, greet] for i in range(n_apis)}
+    for mount_sub_apps in (True, False):
+        app = mk_app(spec, mount_sub_apps=mount_sub_apps)
+        tic = perf_counter()
+        for i in range(n_requests):
+            call_wsgi_app(app, f'/api{i % n_apis}/add', {'x': i})
+        elapsed = perf_counter() - tic
+        print(f'\n{mount_sub_apps=}: {n_requests / elapsed:.0f} requests/s')
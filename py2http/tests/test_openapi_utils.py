@@ -0,0 +1,80 @@
+from copy import deepcopy
+import json
+from time import perf_counter
+from typing import Iterable, TypedDict
+
+from py2http.openapi_utils import hoist_component_schemas
+from py2http.service import mk_routes_and_openapi_specs
+
+
+class Address(TypedDict):
+    street: str
+    city: str
+    zipcode: str
+
+
+class Customer(TypedDict):
+    name: str
+    address: Address
+    tags: Iterable[str]
+
+
+def mk_funcs(n_funcs):
+    def mk_func(i):
+        def func(customer: Customer, billing: Address, note: str = '') -> Customer:
+            return customer
+
+        func.__name__ = f'func_{i}'
+        return func
+
+    return [mk_func(i) for i in range(n_funcs)]
+
+
+def resolve_refs(schema, components):
+    if isinstance(schema, dict):
+        if '$ref' in schema:
+            name = schema['$ref'].rsplit('/', 1)[-1]
+            return resolve_refs(components[name], components)
+        return {k: resolve_refs(v, components) for k, v in schema.items()}
+    if isinstance(schema, list):
+        return [resolve_refs(v, components) for v in schema]
+    return schema
+
+
+def test_hoisted_schemas_are_smaller_and_equivalent(n_funcs=200):
+    funcs = mk_funcs(n_funcs)
+
+    tic = perf_counter()
+    _, inlined_spec = mk_routes_and_openapi_specs(funcs)
+    inlined_time = perf_counter() - tic
+    tic = perf_counter()
+    _, hoisted_spec = mk_routes_and_openapi_specs(
+        funcs, openapi={'hoist_schemas': True}
+    )
+    hoisted_time = perf_counter() - tic
+
+    inlined_size = len(json.dumps(inlined_spec))
+    hoisted_size = len(json.dumps(hoisted_spec))
+    print(
+        f'\n{n_funcs} routes: inlined spec: {inlined_size} bytes ({inlined_time:.3f}s)'
+        f', hoisted spec: {hoisted_size} bytes ({hoisted_time:.3f}s)'
+    )
+    assert hoisted_size < inlined_size / 3
+
+    components = hoisted_spec['components']['schemas']
+    assert len(components) == 3  # Address, Customer, and the (shared) request body
+    resolved_paths = resolve_refs(hoisted_spec['paths'], components)
+    assert resolved_paths == inlined_spec['paths']
+
+
+def test_hoisted_schemas_dont_replace_other_components():
+    _, spec = mk_routes_and_openapi_specs(mk_funcs(2))
+    names = list(hoist_component_schemas(deepcopy(spec))['components']['schemas'])
+    # a (user) component already has the name of a hoisted schema
+    users_components = {names[0]: {'type': 'string', 'format': 'email'}}
+    spec['components'] = {'schemas': dict(users_components)}
+    hoisted_spec = hoist_component_schemas(deepcopy(spec))
+    components = hoisted_spec['components']['schemas']
+    assert components[names[0]] == users_components[names[0]]
+    assert len(components) == len(names) + 1
+    assert resolve_refs(hoisted_spec['paths'], components) == spec['paths']
@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+
+from py2http.bottle_plugins import RateLimitPlugin
+from py2http.middleware import mk_rate_limit_middleware
+from py2http.rate_limiting import SqliteBucketStore, api_key
+from py2http.service import mk_app
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def expensive(x: int):
+    return x * 2
+
+
+def cheap(x: int):
+    return x
+
+
+def test_rate_limit_plugin():
+    plugin = RateLimitPlugin('1/minute', burst=2, key=api_key, ignore_methods=['cheap'])
+    app = mk_app([expensive, cheap], plugins=[plugin])
+
+    def call(path, client):
+        return call_wsgi_app(app, path, {'x': 1}, headers={'Authorization': client})
+
+    statuses = [call('/expensive', 'alice')[0][:3] for _ in range(3)]
+    assert statuses == ['200', '200', '429']
+    status, headers, body = call('/expensive', 'alice')
+    assert status.startswith('429') and headers['Retry-After'] == '60'
+    assert json.loads(body) == {'error': 'Too many requests'}
+    # other clients, and routes that are not limited, are not affected
+    assert call('/expensive', 'bob')[0].startswith('200')
+    assert all(call('/cheap', 'alice')[0].startswith('200') for _ in range(5))
+    status, _, _ = call_wsgi_app(app, '/ping', method='GET')
+    assert status.startswith('200')
+
+
+def test_the_calls_of_batches_are_charged_one_by_one():
+    for per_route in (True, False):
+        plugin = RateLimitPlugin('1/minute', burst=3, per_route=per_route)
+        app = mk_app([expensive], publish_batch=True, plugins=[plugin])
+        assert call_wsgi_app(app, '/expensive', {'x': 1})[0].startswith('200')
+        calls = [{'method_name': 'expensive', 'inputs': {'x': 1}}] * 5
+        status, _, body = call_wsgi_app(app, '/batch', calls)
+        assert status.startswith('200')
+        assert [r['status'] for r in json.loads(body)] == [200, 200, 429, 429, 429]
+
+
+def _take_tokens(path, n):
+    store = SqliteBucketStore(path)
+    return sum(not store.take('client', rate=1 / 3600, burst=5) for _ in range(n))
+
+
+def test_sqlite_buckets_are_shared_by_processes(tmp_path):
+    path = str(tmp_path / 'buckets.sqlite')
+    with ProcessPoolExecutor(2) as executor:
+        accepted = list(executor.map(_take_tokens, [path] * 4, [10] * 4))
+    assert sum(accepted) == 5
+
+
+def test_full_sqlite_buckets_are_pruned(tmp_path):
+    now = [0.0]
+    store = SqliteBucketStore(
+        str(tmp_path / 'buckets.sqlite'), prune_every=1, timer=lambda: now[0]
+    )
+    for i in range(100):
+        store.take(f'client{i}', rate=1, burst=2)
+    n_buckets = 'SELECT COUNT(*) FROM buckets'
+    assert store._connection().execute(n_buckets).fetchone() == (100,)
+    now[0] = 1.5  # (all the buckets are full again)
+    store.take('client0', rate=1, burst=2)
+    assert store._connection().execute(n_buckets).fetchone() == (1,)
+    # and a pruned bucket is a full one
+    assert [store.take('client1', rate=1, burst=2) for _ in range(3)] == [0, 0, 1]
+
+
+def test_rate_limit_middleware():
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+
+    async def ping(req):
+        return web.json_response({'ping': 'pong'})
+
+    async def expensive(req):
+        return web.json_response(2)
+
+    async def run():
+        app = web.Application(middlewares=[mk_rate_limit_middleware('1/minute')])
+        app.add_routes(
+            [web.get('/ping', ping, name='ping'), web.post('/expensive', expensive)]
+        )
+        async with TestClient(TestServer(app)) as client:
+            statuses = [(await client.post('/expensive')).status for _ in range(2)]
+            rejected = await client.post('/expensive')
+            pinged = [(await client.get('/ping')).status for _ in range(2)]
+        return statuses, rejected.headers['Retry-After'], pinged
+
+    statuses, retry_after, pinged = asyncio.run(run())
+    assert statuses == [200, 429] and retry_after == '60'
+    assert pinged == [200, 200]
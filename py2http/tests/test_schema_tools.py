@@ -0,0 +1,151 @@
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+import json
+from time import perf_counter
+from typing import Any, List, Literal, NamedTuple, Optional, Union
+
+from py2http.coercion import mk_decoder, mk_encoder
+from py2http.schema_tools import mk_input_schema_from_func, mk_schema_from_type
+from py2http.service import mk_app, mk_routes_and_openapi_specs
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+@dataclass
+class LineItem:
+    sku: str
+    quantity: int
+    price: float
+
+
+@dataclass
+class Order:
+    id: int
+    created: datetime
+    items: List[LineItem]
+    status: Literal['open', 'closed'] = 'open'
+    note: Optional[str] = None
+
+
+class Point(NamedTuple):
+    x: float
+    y: float = 0.0
+
+
+@dataclass
+class Tree:
+    value: int
+    children: List['Tree'] = field(default_factory=list)
+
+
+def mk_records(n_records):
+    return [
+        {
+            'id': i,
+            'created': datetime(2020, 1, 1 + i % 28).isoformat(),
+            'items': [
+                {'sku': f'sku-{j}', 'quantity': j, 'price': 1.5 * j} for j in range(3)
+            ],
+            'status': 'closed' if i % 2 else 'open',
+            'note': None,
+        }
+        for i in range(n_records)
+    ]
+
+
+def test_model_schemas():
+    schema = mk_schema_from_type(Order)
+    assert schema['required'] == ['id', 'created', 'items']
+    assert schema['properties']['items']['items']['properties']['price'] == {
+        'type': float
+    }
+    assert schema['properties']['status'] == {
+        'type': str,
+        'enum': ['open', 'closed'],
+        'default': 'open',
+    }
+    assert schema['properties']['note'] == {
+        'type': str,
+        'nullable': True,
+        'default': None,
+    }
+    assert mk_schema_from_type(Point)['required'] == ['x']
+    assert mk_schema_from_type(Union[int, str]) == {
+        'type': Any,
+        'anyOf': [{'type': int}, {'type': str}],
+    }
+    # where a model recurses, it's described as a plain object
+    children = mk_schema_from_type(Tree)['properties']['children']
+    assert children == {'type': list, 'items': {'type': dict}}
+
+    def place_order(order: Order, at: Point = None):
+        ...
+
+    input_schema = mk_input_schema_from_func(place_order)
+    assert input_schema['properties']['order'] == schema
+    assert input_schema['required'] == ['order']
+
+
+def test_recursive_model_codecs():
+    decode, encode = mk_decoder(Tree), mk_encoder(Tree)
+    tree = decode({'value': 1, 'children': [{'value': 2}, {'value': 3}]})
+    assert tree == Tree(1, [Tree(2), Tree(3)])
+    assert encode(tree) == asdict(tree)
+
+
+def test_model_routes():
+    def add_item(order: Order, item: LineItem) -> Order:
+        assert isinstance(order.created, datetime)
+        order.items.append(item)
+        return order
+
+    def midpoint(a: Point, b: Point) -> Point:
+        return Point((a.x + b.x) / 2, (a.y + b.y) / 2)
+
+    app = mk_app([add_item, midpoint], coerce_inputs=True, coerce_outputs=True)
+    order = mk_records(1)[0]
+    item = {'sku': 'new', 'quantity': 1, 'price': 2.0}
+    status, _, body = call_wsgi_app(app, '/add_item', {'order': order, 'item': item})
+    assert status.startswith('200')
+    assert json.loads(body) == dict(order, items=order['items'] + [item])
+
+    status, _, body = call_wsgi_app(app, '/midpoint', {'a': [0, 0], 'b': {'x': 2}})
+    assert status.startswith('200') and json.loads(body) == {'x': 1.0, 'y': 0.0}
+
+    status, _, body = call_wsgi_app(
+        app, '/add_item', {'order': dict(order, status='lost'), 'item': item}
+    )
+    assert status.startswith('400')
+
+    _, openapi_spec = mk_routes_and_openapi_specs([add_item])
+    operation = openapi_spec['paths']['/add_item']['post']
+    response = operation['responses']['200']['content']['application/json']
+    assert response['schema']['properties']['status'] == {
+        'type': 'string',
+        'enum': ['open', 'closed'],
+        'default': 'open',
+    }
+
+
+def test_codecs_of_10k_nested_records(n_records=10_000):
+    """Compiled codecs vs reflection (dataclasses.asdict)"""
+    records = mk_records(n_records)
+    decode, encode = mk_decoder(List[Order]), mk_encoder(List[Order])
+
+    tic = perf_counter()
+    orders = decode(records)
+    decode_time = perf_counter() - tic
+    tic = perf_counter()
+    encoded = encode(orders)
+    encode_time = perf_counter() - tic
+    tic = perf_counter()
+    [asdict(order) for order in orders]
+    asdict_time = perf_counter() - tic
+
+    print(
+        f'\n{n_records} records: decode: {decode_time:.3f}s, encode: {encode_time:.3f}s'
+        f' (dataclasses.asdict: {asdict_time:.3f}s)'
+    )
+    assert isinstance(orders[0], Order) and isinstance(orders[0].items[0], LineItem)
+    assert isinstance(orders[0].created, datetime)
+    assert encoded == records
+    assert encode_time < 3 * asdict_time  # (a generous bound: timings are noisy)
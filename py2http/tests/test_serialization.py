@@ -0,0 +1,140 @@
+from datetime import date
+from io import BytesIO
+import json
+
+import pytest
+
+from py2http.constants import CBOR_CONTENT_TYPE, MSGPACK_CONTENT_TYPE
+from py2http.default_configs import (
+    cbor_input_mapper,
+    cbor_output_mapper,
+    msgpack_input_mapper,
+    msgpack_output_mapper,
+)
+from py2http.service import mk_app, mk_routes_and_openapi_specs
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+
+def scale(values: list, factor: float = 2.0) -> list:
+    return [x * factor for x in values]
+
+
+def today() -> date:
+    return date(2020, 1, 2)
+
+
+formats = [
+    ('msgpack', MSGPACK_CONTENT_TYPE, msgpack_input_mapper, msgpack_output_mapper),
+    ('cbor2', CBOR_CONTENT_TYPE, cbor_input_mapper, cbor_output_mapper),
+]
+
+
+@pytest.mark.parametrize(
+    'module_name, content_type, input_mapper, output_mapper', formats
+)
+def test_binary_structured_content_types(
+    module_name, content_type, input_mapper, output_mapper
+):
+    module = pytest.importorskip(module_name)
+    dumps = getattr(module, 'packb', None) or module.dumps
+    loads = getattr(module, 'unpackb', None) or module.loads
+
+    app = mk_app([scale, today], input_mapper=input_mapper, output_mapper=output_mapper)
+    values = list(range(1000))
+    payload = dumps({'values': values, 'factor': 0.5})
+    assert len(payload) < len(json.dumps({'values': values, 'factor': 0.5}))
+
+    status, headers, body = call_wsgi_app(
+        app, '/scale', body=payload, headers={'Content-Type': content_type}
+    )
+    assert status.startswith('200') and headers['Content-Type'] == content_type
+    assert loads(body) == [x * 0.5 for x in values]
+
+    # Values that are not native to the format are encoded with py2http.coercion codecs
+    status, _, body = call_wsgi_app(
+        app, '/today', body=dumps({}), headers={'Content-Type': content_type}
+    )
+    assert loads(body) in ('2020-01-02', date(2020, 1, 2))
+
+    # The same routes serve JSON clients
+    status, headers, body = call_wsgi_app(
+        app, '/scale', {'values': [1, 2]}, headers={'Accept': 'application/json'}
+    )
+    assert status.startswith('200')
+    assert headers['Content-Type'].startswith('application/json')
+    assert json.loads(body) == [2.0, 4.0]
+    # ... including those excluding the format
+    _, headers, _ = call_wsgi_app(
+        app, '/scale', {'values': [1]}, headers={'Accept': f'{content_type};q=0, */*'}
+    )
+    assert headers['Content-Type'].startswith('application/json')
+
+    _, openapi_spec = mk_routes_and_openapi_specs(
+        [scale], input_mapper=input_mapper, output_mapper=output_mapper
+    )
+    operation = openapi_spec['paths']['/scale']['post']
+    request_content = operation['requestBody']['content']
+    assert list(request_content) == [content_type, 'application/json']
+    assert request_content[content_type]['schema']['properties']['factor'] == {
+        'type': 'number',
+        'format': 'float',
+        'default': 2.0,
+    }
+    assert list(operation['responses']['200']['content']) == [
+        content_type,
+        'application/json',
+    ]
+
+
+def test_content_negotiation():
+    msgpack = pytest.importorskip('msgpack')
+    numpy = pytest.importorskip('numpy')
+    content_types = ['application/json', 'application/msgpack', 'application/x-npy']
+    app = mk_app([scale], content_types=content_types)
+
+    def call(body, content_type='application/json', accept=None):
+        headers = {'Content-Type': content_type}
+        if accept:
+            headers['Accept'] = accept
+        return call_wsgi_app(app, '/scale', body=body, headers=headers)
+
+    json_body = json.dumps({'values': [1, 2]}).encode()
+    msgpack_body = msgpack.packb({'values': [1, 2]})
+
+    # JSON in, JSON out (the first content type is the default)
+    status, headers, body = call(json_body)
+    assert headers['Content-Type'] == 'application/json'
+    assert json.loads(body) == [2.0, 4.0]
+    # msgpack in, msgpack out
+    status, headers, body = call(
+        msgpack_body, 'application/msgpack', 'application/msgpack'
+    )
+    assert headers['Content-Type'] == 'application/msgpack'
+    assert msgpack.unpackb(body) == [2.0, 4.0]
+    # msgpack in, preferred (q-value) format out
+    status, headers, body = call(
+        msgpack_body, 'application/msgpack', 'application/json;q=0.5, application/x-npy'
+    )
+    assert headers['Content-Type'] == 'application/x-npy'
+    assert numpy.load(BytesIO(body)).tolist() == [2.0, 4.0]
+
+    status, _, _ = call(b'<values/>', 'application/xml')
+    assert status.startswith('415')
+    status, _, _ = call(json_body, accept='text/html')
+    assert status.startswith('406')
+    status, _, _ = call(json_body, accept='*/*, application/*;q=0')
+    assert status.startswith('406')
+    # malformed bodies, and bodies that are not objects, are input errors
+    for body, content_type in [
+        (b'{not json', 'application/json'),
+        (b'\xc1', 'application/msgpack'),
+        (b'[1, 2]', 'application/json'),
+        (msgpack.packb(3), 'application/msgpack'),
+    ]:
+        status, _, body = call(body, content_type)
+        assert status.startswith('400'), body
+
+    _, openapi_spec = mk_routes_and_openapi_specs([scale], content_types=content_types)
+    operation = openapi_spec['paths']['/scale']['post']
+    assert list(operation['requestBody']['content']) == content_types[:2]
+    assert list(operation['responses']['200']['content']) == content_types
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+import json
+from time import perf_counter
+
+import bottle
+import pytest
+
+from py2http.service import run_app
+from py2http.util import ServerProcess
+
+
+def ping(x: int = 0):
+    return x
+
+
+def _serve_ping(port, server_options):
+    run_app([ping], port=port, server_options=server_options)
+
+
+def test_run_app_passes_the_server_options(monkeypatch):
+    given = {}
+
+    class RecordingServer(bottle.ServerAdapter):
+        def run(self, handler):
+            given.update(self.options)
+
+    monkeypatch.setitem(bottle.server_names, 'gunicorn', RecordingServer)
+    options = {'threads': 4, 'keep_alive': 5, 'read_timeout': 30, 'preload_app': True}
+    run_app(lambda: None, server_options=options)
+    assert given == {
+        'certfile': None,
+        'keyfile': None,
+        'threads': 4,
+        'keepalive': 5,
+        'timeout': 30,
+        'preload_app': True,
+    }
+    with pytest.warns(UserWarning, match='no max_request_size option'):
+        run_app(lambda: None, server_options={'max_request_size': 1024})
+
+
+def _requests_per_second(port, keep_alive, n_clients=4, n_requests=300):
+    body = json.dumps({'x': 1})
+
+    def client(_):
+        connection = HTTPConnection('localhost', port)
+        for _ in range(n_requests):
+            headers = {'Content-Type': 'application/json'}
+            if not keep_alive:
+                headers['Connection'] = 'close'
+            connection.request('POST', '/ping', body, headers)
+            connection.getresponse().read()
+            if not keep_alive:
+                connection.close()
+        connection.close()
+
+    tic = perf_counter()
+    with ThreadPoolExecutor(n_clients) as pool:
+        list(pool.map(client, range(n_clients)))
+    return n_clients * n_requests / (perf_counter() - tic)
+
+
+def test_server_options_speed():
+    """How keep-alive and threads change the throughput of small requests"""
+    pytest.importorskip('gunicorn')
+    for options in (
+        {'threads': 1},  # (a sync worker: connections are closed after each request)
+        {'threads': 4, 'keep_alive': 0},
+        {'threads': 4, 'keep_alive': 5},
+    ):
+        with ServerProcess(
+            _serve_ping, server_options=options, ready_timeout=20, capture_output=True
+        ) as server:
+            keep_alive = options.get('keep_alive', 0) > 0
+            rps = _requests_per_second(server.port, keep_alive)
+            print(f'\n{options}: {rps:.0f} requests/s')
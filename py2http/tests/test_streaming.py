@@ -0,0 +1,110 @@
+import asyncio
+import json
+from threading import Event
+import time
+
+import pytest
+
+from py2http.service import mk_app
+from py2http.streaming import CancelToken
+from py2http.tests.utils_for_testing import call_wsgi_app
+
+events = {}
+
+
+def count(n: int, delay: float = 0):
+    """Count to n, slowly"""
+    try:
+        for i in range(n):
+            time.sleep(delay)
+            yield {'i': i}
+        if n < 0:
+            raise ValueError('n must be positive')
+    finally:
+        events['count closed'].set()
+
+
+async def acount(n: int, cancel: CancelToken = None):
+    try:
+        for i in range(n):
+            yield i
+            await asyncio.sleep(0.01)
+    except asyncio.CancelledError:
+        events['acount cancelled'].set()
+        raise
+
+
+def parse_events(body):
+    return [
+        dict(line.split(': ', 1) for line in event.splitlines())
+        for event in body.decode().strip().split('\n\n')
+    ]
+
+
+def test_sse_routes():
+    events['count closed'] = Event()
+    app = mk_app([count], streaming={'count': 'sse'}, sse_heartbeat=0.05)
+
+    status, headers, body = call_wsgi_app(app, '/count', {'n': 2})
+    assert status.startswith('200')
+    assert headers['Content-Type'].startswith('text/event-stream')
+    assert parse_events(body) == [
+        {'data': '{"i": 0}'},
+        {'data': '{"i": 1}'},
+        {'event': 'end', 'data': 'null'},
+    ]
+    assert events['count closed'].is_set()
+
+    # errors end the stream with an error event
+    _, _, body = call_wsgi_app(app, '/count', {'n': -1})
+    assert parse_events(body) == [
+        {'event': 'error', 'data': '{"error": "n must be positive"}'}
+    ]
+
+    # heartbeats are sent while the function works
+    _, _, body = call_wsgi_app(app, '/count', {'n': 1, 'delay': 0.12})
+    assert body.startswith(b': heartbeat\n\n: heartbeat\n\ndata: {"i": 0}')
+
+    operation = app.openapi_spec['paths']['/count']['post']
+    assert operation['x-streaming'] == {'protocol': 'sse', 'heartbeat': 0.05}
+    assert 'text/event-stream' in operation['responses']['200']['content']
+
+
+def test_streamed_functions_run_inline():
+    for executor in ('thread', 'process'):
+        with pytest.raises(ValueError, match='executor must be inline'):
+            mk_app([count], streaming='sse', executor=executor)
+
+
+def test_sse_streams_are_cancelled_when_clients_are_gone():
+    events['count closed'] = Event()
+    events['acount cancelled'] = Event()
+    app = mk_app([count, acount], streaming='sse')
+    schema = app.openapi_spec['paths']['/acount']['post']['requestBody']['content']
+    assert list(schema['application/json']['schema']['properties']) == ['n']
+
+    _, _, chunks = call_wsgi_app(app, '/count', {'n': 1000, 'delay': 0.01}, stream=True)
+    assert next(iter(chunks)) == b'data: {"i": 0}\n\n'
+    chunks.close()  # what servers do when the client is gone
+    assert events['count closed'].wait(1)  # (GeneratorExit, in count)
+
+    _, _, chunks = call_wsgi_app(app, '/acount', {'n': 1000}, stream=True)
+    assert next(iter(chunks)) == b'data: 0\n\n'
+    chunks.close()
+    assert events['acount cancelled'].wait(1)
+
+
+def test_open_streams_hold_their_concurrency_slot():
+    events['count closed'] = Event()
+    app = mk_app([count], streaming='sse', max_concurrency=1)
+    limiter = app.limiters['count']
+
+    _, _, chunks = call_wsgi_app(app, '/count', {'n': 1000, 'delay': 0.01}, stream=True)
+    assert next(iter(chunks)) == b'data: {"i": 0}\n\n'
+    status, _, _ = call_wsgi_app(app, '/count', {'n': 1})
+    assert status.startswith('503')  # (the first stream is still open)
+    chunks.close()
+    assert limiter.stats()['in_flight'] == 0
+    status, _, body = call_wsgi_app(app, '/count', {'n': 1})
+    assert status.startswith('200') and parse_events(body)[-1]['event'] == 'end'
+    assert limiter.stats()['in_flight'] == 0
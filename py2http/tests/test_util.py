@@ -0,0 +1,14 @@
+import pytest
+
+from py2http.util import CreateProcess
+
+
+def test_processes_exiting_before_being_ready_fail_fast():
+    process = CreateProcess(
+        print, args=('bye',), is_ready=lambda: False, ready_timeout=60
+    )
+    # (not after ready_timeout, with a "not ready" error)
+    with pytest.raises(RuntimeError, match=r'exited before being ready \(exit code: 0'):
+        with process:
+            pass
+    assert not process.process_is_running()
@@ -24,3 +24,45 @@ def run_server(launcher, wait_before_entering=0, verbose=False, **kwargs):
             clog(f'Terminating server...')
             server.terminate()
         clog(f'... server terminated')
+
+
+def call_wsgi_app(
+    app, path, json_body=None, *, method='POST', headers=None, body=None, stream=False
+):
+    """Call a WSGI app (e.g. a Bottle app made by ``mk_app``) in-process, without
+    running a server.
+
+    :return: A ``(status, headers, body)`` triple (``body`` being bytes, or, with
+        ``stream=True``, the iterable of chunks the app returned, not consumed yet)
+    """
+    import io
+    import json
+    from wsgiref.util import setup_testing_defaults
+
+    if body is None:
+        body = json.dumps(json_body).encode() if json_body is not None else b''
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update(
+        REQUEST_METHOD=method,
+        PATH_INFO=path,
+        CONTENT_TYPE='application/json',
+        CONTENT_LENGTH=str(len(body)),
+    )
+    environ['wsgi.input'] = io.BytesIO(body)
+    for name, value in (headers or {}).items():
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        environ[key] = value
+
+    response = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response.update(status=status, headers=dict(response_headers))
+
+    chunks = app(environ, start_response)
+    if stream:
+        return response['status'], response['headers'], chunks
+    body = b''.join(c if isinstance(c, bytes) else c.encode() for c in chunks)
+    return response['status'], response['headers'], body
@@ -2,7 +2,7 @@
 
 The `lazyprop` descriptor is used to define properties that are computed once and then cached until the instance of the class is destroyed. It is useful for computing properties on-demand but only once.
 
-The `CreateProcess` context manager is used to launch a parallel process and close it on exit. This is helpful when you need to execute tasks concurrently in a separate process. 
+The `CreateProcess` context manager is used to launch a parallel process and close it on exit. This is helpful when you need to execute tasks concurrently in a separate process. Its `ServerProcess` and `ServerPool` specializations launch servers on free ports and wait for them to actually be ready (instead of sleeping a fixed amount of time).
 
 The `ModuleFoundIgnore` context manager allows you to ignore `ModuleNotFoundError` exceptions in a block of code. This can be useful when importing optional modules that may or may not exist.
 
@@ -10,16 +10,20 @@ The `TypeAsserter` function generates a callable that asserts the expected type
 
 Overall, this module provides a collection of useful tools for handling lazy property loading, parallel processing, exception handling, type validation, and more."""
 from typing import Optional, Callable, Union, Iterable, Any
+from collections import OrderedDict
 from inspect import Parameter, signature
 from multiprocessing.context import Process
 from multiprocessing import Queue, active_children
 from time import sleep, time
-from functools import wraps, partial
+from functools import lru_cache, wraps, partial
 from warnings import warn, simplefilter
-from contextlib import contextmanager
-from strand import run_process
+from contextlib import contextmanager, closing
+from threading import Lock
+from tempfile import mkdtemp
+import os
+import socket
+import sys
 
-from glom import Spec  # NOTE: Third-party
 
 
 class lazyprop:
@@ -80,19 +84,40 @@ def if_not_empty(obj, if_empty_val=None):
 
 none_if_not_empty = partial(if_not_empty, if_not_empty=None)
 
-func_info_spec = Spec(
-    {
-        'name': '__name__',
-        'qualname': '__qualname__',
-        'module': '__module__',
-        'return_annotation': (signature, 'return_annotation', none_if_not_empty,),
-        'params': (signature, 'parameters'),
-    }
-)
+
+@lru_cache(maxsize=None)
+def _func_info_spec():
+    from glom import Spec  # NOTE: Third-party
+
+    return Spec(
+        {
+            'name': '__name__',
+            'qualname': '__qualname__',
+            'module': '__module__',
+            'return_annotation': (
+                signature,
+                'return_annotation',
+                none_if_not_empty,
+            ),
+            'params': (signature, 'parameters'),
+        }
+    )
 
 
 def py_obj_info(obj):
-    return func_info_spec.glom(obj)
+    return _func_info_spec().glom(obj)
+
+
+def __getattr__(name):
+    # Made (and their third-party packages imported) on first use, to keep the import
+    # of py2http fast
+    if name == 'func_info_spec':
+        return _func_info_spec()
+    if name == 'run_process':
+        from strand import run_process
+
+        return run_process
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def conditional_logger(verbose=False, log_func=print):
@@ -106,6 +131,52 @@ def conditional_logger(verbose=False, log_func=print):
         return clog
 
 
+def find_free_port(host='localhost') -> int:
+    """Get a port that is free on ``host``, by asking the OS for an ephemeral one.
+
+    >>> port = find_free_port()
+    >>> isinstance(port, int) and 0 < port < 65536
+    True
+    """
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def port_is_open(port: int, host='localhost', timeout=0.1) -> bool:
+    """Check if something accepts TCP connections on ``host:port``.
+
+    >>> port_is_open(find_free_port())
+    False
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def url_is_responsive(url: str, timeout=0.5) -> bool:
+    """Check if a GET on ``url`` answers with a non-error status"""
+    from urllib.request import urlopen
+
+    try:
+        with urlopen(url, timeout=timeout) as resp:
+            return resp.status < 400
+    except (OSError, ValueError):
+        return False
+
+
+def _run_with_output_capture(proc_func, stdout_path, stderr_path, args, kwargs):
+    """Target of processes launched with ``capture_output=True``: Redirects the
+    standard streams of the process to files before calling ``proc_func``."""
+    with open(stdout_path, 'w', buffering=1) as out, open(
+        stderr_path, 'w', buffering=1
+    ) as err:
+        sys.stdout, sys.stderr = out, err
+        return proc_func(*args, **kwargs)
+
+
 class CreateProcess:
     """A context manager to launch a parallel process and close it on exit."""
 
@@ -116,6 +187,12 @@ class CreateProcess:
         wait_before_entering=2,
         verbose=False,
         args=(),
+        *,
+        is_ready: Optional[Callable[[], bool]] = None,
+        ready_timeout=10,
+        poll_interval=0.05,
+        shutdown_timeout=5,
+        capture_output=False,
         **kwargs,
     ):
         """
@@ -128,9 +205,19 @@ class CreateProcess:
         :param proc_func: A function that will be launched in the process
         :param process_name: The name of the process.
         :param wait_before_entering: A pause (in seconds) before returning from the enter phase.
-            (in case the outside should wait before assuming everything is ready)
+            (in case the outside should wait before assuming everything is ready).
+            Only used if no ``is_ready`` is given.
         :param verbose: If True, will print some info on the starting/stoping of the process
         :param args: args that will be given as arguments to the proc_func call
+        :param is_ready: A readiness probe: Argument-less callable that returns True when
+            the process is ready to be used (see ``port_is_open`` and ``url_is_responsive``)
+        :param ready_timeout: Maximum time (in seconds) to wait for ``is_ready``
+        :param poll_interval: Time (in seconds) between two ``is_ready`` calls
+        :param shutdown_timeout: Time (in seconds) given to the process to terminate
+            before it's killed
+        :param capture_output: If True, the stdout and stderr of the process are
+            collected, and available through the ``stdout`` and ``stderr`` attributes
+            after exit
         :param kwargs: The kwargs that will be given as arguments to the proc_func call
 
         The following should print 'Hello console!' in the console.
@@ -140,6 +227,15 @@ class CreateProcess:
         ... print process started.
         -------> Hello module!
         ... print process terminated
+
+        With ``capture_output=True``, we can get what the process printed instead.
+
+        >>> with CreateProcess(
+        ...     print, args=('Hello process!',), is_ready=lambda: True, capture_output=True
+        ... ) as p:
+        ...     p.process.join()
+        >>> p.stdout
+        'Hello process!\\n'
         """
         self.proc_func = proc_func
         self.process_name = process_name or getattr(proc_func, '__name__', '')
@@ -147,45 +243,297 @@ class CreateProcess:
         self.verbose = verbose
         self.args = args
         self.kwargs = kwargs
+        self.is_ready = is_ready
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.capture_output = capture_output
         self.clog = conditional_logger(verbose)
         self.process = None
         self.exception_info = None
+        self.stdout = None
+        self.stderr = None
+        self._output_dir = None
 
     def process_is_running(self):
         return self.process is not None and self.process.is_alive()
 
-    def __enter__(self):
-        self.process = Process(
-            target=self.proc_func,
-            args=self.args,
-            kwargs=self.kwargs,
+    def _mk_process(self):
+        if not self.capture_output:
+            return Process(
+                target=self.proc_func,
+                args=self.args,
+                kwargs=self.kwargs,
+                name=self.process_name,
+            )
+        self._output_dir = mkdtemp(prefix='py2http_')
+        return Process(
+            target=_run_with_output_capture,
+            args=(
+                self.proc_func,
+                os.path.join(self._output_dir, 'stdout'),
+                os.path.join(self._output_dir, 'stderr'),
+                self.args,
+                self.kwargs,
+            ),
             name=self.process_name,
         )
+
+    def start(self):
+        """Start the process without waiting for it to be ready"""
+        self.process = self._mk_process()
         self.clog(f'Starting process: {self.process_name}...')
         try:
             self.process.start()
-            if self.process_is_running():
-                self.clog(f'... {self.process_name} process started.')
-                sleep(self.wait_before_entering)
-                return self
-            else:
-                raise RuntimeError('Process is not running')
         except Exception:
             raise RuntimeError(
                 f'Something went wrong when trying to launch process {self.process_name}'
             )
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self
+
+    def ready(self) -> bool:
+        """Non-blocking readiness check"""
+        if self.is_ready is None:
+            return self.process_is_running()
+        return self.is_ready()
+
+    def wait_until_ready(self):
+        """Block until the process is ready, raising a ``RuntimeError`` if it dies or
+        doesn't get ready within ``ready_timeout`` seconds"""
+        if self.is_ready is None:
+            if not self.process_is_running():
+                raise RuntimeError('Process is not running')
+            sleep(self.wait_before_entering)
+        else:
+            deadline = time() + self.ready_timeout
+            while not self.is_ready():
+                if not self.process_is_running():  # (even if it exited cleanly)
+                    raise RuntimeError(
+                        f'Process {self.process_name} exited before being ready '
+                        f'(exit code: {self.process.exitcode})'
+                    )
+                if time() > deadline:
+                    raise RuntimeError(
+                        f'Process {self.process_name} not ready after '
+                        f'{self.ready_timeout} seconds'
+                    )
+                sleep(self.poll_interval)
+        self.clog(f'... {self.process_name} process started.')
+        return self
+
+    def stop(self):
+        """Terminate the process, killing it if it didn't exit within
+        ``shutdown_timeout`` seconds, and collect its output if captured"""
         if self.process is not None and self.process.is_alive():
             self.clog(f'Terminating process: {self.process_name}...')
             self.process.terminate()
+            self.process.join(self.shutdown_timeout)
+            if self.process.is_alive():
+                self.clog(f'Killing process: {self.process_name}...')
+                self.process.kill()
+                self.process.join()
         self.clog(f'... {self.process_name} process terminated')
+        if self._output_dir is not None:
+            self.stdout = _read_and_remove(os.path.join(self._output_dir, 'stdout'))
+            self.stderr = _read_and_remove(os.path.join(self._output_dir, 'stderr'))
+            os.rmdir(self._output_dir)
+            self._output_dir = None
+
+    def __enter__(self):
+        self.start()
+        try:
+            return self.wait_until_ready()
+        except RuntimeError:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
         if exc_type is not None:
             self.exception_info = dict(
                 exc_type=exc_type, exc_val=exc_val, exc_tb=exc_tb
             )
 
 
+def _read_and_remove(filepath):
+    if not os.path.isfile(filepath):
+        return ''
+    with open(filepath) as fp:
+        contents = fp.read()
+    os.remove(filepath)
+    return contents
+
+
+class ServerProcess(CreateProcess):
+    """A ``CreateProcess`` dedicated to launching servers: The server is launched on
+    a given (or free, ephemeral) port, and the context is only entered once the server
+    accepts connections (or answers to ``/ping``, with ``is_ready='ping'``).
+
+    :param proc_func: A function launching a server. Will be called with the port
+        as a ``port_kwarg`` keyword argument (e.g. ``run_app(funcs, port=port)``)
+    :param port: The port to serve on. If not given, a free port is used.
+    :param host: The host to serve on
+    :param is_ready: ``'port'`` (wait for the port to accept connections), ``'ping'``
+        (wait for ``GET /ping`` to answer) or a custom readiness callable
+    :param port_kwarg: The name of the ``proc_func`` argument to specify the port
+    :param kwargs: Other ``CreateProcess`` arguments and ``proc_func`` kwargs
+
+    >>> from http.server import HTTPServer, SimpleHTTPRequestHandler
+    >>> def serve(port):
+    ...     HTTPServer(('localhost', port), SimpleHTTPRequestHandler).serve_forever()
+    >>> with ServerProcess(serve) as server:
+    ...     assert port_is_open(server.port)
+    >>> server.process.is_alive()
+    False
+    """
+
+    def __init__(
+        self,
+        proc_func: Callable,
+        *,
+        port: Optional[int] = None,
+        host='localhost',
+        is_ready: Union[str, Callable[[], bool]] = 'port',
+        port_kwarg='port',
+        **kwargs,
+    ):
+        self.host = host
+        self.port = port or find_free_port(host)
+        if port_kwarg:
+            kwargs[port_kwarg] = self.port
+        if is_ready == 'port':
+            is_ready = partial(port_is_open, self.port, host)
+        elif is_ready == 'ping':
+            is_ready = partial(url_is_responsive, f'{self.url}/ping')
+        super().__init__(proc_func, is_ready=is_ready, **kwargs)
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+
+class ServerPool:
+    """A context manager launching several servers in parallel (on different free
+    ports), entering once all of them are ready, and shutting them all down on exit.
+
+    :param proc_func: A function launching a server (see ``ServerProcess``)
+    :param n_servers: The number of servers to launch
+    :param server_kwargs: ``ServerProcess`` arguments common to all servers
+
+    >>> from http.server import HTTPServer, SimpleHTTPRequestHandler
+    >>> def serve(port):
+    ...     HTTPServer(('localhost', port), SimpleHTTPRequestHandler).serve_forever()
+    >>> with ServerPool(serve, n_servers=3) as pool:
+    ...     assert len(set(pool.ports)) == 3
+    ...     assert all(map(port_is_open, pool.ports))
+    """
+
+    def __init__(self, proc_func: Callable, n_servers=2, **server_kwargs):
+        self.servers = [
+            ServerProcess(proc_func, **server_kwargs) for _ in range(n_servers)
+        ]
+
+    @property
+    def ports(self):
+        return [server.port for server in self.servers]
+
+    @property
+    def urls(self):
+        return [server.url for server in self.servers]
+
+    def __iter__(self):
+        return iter(self.servers)
+
+    def __enter__(self):
+        try:
+            for server in self.servers:
+                server.start()
+            # all servers are starting at this point, so waiting is done in parallel
+            for server in self.servers:
+                server.wait_until_ready()
+        except RuntimeError:
+            self.stop()
+            raise
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            if server.process_is_running():
+                server.process.terminate()
+        for server in self.servers:
+            server.stop()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class TTLCache:
+    """A bounded (least recently used items are evicted first) mapping whose items
+    expire after ``ttl`` seconds, or at the time given when setting them, if sooner.
+    Thread-safe.
+
+    >>> clock = iter([0, 0, 0, 5, 11, 11]).__next__
+    >>> cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2, expires_at=4)
+    >>> cache.get('a'), cache.get('b'), cache.get('a')
+    (1, None, None)
+
+    When full, the least recently used item is evicted:
+
+    >>> cache = TTLCache(maxsize=2, ttl=10)
+    >>> cache.set('a', 1); cache.set('b', 2); _ = cache.get('a'); cache.set('c', 3)
+    >>> cache.get('a'), cache.get('b'), cache.get('c'), len(cache)
+    (1, None, 3, 2)
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, *, timer=time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        item = self._items.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if self._timer() >= expires_at:
+            with self._lock:
+                self._items.pop(key, None)
+            return default
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value, expires_at: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        ttl_expiry = self._timer() + self.ttl
+        expires_at = ttl_expiry if expires_at is None else min(expires_at, ttl_expiry)
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+        if item is None or self._timer() >= item[0]:
+            return default
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
 def deprecate(func=None, *, msg=None):
     """Decorator to emit a DeprecationWarning when the decorated function is called."""
     if func is None: